@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, g
+from flask import Flask, Response, render_template, request, g, stream_with_context
 from flask.json import jsonify
 from flasgger import Swagger, swag_from
 import pandas as pd
@@ -7,8 +7,15 @@ from datetime import datetime, timedelta
 from flask_cors import CORS  # Importe Flask-Cors
 import src.manager as Manager
 import src.database as Database
+import src.fila as Fila
+import src.migracoes as Migracoes
+import src.conexoes as Conexoes
+import src.colunar as colunar
+import src.repositories.TarefaRepository as TarefaRepository
 
+import logging
 import sqlite3
+import json
 
 
 DATABASE = "src/data/data.db"
@@ -38,20 +45,42 @@ swagger = Swagger(
 
 
 def get_db():
-    """Obtém uma conexão com o banco de dados para a requisição atual"""
+    """Obtém uma conexão do pool de escrita para a requisição atual"""
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        db = g._database = Conexoes.obter(DATABASE)
     return db
 
 
+def get_db_leitura():
+    """Obtém uma conexão somente leitura do pool para a requisição atual (rotas GET)"""
+    db = getattr(g, "_database_leitura", None)
+    if db is None:
+        db = g._database_leitura = Conexoes.obter(DATABASE, somente_leitura=True)
+    return db
+
+
+@app.before_request
+def aplicar_migracoes():
+    """Aplica as migrações pendentes do esquema no primeiro request do processo"""
+    Migracoes.migrar(DATABASE)
+
+
+@app.before_request
+def garantir_worker_fila():
+    """Inicia a thread da fila de previsões no primeiro request do processo"""
+    Fila.iniciar_worker(DATABASE)
+
+
 @app.teardown_appcontext
 def close_connection(exception):
-    """Fecha a conexão com o banco ao final da requisição"""
+    """Devolve as conexões da requisição ao pool"""
     db = getattr(g, "_database", None)
     if db is not None:
-        db.close()
+        Conexoes.devolver(db, DATABASE)
+    db = getattr(g, "_database_leitura", None)
+    if db is not None:
+        Conexoes.devolver(db, DATABASE, somente_leitura=True)
 
 
 @app.route("/")
@@ -75,6 +104,7 @@ def index():
                             "estoque_total": 2850.75,
                             "lotes_proximo_vencimento": 3,
                             "alertas_ativos": 2,
+                            "perdas_periodo": 42.3,
                         },
                         "detalhes": {
                             "top_produtos": [
@@ -118,6 +148,10 @@ def index():
                                     "produtos": 4,
                                 },
                             ],
+                            "perdas_por_dia": [
+                                {"dia": "2023-07-15", "quantidade": 12.4, "lotes": 1},
+                                {"dia": "2023-07-16", "quantidade": 29.9, "lotes": 2},
+                            ],
                         },
                         "alertas": [
                             {
@@ -144,7 +178,7 @@ def index():
     }
 )
 def resumo_sistema():
-    db_conn = get_db()
+    db_conn = get_db_leitura()
     data = Manager.obter_metricas_dashboard(db_conn)
     return jsonify(data), 200
 
@@ -286,7 +320,7 @@ def retirar_por_sku(produto_sku):
                             "lotes_por_status": {
                                 "disponivel": 5,
                                 "sobra": 2,
-                                "vencido": 1,
+                                "perda": 1,
                             },
                         },
                     }
@@ -297,7 +331,7 @@ def retirar_por_sku(produto_sku):
     }
 )
 def obter_lotes(produto_sku):
-    db_conn = get_db()
+    db_conn = get_db_leitura()
     resultado = Manager.obter_lotes(db_conn, produto_sku)
 
     if not resultado["lotes"]:
@@ -332,8 +366,8 @@ def obter_lotes(produto_sku):
     }
 )
 def criar_banco():
-    db_conn = get_db()
-    Database.criar_banco_e_tabelas(db_conn)
+    # criar_banco_e_tabelas fecha a conexão recebida, então ela não vem do pool
+    Database.criar_banco_e_tabelas(Conexoes.conectar(DATABASE))
     return jsonify({"message": "Banco de dados criado com sucesso."}), 201
 
 
@@ -341,19 +375,207 @@ def criar_banco():
 @swag_from(
     {
         "tags": ["Previsão"],
-        "description": "Executa rotina de previsão de demanda",
+        "description": "Enfileira a rotina de previsão de demanda e retorna imediatamente. "
+        "Se já houver uma previsão pendente ou em execução, retorna a mesma tarefa.",
         "responses": {
-            201: {
-                "description": "Previsão realizada com sucesso",
-                "examples": {"application/json": {"message": "Previsão feita"}},
+            202: {
+                "description": "Previsão enfileirada",
+                "examples": {
+                    "application/json": {
+                        "message": "Previsão enfileirada",
+                        "tarefa_id": 12,
+                        "nova": True,
+                        "status_url": "/api/prever/12",
+                    }
+                },
             }
         },
     }
 )
 def prever_rota():
     db_conn = get_db()
-    Manager.realizar_previsao(db_conn)
-    return jsonify({"message": "Previsão feita"}), 201
+    tarefa_id, nova = Fila.enfileirar_previsao(db_conn)
+    return (
+        jsonify(
+            {
+                "message": "Previsão enfileirada" if nova else "Previsão já em andamento",
+                "tarefa_id": tarefa_id,
+                "nova": nova,
+                "status_url": f"/api/prever/{tarefa_id}",
+            }
+        ),
+        202,
+    )
+
+
+@app.route("/api/prever/<int:tarefa_id>", methods=["GET"])
+@swag_from(
+    {
+        "tags": ["Previsão"],
+        "description": "Status e progresso de uma tarefa de previsão",
+        "parameters": [
+            {
+                "name": "tarefa_id",
+                "in": "path",
+                "type": "integer",
+                "required": True,
+                "description": "Id retornado por POST /api/prever",
+            }
+        ],
+        "responses": {
+            200: {
+                "description": "Status da tarefa",
+                "examples": {
+                    "application/json": {
+                        "id": 12,
+                        "status": "executando",
+                        "skus_total": 1000,
+                        "skus_concluidos": 250,
+                        "falhas": ["237511"],
+                        "eta_segundos": 90.5,
+                        "criado_em": "2023-07-16T15:00:00",
+                        "iniciado_em": "2023-07-16T15:00:01",
+                        "finalizado_em": None,
+                        "erro": None,
+                    }
+                },
+            },
+            404: {"description": "Tarefa não encontrada"},
+        },
+    }
+)
+def status_previsao_rota(tarefa_id: int):
+    tarefa = TarefaRepository.buscar_tarefa(get_db_leitura(), tarefa_id)
+    if tarefa is None:
+        return jsonify({"error": "Tarefa não encontrada", "tarefa_id": tarefa_id}), 404
+    return jsonify(tarefa), 200
+
+
+@app.route("/api/prever/<int:tarefa_id>/cancelar", methods=["POST"])
+@swag_from(
+    {
+        "tags": ["Previsão"],
+        "description": "Cancela uma tarefa de previsão pendente ou em execução",
+        "parameters": [
+            {
+                "name": "tarefa_id",
+                "in": "path",
+                "type": "integer",
+                "required": True,
+                "description": "Id retornado por POST /api/prever",
+            }
+        ],
+        "responses": {
+            200: {
+                "description": "Cancelamento registrado",
+                "examples": {
+                    "application/json": {"tarefa_id": 12, "status": "executando"}
+                },
+            },
+            404: {"description": "Tarefa não encontrada"},
+        },
+    }
+)
+def cancelar_previsao_rota(tarefa_id: int):
+    status = TarefaRepository.solicitar_cancelamento(get_db(), tarefa_id)
+    if status is None:
+        return jsonify({"error": "Tarefa não encontrada", "tarefa_id": tarefa_id}), 404
+    return jsonify({"tarefa_id": tarefa_id, "status": status}), 200
+
+
+@app.route("/api/prever/reajustes", methods=["GET"])
+@swag_from(
+    {
+        "tags": ["Previsão"],
+        "description": "Mostra, por SKU, se a próxima rodada de previsão reajustaria o modelo e por quê (sem_ajuste, historico_alterado, horizonte, idade, erro, em_dia ou sem_vendas)",
+        "responses": {
+            200: {
+                "description": "Decisões de reajuste",
+                "examples": {
+                    "application/json": {
+                        "skus_total": 2,
+                        "skus_reajustar": 1,
+                        "decisoes": [
+                            {
+                                "sku": "237478",
+                                "reajustar": True,
+                                "motivo": "erro",
+                                "erro": 0.3127,
+                                "dias_avaliados": 7,
+                                "dias_sem_ajuste": 2,
+                                "ultima_venda": "2023-07-16",
+                                "data_ajuste": "2023-07-14T02:00:00",
+                                "horizonte_fim": "2023-07-14",
+                            },
+                            {
+                                "sku": "237479",
+                                "reajustar": False,
+                                "motivo": "em_dia",
+                                "erro": 0.0812,
+                                "dias_avaliados": 7,
+                                "dias_sem_ajuste": 2,
+                                "ultima_venda": "2023-07-16",
+                                "data_ajuste": "2023-07-14T02:00:00",
+                                "horizonte_fim": "2023-07-14",
+                            },
+                        ],
+                    }
+                },
+            }
+        },
+    }
+)
+def decisoes_reajuste_rota():
+    return jsonify(Manager.obter_decisoes_reajuste(get_db_leitura())), 200
+
+
+@app.route("/api/prever/execucoes", methods=["GET"])
+@swag_from(
+    {
+        "tags": ["Previsão"],
+        "description": "Lista as últimas rodadas de previsão com parâmetros, tempos por etapa e acurácia (MAE/WAPE) contra as vendas já registradas",
+        "parameters": [
+            {
+                "name": "limite",
+                "in": "query",
+                "type": "integer",
+                "required": False,
+                "default": 20,
+                "description": "Quantidade de rodadas retornadas (mais recentes primeiro).",
+            }
+        ],
+        "responses": {
+            200: {
+                "description": "Rodadas de previsão",
+                "examples": {
+                    "application/json": [
+                        {
+                            "id": 7,
+                            "motor": "prophet",
+                            "status": "concluida",
+                            "iniciado_em": "2023-07-16T02:00:00",
+                            "finalizado_em": "2023-07-16T02:03:10",
+                            "etapas": {"selecao": 0.02, "vetorizado": 0.0, "prophet": 185.4, "gravacao": 0.3},
+                            "skus_total": 10,
+                            "skus_previstos": 3,
+                            "skus_falha": 0,
+                            "linhas_alteradas": 21,
+                            "dias_avaliados": 21,
+                            "mae": 4.2,
+                            "wape": 0.07,
+                        }
+                    ]
+                },
+            }
+        },
+    }
+)
+def execucoes_previsao_rota():
+    try:
+        limite = int(request.args.get("limite", "20"))
+    except ValueError:
+        return jsonify({"error": "limite deve ser um número inteiro."}), 400
+    return jsonify(Manager.obter_execucoes_previsao(get_db_leitura(), limite)), 200
 
 
 @app.route("/api/registrar-venda/<string:produto_sku>", methods=["POST"])
@@ -456,11 +678,31 @@ def registrar_venda_rota(produto_sku: str):
                 "in": "formData",
                 "type": "file",
                 "required": True,
-                "description": "Arquivo CSV ou Excel com dados históricos de vendas.",
-            }
+                "description": "Arquivo CSV, Parquet (.parquet) ou Arrow IPC (.arrow/.feather) com dados históricos de vendas. Parquet e Arrow requerem o pyarrow.",
+            },
+            {
+                "name": "stream",
+                "in": "query",
+                "type": "boolean",
+                "required": False,
+                "description": "Se verdadeiro, devolve o progresso de cada lote gravado em NDJSON (uma linha JSON por lote).",
+            },
         ],
         "responses": {
-            200: {"description": "Dados históricos de vendas importados com sucesso."},
+            200: {
+                "description": "Dados históricos de vendas importados com sucesso.",
+                "examples": {
+                    "application/json": {
+                        "message": "Dados históricos de vendas importados com sucesso.",
+                        "lote": 3,
+                        "linhas_lidas": 120000,
+                        "vendas_gravadas": 119850,
+                        "vendas_rejeitadas": 150,
+                        "segundos": 2.41,
+                        "linhas_por_segundo": 49792.5,
+                    }
+                },
+            },
             400: {"description": "Nenhum arquivo enviado ou formato inválido."},
         },
     }
@@ -475,35 +717,64 @@ def upload_historico_vendas():
         return jsonify({"error": "Nome do arquivo vazio."}), 400
 
     if file:
-        file_content = file.read().decode("utf-8")  # Read file content and decode
-
-        conn = None
+        # O arquivo é lido em lotes direto do stream do upload, sem carregar tudo em memória
+        conn = get_db()
+        extensao = Path(file.filename).suffix.lower()
+        formato = colunar.FORMATOS.get(extensao, "csv")
+        lotes = Manager.importar_historico_vendas_em_lotes(conn, file.stream, formato=formato)
         try:
-            conn = get_db()
-            # Assuming Manager.importar_historico_vendas_do_string_csv expects a string
-            Manager.importar_historico_vendas_do_string_csv(conn, file_content)
+            # O primeiro lote é gravado antes da resposta para que erros de formato virem 400
+            progresso = next(lotes, {})
+        except (ValueError, ImportError) as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            logging.exception("Falha ao importar dados históricos de vendas")
             return (
                 jsonify(
-                    {"message": "Dados históricos de vendas importados com sucesso."}
+                    {
+                        "error": "Falha ao importar dados históricos de vendas",
+                        "details": str(e),
+                    }
                 ),
-                200,
+                500,
             )
+
+        if request.args.get("stream", "false").lower() in ("1", "true", "sim"):
+
+            def gerar_progresso():
+                yield json.dumps(progresso) + "\n"
+                try:
+                    for atual in lotes:
+                        yield json.dumps(atual) + "\n"
+                except Exception as e:
+                    logging.exception("Falha ao importar dados históricos de vendas")
+                    yield json.dumps({"error": "Falha ao importar dados históricos de vendas", "details": str(e)}) + "\n"
+
+            return Response(stream_with_context(gerar_progresso()), mimetype="application/x-ndjson")
+
+        try:
+            for progresso in lotes:
+                pass
         except ValueError as e:
-            return jsonify({"error": str(e)}), 400
+            return jsonify({"error": str(e), **progresso}), 400
         except Exception as e:
-            print(f"Failed to import historical sales data: {e}")
+            logging.exception("Falha ao importar dados históricos de vendas")
             return (
                 jsonify(
                     {
                         "error": "Falha ao importar dados históricos de vendas",
                         "details": str(e),
+                        **progresso,
                     }
                 ),
                 500,
             )
-        finally:
-            if conn:
-                conn.close()
+        return (
+            jsonify(
+                {"message": "Dados históricos de vendas importados com sucesso.", **progresso}
+            ),
+            200,
+        )
     else:
         return jsonify({"error": "Erro no upload do arquivo."}), 500
 
@@ -541,7 +812,7 @@ def upload_historico_vendas():
     }
 )
 def obter_relatorio_diario_rota():
-    db_conn = get_db()
+    db_conn = get_db_leitura()
     data_str = request.args.get("data")
     data_relatorio = datetime.now().date()
     if data_str:
@@ -585,7 +856,7 @@ def obter_relatorio_diario_rota():
     }
 )
 def obter_metricas_previsao_rota():
-    db_conn = get_db()
+    db_conn = get_db_leitura()
     dias_comparacao_str = request.args.get("dias_comparacao", "30")
     try:
         dias_comparacao = int(dias_comparacao_str)
@@ -0,0 +1,458 @@
+"""
+Backtesting com origem móvel (rolling origin) para os motores de previsão.
+
+Cada fold tem um corte no calendário (último dia de treino), comum a todos os
+SKUs: o motor treina com o histórico até o corte, prevê o horizonte seguinte
+e as previsões são comparadas com as vendas reais. Grava precisão (MAPE,
+RMSE, viés) e custo (tempo de ajuste, tempo de previsão, pico de memória)
+por SKU e fold na tabela backtest_resultado.
+
+Os motores rodam como em produção: o Prophet por SKU, com _ajustar_modelo,
+os hiperparâmetros vencedores do SKU e a previsão de reserva quando o ajuste
+falha; o vetorizado com todos os SKUs do fold numa única passada (o tempo
+gravado por SKU é o tempo da passada dividido pelos SKUs).
+
+Com CONFIG["processo_por_fold"], cada tarefa (um SKU/fold do Prophet ou um
+fold do vetorizado) roda num processo novo, e o pico de memória é o maior RSS
+durante a tarefa (do processo ou do cmdstan). Sem ele, as tarefas rodam no
+processo atual e o pico de memória não é medido.
+
+Uso:
+    python -m src.backtest executar --motores prophet vetorizado --folds 4
+    python -m src.backtest listar
+    python -m src.backtest comparar <execucao_base> <execucao_nova>
+"""
+import argparse
+import copy
+import json
+import logging
+import multiprocessing
+import sqlite3
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src import calendario
+import src.previsao as previsao
+from src.repositories import HiperparametroRepository
+
+try:
+    import resource
+except ImportError:  # Windows não possui o módulo resource
+    resource = None
+
+DATABASE = "src/data/data.db"
+
+CONFIG: Dict[str, Any] = {
+    "folds": 4,
+    "horizonte": 7,
+    "passo": 7,  # dias entre origens consecutivas
+    "min_treino": 28,  # dias com venda mínimos antes do corte para o SKU entrar no fold
+    "workers": 1,
+    "processo_por_fold": True,  # mede a memória de cada tarefa num processo novo
+    "limite_regressao": 0.2,  # aumento relativo de tempo que conta como regressão
+}
+
+MOTORES = ("prophet", "vetorizado")
+
+
+def criar_tabelas(conn: sqlite3.Connection):
+    """Cria as tabelas de resultados do backtest, se ainda não existirem."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS backtest_execucao (
+            id TEXT PRIMARY KEY,
+            motores TEXT NOT NULL,
+            parametros TEXT NOT NULL,
+            criado_em TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS backtest_resultado (
+            execucao_id TEXT NOT NULL,
+            motor TEXT NOT NULL,
+            produto_sku TEXT NOT NULL,
+            fold INTEGER NOT NULL,
+            corte DATE NOT NULL,
+            dias_avaliados INTEGER NOT NULL,
+            mape FLOAT,
+            rmse FLOAT,
+            vies FLOAT,
+            tempo_ajuste FLOAT NOT NULL,
+            tempo_previsao FLOAT NOT NULL,
+            pico_rss_kb INTEGER,
+            PRIMARY KEY (execucao_id, motor, produto_sku, fold),
+            FOREIGN KEY (execucao_id) REFERENCES backtest_execucao(id)
+        )
+        """
+    )
+    conn.commit()
+
+
+def gerar_cortes(data_max: pd.Timestamp, folds: int, horizonte: int, passo: int) -> List[pd.Timestamp]:
+    """
+    Último dia de treino de cada fold, do mais recente para o mais antigo.
+    O fold avalia os `horizonte` dias seguintes ao corte.
+    """
+    return [data_max - pd.Timedelta(days=horizonte + fold * passo) for fold in range(folds)]
+
+
+def _motor_prophet(treino: pd.DataFrame, horizonte: int,
+                   parametros: Optional[Dict[str, Any]] = None) -> Tuple[pd.DataFrame, float, float]:
+    """Ajuste e previsão de um SKU pelo mesmo caminho de previsao.treinar_e_prever, sem o cache de modelos."""
+    df_prophet = treino.rename(columns={'data_dia': 'ds', 'total_venda_dia_kg': 'y'})
+
+    inicio = time.perf_counter()
+    feriados_df = calendario.feriados_dos_anos(df_prophet['ds'].dt.year.unique(), previsao.CONFIG["regiao"])
+    model = previsao._criar_modelo(feriados_df, **{**previsao.PARAMETROS_PADRAO, **(parametros or {})})
+    try:
+        previsao._ajustar_modelo(model, df_prophet)
+    except (TimeoutError, previsao.AjusteNaoConvergiu) as e:
+        logging.warning(f"Ajuste sem sucesso no backtest ({type(e).__name__}: {e}); usando previsão de reserva")
+        model = None
+    meio = time.perf_counter()
+    previsoes = previsao.prever_com_modelo(model, df_prophet, horizonte)
+    fim = time.perf_counter()
+
+    return previsoes[['ds', 'yhat']], meio - inicio, fim - meio
+
+
+def _pico_rss_kb(recurso: int) -> int:
+    pico = resource.getrusage(recurso).ru_maxrss
+    return pico // 1024 if sys.platform == "darwin" else pico  # macOS informa em bytes
+
+
+def _zerar_pico_memoria():
+    """No Linux, reinicia o VmHWM do processo para o RSS atual (sem efeito nos demais sistemas)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as arquivo:
+            arquivo.write("5")
+    except OSError:
+        pass
+
+
+def _pico_memoria_kb() -> int:
+    """
+    VmHWM do processo. O ru_maxrss não serve no processo novo: no Linux ele
+    herda o pico do processo pai no fork e não pode ser zerado.
+    """
+    try:
+        with open("/proc/self/status") as arquivo:
+            for linha in arquivo:
+                if linha.startswith("VmHWM:"):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return _pico_rss_kb(resource.RUSAGE_SELF)
+
+
+def calcular_metricas(real: np.ndarray, previsto: np.ndarray) -> Dict[str, Optional[float]]:
+    """MAPE (%) ignorando dias com venda zero, RMSE e viés (previsto - real)."""
+    if len(real) == 0:
+        return {"mape": None, "rmse": None, "vies": None}
+    erro = previsto - real
+    nao_zero = real != 0
+    mape = float(np.mean(np.abs(erro[nao_zero] / real[nao_zero])) * 100) if nao_zero.any() else None
+    return {
+        "mape": mape,
+        "rmse": float(np.sqrt(np.mean(erro ** 2))),
+        "vies": float(np.mean(erro)),
+    }
+
+
+def _resultado(motor: str, sku: str, fold: int, corte: pd.Timestamp, real: np.ndarray, previsto: np.ndarray,
+               tempo_ajuste: float, tempo_previsao: float) -> Dict[str, Any]:
+    return {
+        "motor": motor, "produto_sku": sku, "fold": fold, "corte": str(corte.date()),
+        **calcular_metricas(real, previsto),
+        "dias_avaliados": len(real),
+        "tempo_ajuste": tempo_ajuste,
+        "tempo_previsao": tempo_previsao,
+        "pico_rss_kb": None,
+    }
+
+
+def avaliar_prophet(sku: str, fold: int, corte: pd.Timestamp, treino: pd.DataFrame, teste: pd.DataFrame,
+                    horizonte: int, parametros: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Um SKU em um fold com o Prophet."""
+    previsoes, tempo_ajuste, tempo_previsao = _motor_prophet(treino, horizonte, parametros)
+    comparacao = teste.merge(previsoes, left_on='data_dia', right_on='ds', how='inner')
+    return [_resultado(
+        "prophet", sku, fold, corte,
+        comparacao['total_venda_dia_kg'].to_numpy(dtype=np.float64),
+        comparacao['yhat'].to_numpy(dtype=np.float64),
+        tempo_ajuste, tempo_previsao,
+    )]
+
+
+def avaliar_vetorizado(skus: List[str], fold: int, corte: pd.Timestamp, treino: np.ndarray,
+                       datas_treino: pd.DatetimeIndex, real: np.ndarray, horizonte: int) -> List[Dict[str, Any]]:
+    """Todos os SKUs de um fold numa única passada do motor vetorizado."""
+    inicio = time.perf_counter()
+    # O motor vetorizado ajusta e prevê na mesma passada; o tempo todo conta como ajuste
+    _, yhat = previsao.previsao_vetorizada(treino, datas_treino, horizonte)
+    tempo_por_sku = (time.perf_counter() - inicio) / len(skus)
+
+    resultados = []
+    for i, sku in enumerate(skus):
+        vendidos = ~np.isnan(real[i])
+        resultados.append(_resultado(
+            "vetorizado", sku, fold, corte, real[i, vendidos], yhat[i, :real.shape[1]][vendidos],
+            tempo_por_sku, 0.0,
+        ))
+    return resultados
+
+
+def _executar_tarefa(tarefa: Callable[..., List[Dict[str, Any]]], argumentos: tuple,
+                     medir_memoria: bool) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Executa uma tarefa do backtest. Com medir_memoria (processo novo por
+    tarefa), grava em pico_rss_kb o maior RSS durante a tarefa, do próprio
+    processo ou de um subprocesso (cmdstan).
+    """
+    try:
+        if medir_memoria:
+            _zerar_pico_memoria()
+        linhas = tarefa(*argumentos)
+    except Exception as e:
+        return [], f"{type(e).__name__}: {e}"
+
+    if medir_memoria:
+        pico = max(_pico_memoria_kb(), _pico_rss_kb(resource.RUSAGE_CHILDREN))
+        for linha in linhas:
+            linha["pico_rss_kb"] = pico
+    return linhas, None
+
+
+def _serie_da_linha(datas: pd.DatetimeIndex, linha: np.ndarray) -> pd.DataFrame:
+    vendidos = ~np.isnan(linha)
+    return pd.DataFrame({'data_dia': datas[vendidos], 'total_venda_dia_kg': linha[vendidos]})
+
+
+def gerar_tarefas(skus: List[str], datas: pd.DatetimeIndex, matriz: np.ndarray, motores: List[str],
+                  folds: int, horizonte: int, passo: int, min_treino: int,
+                  parametros_por_sku: Dict[str, Dict[str, Any]]) -> Iterator[Tuple[str, Callable, tuple]]:
+    """(descrição, função, argumentos) de cada tarefa: um SKU/fold do Prophet ou um fold do vetorizado."""
+    for fold, corte in enumerate(gerar_cortes(datas[-1], folds, horizonte, passo)):
+        coluna = datas.get_loc(corte) + 1 if corte >= datas[0] else 0
+        if coluna == 0:
+            break
+        treino, real = matriz[:, :coluna], matriz[:, coluna:coluna + horizonte]
+        elegiveis = np.flatnonzero(np.sum(~np.isnan(treino), axis=1) >= min_treino)
+        if len(elegiveis) == 0:
+            break
+
+        if "vetorizado" in motores:
+            yield (
+                f"vetorizado fold={fold}", avaliar_vetorizado,
+                ([skus[i] for i in elegiveis], fold, corte, treino[elegiveis], datas[:coluna],
+                 real[elegiveis], horizonte),
+            )
+        if "prophet" in motores:
+            for i in elegiveis:
+                yield (
+                    f"prophet SKU={skus[i]} fold={fold}", avaliar_prophet,
+                    (skus[i], fold, corte, _serie_da_linha(datas[:coluna], treino[i]),
+                     _serie_da_linha(datas[coluna:coluna + horizonte], real[i]), horizonte,
+                     parametros_por_sku.get(skus[i])),
+                )
+
+
+def executar_backtest(conn: sqlite3.Connection, motores: List[str], execucao_id: Optional[str] = None,
+                      skus: Optional[List[str]] = None, workers: Optional[int] = None,
+                      **parametros) -> str:
+    """
+    Roda o backtest de todos os SKUs (ou dos informados) para os motores pedidos,
+    em paralelo quando workers > 1, e grava os resultados. Retorna o id da execução.
+    """
+    for motor in motores:
+        if motor not in MOTORES:
+            raise ValueError(f"Motor desconhecido: {motor}. Disponíveis: {sorted(MOTORES)}")
+
+    parametros = {
+        "folds": parametros.get("folds", CONFIG["folds"]),
+        "horizonte": parametros.get("horizonte", CONFIG["horizonte"]),
+        "passo": parametros.get("passo", CONFIG["passo"]),
+        "min_treino": parametros.get("min_treino", CONFIG["min_treino"]),
+        "processo_por_fold": parametros.get("processo_por_fold", CONFIG["processo_por_fold"]),
+    }
+    processo_por_fold = parametros["processo_por_fold"] and resource is not None
+    workers = workers or CONFIG["workers"]
+    # Sufixo aleatório: execuções iniciadas no mesmo segundo não colidem na chave
+    execucao_id = execucao_id or f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+    criar_tabelas(conn)
+    conn.execute(
+        "INSERT INTO backtest_execucao (id, motores, parametros, criado_em) VALUES (?, ?, ?, ?)",
+        (execucao_id, ",".join(motores), json.dumps({**parametros, "motores": motores, "workers": workers}),
+         datetime.now().isoformat()),
+    )
+    conn.commit()
+
+    if skus is None:
+        skus = [row[0] for row in conn.execute("SELECT DISTINCT produto_sku FROM venda ORDER BY produto_sku")]
+    skus_matriz, datas, matriz = previsao.carregar_matriz_vendas(conn, skus)
+    parametros_por_sku = {}
+    if "prophet" in motores and previsao.CONFIG["hiperparametros_por_sku"]:
+        parametros_por_sku = HiperparametroRepository.buscar_vencedores(conn)
+
+    tarefas = []
+    if skus_matriz:
+        tarefas = gerar_tarefas(
+            skus_matriz, datas, matriz, motores, parametros["folds"], parametros["horizonte"],
+            parametros["passo"], parametros["min_treino"], parametros_por_sku,
+        )
+
+    resultados: List[Dict[str, Any]] = []
+    if processo_por_fold or workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=previsao._inicializar_worker,
+            initargs=(copy.deepcopy(previsao.CONFIG),),
+            max_tasks_per_child=1 if processo_por_fold else None,
+        ) as executor:
+            futuros = {
+                executor.submit(_executar_tarefa, tarefa, argumentos, processo_por_fold): descricao
+                for descricao, tarefa, argumentos in tarefas
+            }
+            for futuro in as_completed(futuros):
+                try:
+                    linhas, erro = futuro.result()
+                except BrokenProcessPool as e:
+                    linhas, erro = [], f"processo encerrado ({e})"
+                if erro is not None:
+                    logging.error(f"Backtest falhou para {futuros[futuro]}: {erro}")
+                resultados.extend(linhas)
+    else:
+        for descricao, tarefa, argumentos in tarefas:
+            linhas, erro = _executar_tarefa(tarefa, argumentos, False)
+            if erro is not None:
+                logging.error(f"Backtest falhou para {descricao}: {erro}")
+            resultados.extend(linhas)
+
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO backtest_resultado (
+                execucao_id, motor, produto_sku, fold, corte, dias_avaliados,
+                mape, rmse, vies, tempo_ajuste, tempo_previsao, pico_rss_kb
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (execucao_id, r["motor"], r["produto_sku"], r["fold"], r["corte"], r["dias_avaliados"],
+                 r["mape"], r["rmse"], r["vies"], r["tempo_ajuste"], r["tempo_previsao"], r["pico_rss_kb"])
+                for r in resultados
+            ],
+        )
+    logging.info(f"Backtest {execucao_id} concluído: {len(resultados)} resultados (SKU × fold × motor)")
+    return execucao_id
+
+
+def resumir_execucao(conn: sqlite3.Connection, execucao_id: str) -> pd.DataFrame:
+    """Resumo por motor: precisão média e custo (média e p95 de tempo, pico de memória)."""
+    df = pd.read_sql_query(
+        "SELECT * FROM backtest_resultado WHERE execucao_id = ?", conn, params=(execucao_id,)
+    )
+    if df.empty:
+        return df
+
+    return df.groupby('motor').agg(
+        skus=('produto_sku', 'nunique'),
+        folds=('fold', 'count'),
+        mape=('mape', 'mean'),
+        rmse=('rmse', 'mean'),
+        vies=('vies', 'mean'),
+        ajuste_medio_s=('tempo_ajuste', 'mean'),
+        ajuste_p95_s=('tempo_ajuste', lambda x: x.quantile(0.95)),
+        previsao_media_s=('tempo_previsao', 'mean'),
+        pico_rss_mb=('pico_rss_kb', lambda x: x.max() / 1024),
+    )
+
+
+def comparar_execucoes(conn: sqlite3.Connection, base: str, nova: str,
+                       limite_regressao: Optional[float] = None) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Compara duas execuções por motor. Retorna a tabela lado a lado e a lista de
+    regressões de velocidade (tempo médio de ajuste ou previsão acima do limite).
+    """
+    limite = CONFIG["limite_regressao"] if limite_regressao is None else limite_regressao
+    resumo_base = resumir_execucao(conn, base)
+    resumo_nova = resumir_execucao(conn, nova)
+    tabela = resumo_base.join(resumo_nova, lsuffix='_base', rsuffix='_nova', how='outer')
+
+    regressoes = []
+    for motor in resumo_base.index.intersection(resumo_nova.index):
+        for coluna in ("ajuste_medio_s", "previsao_media_s"):
+            antes, depois = resumo_base.at[motor, coluna], resumo_nova.at[motor, coluna]
+            if antes > 0 and depois > antes * (1 + limite):
+                regressoes.append(f"{motor}: {coluna} {antes:.3f}s -> {depois:.3f}s")
+    return tabela, regressoes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Backtest dos motores de previsão")
+    parser.add_argument("--banco", default=DATABASE, help="caminho do banco SQLite")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    executar = sub.add_parser("executar", help="roda um backtest e grava os resultados")
+    executar.add_argument("--motores", nargs="+", default=list(MOTORES), choices=MOTORES)
+    executar.add_argument("--execucao", help="id da execução (padrão: data/hora)")
+    executar.add_argument("--skus", nargs="*", help="limita o backtest a estes SKUs")
+    executar.add_argument("--folds", type=int, default=CONFIG["folds"])
+    executar.add_argument("--horizonte", type=int, default=CONFIG["horizonte"])
+    executar.add_argument("--passo", type=int, default=CONFIG["passo"])
+    executar.add_argument("--workers", type=int, default=CONFIG["workers"])
+    executar.add_argument("--processo-por-fold", action=argparse.BooleanOptionalAction,
+                          default=CONFIG["processo_por_fold"],
+                          help="roda cada tarefa num processo novo para medir o pico de memória")
+
+    sub.add_parser("listar", help="lista as execuções gravadas")
+
+    comparar = sub.add_parser("comparar", help="compara duas execuções")
+    comparar.add_argument("base")
+    comparar.add_argument("nova")
+    comparar.add_argument("--limite-regressao", type=float, default=CONFIG["limite_regressao"])
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(args.banco)
+    criar_tabelas(conn)
+
+    try:
+        if args.comando == "executar":
+            execucao_id = executar_backtest(
+                conn, args.motores, args.execucao, args.skus, args.workers,
+                folds=args.folds, horizonte=args.horizonte, passo=args.passo,
+                processo_por_fold=args.processo_por_fold,
+            )
+            print(f"Execução: {execucao_id}")
+            print(resumir_execucao(conn, execucao_id).to_string(float_format="%.3f"))
+        elif args.comando == "listar":
+            execucoes = pd.read_sql_query(
+                "SELECT id, motores, parametros, criado_em FROM backtest_execucao ORDER BY criado_em", conn
+            )
+            print(execucoes.to_string(index=False))
+        elif args.comando == "comparar":
+            tabela, regressoes = comparar_execucoes(conn, args.base, args.nova, args.limite_regressao)
+            print(tabela.T.to_string(float_format="%.3f"))
+            if regressoes:
+                print("\nRegressões de velocidade:")
+                for regressao in regressoes:
+                    print(f"  - {regressao}")
+                return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import functools
+import hashlib
+from typing import Optional, Tuple
+
+import holidays
+import numpy as np
+import pandas as pd
+
+# Dias são representados como inteiros (dias desde 1970-01-01), que era uma quinta-feira
+DIA_DA_SEMANA_EPOCA = 3
+
+# Cache por processo: os mesmos feriados e termos de calendário servem para
+# todos os SKUs, motores e backtests. Os objetos retornados são compartilhados
+# e não devem ser modificados (os arrays são somente leitura).
+
+
+@functools.lru_cache(maxsize=64)
+def feriados(anos: Tuple[int, ...], regiao: Optional[str] = None) -> pd.DataFrame:
+    """
+    Feriados nacionais (ou do estado informado em regiao, ex.: 'SP') no formato
+    de holidays do Prophet: holiday, ds, lower_window, upper_window.
+    """
+    calendario = holidays.Brazil(years=list(anos), subdiv=regiao)
+    return pd.DataFrame({
+        'holiday': 'feriado',
+        'ds': pd.to_datetime(sorted(calendario.keys())),
+        'lower_window': 0,
+        'upper_window': 1,
+    })
+
+
+def feriados_dos_anos(anos, regiao: Optional[str] = None) -> pd.DataFrame:
+    """Atalho de feriados() que aceita qualquer coleção de anos."""
+    return feriados(tuple(sorted({int(ano) for ano in anos})), regiao)
+
+
+@functools.lru_cache(maxsize=64)
+def _assinatura_feriados(anos: Tuple[int, ...], regiao: Optional[str]) -> str:
+    tabela = feriados(anos, regiao)
+    return hashlib.sha256(tabela.to_csv(index=False).encode()).hexdigest()
+
+
+def assinatura_feriados(anos, regiao: Optional[str] = None) -> str:
+    """sha256 dos feriados (datas e janelas) que feriados_dos_anos devolveria."""
+    return _assinatura_feriados(tuple(sorted({int(ano) for ano in anos})), regiao)
+
+
+def _somente_leitura(valores: np.ndarray) -> np.ndarray:
+    valores.setflags(write=False)
+    return valores
+
+
+@functools.lru_cache(maxsize=256)
+def dias_da_semana(inicio: int, fim: int) -> np.ndarray:
+    """Dia da semana (0 = segunda) de cada dia no intervalo [inicio, fim]."""
+    dias = np.arange(inicio, fim + 1, dtype=np.int64)
+    return _somente_leitura(((dias + DIA_DA_SEMANA_EPOCA) % 7).astype(np.int8))
+
+
+@functools.lru_cache(maxsize=256)
+def mascara_feriados(inicio: int, fim: int, regiao: Optional[str] = None) -> np.ndarray:
+    """Array booleano indicando quais dias do intervalo [inicio, fim] são feriados."""
+    anos = range(
+        pd.Timestamp(inicio, unit='D').year,
+        pd.Timestamp(fim, unit='D').year + 1,
+    )
+    datas = feriados(tuple(anos), regiao)['ds'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    dias = np.arange(inicio, fim + 1, dtype=np.int64)
+    return _somente_leitura(np.isin(dias, datas))
+
+
+def intervalo_em_dias(datas: pd.DatetimeIndex) -> Tuple[int, int]:
+    """Converte o primeiro e o último dia de um DatetimeIndex em dias inteiros."""
+    dias = datas.to_numpy(dtype='datetime64[D]').astype(np.int64)
+    return int(dias[0]), int(dias[-1])
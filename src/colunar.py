@@ -0,0 +1,234 @@
+"""
+Importação e exportação em formatos colunares: Parquet (.parquet) e Arrow
+IPC (.arrow, .feather).
+
+As colunas tipadas do arquivo são mapeadas direto no esquema do banco
+(datas como date32/timestamp, quantidades como float64, SKUs como texto),
+sem a inferência de datas e a conversão de texto do caminho CSV. Os
+arquivos são lidos e escritos em lotes de registros.
+
+O pyarrow é uma dependência opcional: pip install "zenith[parquet]".
+
+Uso:
+    python -m src.colunar importar vendas.parquet
+    python -m src.colunar exportar venda vendas.parquet
+"""
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import pandas as pd
+
+import src.previsao as previsao
+
+DATABASE = "src/data/data.db"
+
+CONFIG: Dict[str, Any] = {
+    "linhas_por_lote": 100_000,
+}
+
+FORMATOS = {".parquet": "parquet", ".pq": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+
+# Nomes do CSV de origem aceitos como sinônimos das colunas do banco
+SINONIMOS_VENDA = {
+    "data_dia": "data",
+    "id_produto": "produto_sku",
+    "total_venda_dia_kg": "quantidade",
+    "descricao_produto": "nome",
+    "Equipe responsável": "categoria",
+}
+COLUNAS_VENDA = ("data", "quantidade", "produto_sku", "nome", "categoria")
+
+# Tipos Arrow de cada coluna exportada (nome do construtor em pyarrow)
+ESQUEMAS_EXPORTACAO: Dict[str, List[tuple]] = {
+    "venda": [
+        ("data", "date32"), ("quantidade", "float64"), ("produto_sku", "string"),
+    ],
+    "previsao": [
+        ("data", "date32"), ("quantidade_prevista", "float64"), ("produto_sku", "string"),
+        ("metodo", "string"), ("yhat_lower", "float64"), ("yhat_upper", "float64"), ("execucao_id", "int64"),
+    ],
+    "lote": [
+        ("id", "int64"), ("quantidade_retirada", "float64"), ("quantidade_atual", "float64"),
+        ("idade", "int64"), ("status", "string"), ("data_retirado", "date32"), ("data_venda", "date32"),
+        ("data_expiracao", "date32"), ("produto_sku", "string"),
+    ],
+}
+
+
+def _pyarrow():
+    """Importa o pyarrow sob demanda, com uma mensagem clara quando ele não está instalado."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            'Importação/exportação em Parquet/Arrow requer o pyarrow. Instale com: pip install "zenith[parquet]"'
+        ) from e
+    return pyarrow
+
+
+def formato_do_arquivo(caminho: Union[str, Path]) -> str:
+    """'parquet' ou 'arrow' conforme a extensão do arquivo."""
+    sufixo = Path(caminho).suffix.lower()
+    if sufixo not in FORMATOS:
+        raise ValueError(f"Extensão não suportada: '{sufixo}'. Use uma de {sorted(FORMATOS)}")
+    return FORMATOS[sufixo]
+
+
+def _datas_iso(pa, coluna):
+    """Coluna Arrow de datas (date, timestamp ou texto ISO) como texto 'AAAA-MM-DD'."""
+    if pa.types.is_string(coluna.type) or pa.types.is_large_string(coluna.type):
+        coluna = coluna.cast(pa.timestamp("s"))
+    if pa.types.is_timestamp(coluna.type):
+        coluna = coluna.cast(pa.date32(), safe=False)
+    if not pa.types.is_date(coluna.type):
+        raise ValueError(f"Coluna 'data' com tipo {coluna.type}; esperado date, timestamp ou texto ISO")
+    return coluna.cast(pa.date32()).cast(pa.string())
+
+
+def _normalizar_vendas(pa, lote) -> pd.DataFrame:
+    """Lote Arrow de vendas -> DataFrame com as colunas de previsao.gravar_vendas."""
+    nomes = [SINONIMOS_VENDA.get(nome, nome) for nome in lote.schema.names]
+    colunas = dict(zip(nomes, lote.columns))
+    faltando = [coluna for coluna in COLUNAS_VENDA[:3] if coluna not in colunas]
+    if faltando:
+        raise ValueError(f"Arquivo sem as colunas necessárias: {faltando}. Encontrado: {lote.schema.names}")
+
+    vendas = pd.DataFrame({
+        "data": _datas_iso(pa, colunas["data"]).to_pandas(),
+        "quantidade": colunas["quantidade"].cast(pa.float64()).to_pandas(),
+        "produto_sku": colunas["produto_sku"].cast(pa.string()).to_pandas(),
+    })
+    for coluna in ("nome", "categoria"):
+        vendas[coluna] = colunas[coluna].cast(pa.string()).to_pandas() if coluna in colunas else None
+    return vendas
+
+
+def _colunas_de_venda(nomes: List[str]) -> List[str]:
+    """Colunas do arquivo que viram colunas de venda; as demais não são lidas."""
+    return [nome for nome in nomes if SINONIMOS_VENDA.get(nome, nome) in COLUNAS_VENDA]
+
+
+def ler_lotes_vendas(arquivo, formato: str = "parquet",
+                     linhas_por_lote: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Lê vendas de um arquivo Parquet ou Arrow IPC (caminho ou objeto de arquivo
+    binário) em lotes, já no formato do banco.
+    """
+    pa = _pyarrow()
+    linhas_por_lote = linhas_por_lote or CONFIG["linhas_por_lote"]
+    if formato == "parquet":
+        arquivo_parquet = pa.parquet.ParquetFile(arquivo)
+        colunas = _colunas_de_venda(arquivo_parquet.schema_arrow.names)
+        lotes = arquivo_parquet.iter_batches(batch_size=linhas_por_lote, columns=colunas)
+    elif formato == "arrow":
+        leitor = pa.ipc.open_file(arquivo)
+        colunas = _colunas_de_venda(leitor.schema.names)
+        lotes = (leitor.get_batch(i).select(colunas) for i in range(leitor.num_record_batches))
+    else:
+        raise ValueError(f"Formato desconhecido: {formato}")
+
+    for lote in lotes:
+        yield _normalizar_vendas(pa, lote)
+
+
+def importar_vendas(conn: sqlite3.Connection, caminho: Union[str, Path],
+                    linhas_por_lote: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Importa vendas de um arquivo Parquet/Arrow com a mesma semântica de
+    previsao.importar_vendas_csv (produtos novos são criados, vendas já
+    existentes são mantidas), uma transação por lote.
+    """
+    inicio = time.perf_counter()
+    total: Dict[str, Any] = {}
+    for vendas in ler_lotes_vendas(caminho, formato_do_arquivo(caminho), linhas_por_lote):
+        resumo = previsao.gravar_vendas(conn, vendas)
+        for chave in ("linhas_lidas", "duplicadas_no_arquivo", "vendas_inseridas", "vendas_ignoradas",
+                      "produtos_criados"):
+            total[chave] = total.get(chave, 0) + resumo[chave]
+
+    segundos = time.perf_counter() - inicio
+    total["segundos"] = round(segundos, 3)
+    total["linhas_por_segundo"] = round(total.get("linhas_lidas", 0) / segundos, 1) if segundos > 0 else None
+    logging.info(f"Importação de {caminho}: {total}")
+    return total
+
+
+def _coluna_arrow(pa, valores: tuple, tipo: str):
+    if tipo == "date32":
+        # Datas são gravadas como texto ISO no SQLite
+        return pa.array(valores, pa.string()).cast(pa.timestamp("s")).cast(pa.date32(), safe=False)
+    return pa.array(valores, getattr(pa, tipo)())
+
+
+def exportar_tabela(conn: sqlite3.Connection, tabela: str, caminho: Union[str, Path],
+                    linhas_por_lote: Optional[int] = None) -> int:
+    """
+    Exporta venda, previsao ou lote para Parquet/Arrow IPC com colunas
+    tipadas, lendo e escrevendo em lotes. Retorna a quantidade de linhas.
+    """
+    if tabela not in ESQUEMAS_EXPORTACAO:
+        raise ValueError(f"Tabela não exportável: {tabela}. Disponíveis: {list(ESQUEMAS_EXPORTACAO)}")
+    formato = formato_do_arquivo(caminho)
+    pa = _pyarrow()
+    linhas_por_lote = linhas_por_lote or CONFIG["linhas_por_lote"]
+
+    colunas = ESQUEMAS_EXPORTACAO[tabela]
+    esquema = pa.schema([(nome, getattr(pa, tipo)()) for nome, tipo in colunas])
+    # lote é gravado no formato compacto; a visão devolve datas ISO, kg e status por nome
+    origem = "lote_legivel" if tabela == "lote" else tabela
+    cursor = conn.execute(f"SELECT {', '.join(nome for nome, _ in colunas)} FROM {origem}")
+
+    if formato == "parquet":
+        escritor = pa.parquet.ParquetWriter(str(caminho), esquema)
+    else:
+        escritor = pa.ipc.new_file(str(caminho), esquema)
+    total = 0
+    with escritor:
+        while linhas := cursor.fetchmany(linhas_por_lote):
+            valores = list(zip(*linhas))
+            lote = pa.record_batch(
+                [_coluna_arrow(pa, valores[i], tipo) for i, (_, tipo) in enumerate(colunas)], schema=esquema
+            )
+            if formato == "parquet":
+                escritor.write_table(pa.Table.from_batches([lote]))
+            else:
+                escritor.write_batch(lote)
+            total += len(linhas)
+
+    logging.info(f"{total} linhas de {tabela} exportadas para {caminho}")
+    return total
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Importação e exportação em Parquet/Arrow")
+    parser.add_argument("--banco", default=DATABASE, help="caminho do banco SQLite")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    importar = sub.add_parser("importar", help="importa vendas de um arquivo .parquet/.arrow")
+    importar.add_argument("arquivo")
+
+    exportar = sub.add_parser("exportar", help="exporta uma tabela para .parquet/.arrow")
+    exportar.add_argument("tabela", choices=list(ESQUEMAS_EXPORTACAO))
+    exportar.add_argument("arquivo")
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(args.banco)
+    try:
+        if args.comando == "importar":
+            importar_vendas(conn, args.arquivo)
+        else:
+            exportar_tabela(conn, args.tabela, args.arquivo)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
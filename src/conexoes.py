@@ -0,0 +1,102 @@
+"""
+Pool de conexões SQLite por processo.
+
+As conexões são reaproveitadas entre requisições em vez de abertas e fechadas
+a cada uma. O banco usa WAL, então leitores não bloqueiam o escritor. Há um
+pool separado de conexões somente leitura (mode=ro + query_only) para as
+rotas GET. Cada conexão já sai configurada com os PRAGMAs de CONFIG e guarda
+um cache de instruções preparadas.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+CONFIG: Dict[str, Any] = {
+    "max_conexoes": 4,          # conexões de escrita mantidas no pool
+    "max_conexoes_leitura": 8,  # conexões somente leitura mantidas no pool
+    "instrucoes_em_cache": 256,  # cached_statements do sqlite3
+    "busy_timeout_ms": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size_kib": 64 * 1024,
+}
+
+_pools: Dict[Tuple[str, bool], queue.LifoQueue] = {}
+_trava = threading.Lock()
+
+
+def conectar(caminho_banco: Union[str, Path], somente_leitura: bool = False,
+             busy_timeout_ms: Optional[int] = None) -> sqlite3.Connection:
+    """Abre uma conexão configurada (WAL, synchronous=NORMAL, mmap, cache e busy_timeout)."""
+    busy_timeout_ms = busy_timeout_ms or CONFIG["busy_timeout_ms"]
+    caminho = str(Path(caminho_banco).resolve())
+    conn = sqlite3.connect(
+        f"file:{caminho}?mode=ro" if somente_leitura else caminho,
+        uri=somente_leitura,
+        timeout=busy_timeout_ms / 1000,
+        cached_statements=CONFIG["instrucoes_em_cache"],
+        check_same_thread=False,  # cada conexão é usada por uma requisição de cada vez
+    )
+    conn.row_factory = sqlite3.Row
+    if somente_leitura:
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    conn.execute(f"PRAGMA mmap_size = {int(CONFIG['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = -{int(CONFIG['cache_size_kib'])}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def _pool(caminho: str, somente_leitura: bool) -> queue.LifoQueue:
+    chave = (caminho, somente_leitura)
+    with _trava:
+        if chave not in _pools:
+            limite = CONFIG["max_conexoes_leitura"] if somente_leitura else CONFIG["max_conexoes"]
+            _pools[chave] = queue.LifoQueue(maxsize=limite)
+        return _pools[chave]
+
+
+def obter(caminho_banco: Union[str, Path], somente_leitura: bool = False) -> sqlite3.Connection:
+    """Conexão do pool, ou uma nova se o pool estiver vazio."""
+    caminho = str(Path(caminho_banco).resolve())
+    try:
+        return _pool(caminho, somente_leitura).get_nowait()
+    except queue.Empty:
+        return conectar(caminho, somente_leitura)
+
+
+def devolver(conn: sqlite3.Connection, caminho_banco: Union[str, Path], somente_leitura: bool = False):
+    """
+    Devolve a conexão ao pool. Transações deixadas abertas são desfeitas;
+    conexões já fechadas são descartadas e as excedentes, fechadas.
+    """
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.ProgrammingError:  # conexão fechada por quem a usou
+        return
+    try:
+        _pool(str(Path(caminho_banco).resolve()), somente_leitura).put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def fechar_todas():
+    """Fecha as conexões ociosas de todos os pools (ex.: ao encerrar o processo)."""
+    with _trava:
+        pools = list(_pools.values())
+        _pools.clear()
+    fechadas = 0
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+                fechadas += 1
+            except queue.Empty:
+                break
+    logging.info(f"{fechadas} conexões do pool fechadas")
@@ -2,6 +2,8 @@ import sqlite3
 import logging
 from pathlib import Path
 import src.previsao
+import src.migracoes as migracoes
+import src.repositories.LoteRepository as LoteRepository
 from datetime import datetime, timedelta
 import random
 
@@ -53,24 +55,11 @@ def criar_banco_e_tabelas(conn: sqlite3.Connection):
         produtos,
     )
 
-    # status: 'descongelando', 'disponivel', 'sobra', 'perda', 'vendido'
+    # status: 'descongelando', 'disponivel', 'sobra', 'perda', 'vendido' (códigos em LoteRepository.STATUS)
     # data_venda == data_disponivel
-    c.execute(
-        """ 
-        CREATE TABLE IF NOT EXISTS lote (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            quantidade_retirada FLOAT NOT NULL,
-            quantidade_atual FLOAT NOT NULL,
-            idade INTEGER NOT NULL,
-            status TEXT NOT NULL,
-            data_retirado DATE NOT NULL,
-            data_venda DATE NOT NULL,
-            data_expiracao DATE NOT NULL,
-            produto_sku TEXT NOT NULL,
-            FOREIGN KEY (produto_sku) REFERENCES produto(sku)
-        )
-    """
-    )
+    # Datas em dias desde 1970-01-01 e quantidades em gramas (ver LoteRepository)
+    c.execute(LoteRepository.ESQUEMA.format(tabela="lote"))
+    c.execute(LoteRepository.VISAO_LEGIVEL)
 
     c.execute(
         """
@@ -92,6 +81,10 @@ def criar_banco_e_tabelas(conn: sqlite3.Connection):
             data DATE NOT NULL,
             quantidade_prevista FLOAT NOT NULL,
             produto_sku TEXT NOT NULL,
+            metodo TEXT, -- 'prophet', 'vetorizado', 'sazonal_ingenuo', 'media' ou 'reserva_worker'
+            yhat_lower FLOAT, -- intervalo de 80% da previsão
+            yhat_upper FLOAT,
+            execucao_id INTEGER, -- rodada (previsao_execucao) que gravou o valor atual
             FOREIGN KEY (produto_sku) REFERENCES produto(sku),
             UNIQUE (produto_sku, data)  -- evita duplicidade de previsão por produto e data
         )
@@ -109,6 +102,7 @@ def criar_banco_e_tabelas(conn: sqlite3.Connection):
     )
 
     conn.commit()
+    migracoes.aplicar_migracoes(conn)
     conn.close()
     logging.info("Banco e tabelas criados com sucesso.")
 
@@ -0,0 +1,164 @@
+"""
+Fila persistente de tarefas de previsão, processada por uma thread local.
+
+As tarefas ficam na tabela tarefa_previsao (ver TarefaRepository); a thread
+de cada processo reserva a próxima tarefa pendente, executa a rotina de
+previsão e grava o progresso SKU a SKU.
+
+A reserva vale por um lease de DURACAO_LEASE_S segundos, renovado por uma
+thread enquanto a tarefa executa. Só tarefas com lease vencido (processo
+dono morto ou travado) voltam para a fila, então vários processos (ex.:
+workers do gunicorn) podem consumir a mesma fila sem executar uma tarefa duas vezes.
+"""
+import logging
+import os
+import socket
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+import src.conexoes as Conexoes
+import src.manager as Manager
+import src.repositories.TarefaRepository as TarefaRepository
+
+CHAVE_PREVISAO = "previsao"  # uma rodada completa ativa por vez
+INTERVALO_CONSULTA_S = 2.0
+DURACAO_LEASE_S = 60.0
+INTERVALO_RENOVACAO_S = DURACAO_LEASE_S / 4
+
+_worker: Optional[threading.Thread] = None
+_trava = threading.Lock()
+_novas_tarefas = threading.Event()
+
+
+class TarefaCancelada(Exception):
+    """Lançada pelo callback de progresso quando o cancelamento foi solicitado."""
+
+
+class LeasePerdido(Exception):
+    """Lançada pelo callback de progresso quando a tarefa deixou de pertencer a este processo."""
+
+
+def identificador_processo() -> str:
+    """Dono das tarefas reservadas por este processo (host:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def conectar(caminho_banco) -> sqlite3.Connection:
+    return Conexoes.conectar(caminho_banco, busy_timeout_ms=30_000)
+
+
+def enfileirar_previsao(conn: sqlite3.Connection):
+    """Enfileira uma rodada de previsão (ou reaproveita a que já está ativa) e acorda a thread."""
+    tarefa_id, criada = TarefaRepository.enfileirar(conn, CHAVE_PREVISAO)
+    _novas_tarefas.set()
+    return tarefa_id, criada
+
+
+def _renovar_lease(caminho_banco, tarefa_id: int, dono: str, parar: threading.Event, perdido: threading.Event):
+    """Renova o lease da tarefa a cada INTERVALO_RENOVACAO_S até parar (roda numa thread própria)."""
+    conn = conectar(caminho_banco)
+    try:
+        while not parar.wait(INTERVALO_RENOVACAO_S):
+            try:
+                if not TarefaRepository.renovar_lease(conn, tarefa_id, dono, DURACAO_LEASE_S):
+                    logging.warning(f"Tarefa de previsão {tarefa_id} não pertence mais a {dono}")
+                    perdido.set()
+                    return
+            except sqlite3.Error as e:
+                logging.error(f"Erro ao renovar o lease da tarefa {tarefa_id}: {e}")
+    finally:
+        conn.close()
+
+
+def executar_tarefa(conn: sqlite3.Connection, caminho_banco, tarefa_id: int, dono: str):
+    """
+    Executa a rotina de previsão de uma tarefa já reservada por dono,
+    renovando o lease enquanto ela roda.
+    """
+    parar = threading.Event()
+    perdido = threading.Event()
+    renovacao = threading.Thread(
+        target=_renovar_lease, args=(caminho_banco, tarefa_id, dono, parar, perdido),
+        name=f"lease-tarefa-{tarefa_id}", daemon=True,
+    )
+
+    def progresso(concluidos, total, falhas):
+        if perdido.is_set():
+            raise LeasePerdido()
+        TarefaRepository.atualizar_progresso(conn, tarefa_id, concluidos, total, falhas)
+        if TarefaRepository.cancelamento_solicitado(conn, tarefa_id):
+            raise TarefaCancelada()
+
+    renovacao.start()
+    try:
+        Manager.realizar_previsao(conn, progresso=progresso)
+    except LeasePerdido:
+        conn.rollback()
+        logging.warning(f"Tarefa de previsão {tarefa_id} abandonada: o lease venceu e ela voltou para a fila")
+    except TarefaCancelada:
+        conn.rollback()
+        TarefaRepository.finalizar(conn, tarefa_id, "cancelada", dono=dono)
+    except Exception as e:
+        conn.rollback()
+        logging.exception(f"Tarefa de previsão {tarefa_id} falhou")
+        TarefaRepository.finalizar(conn, tarefa_id, "falhou", f"{type(e).__name__}: {e}", dono=dono)
+    else:
+        TarefaRepository.finalizar(conn, tarefa_id, "concluida", dono=dono)
+    finally:
+        parar.set()
+        renovacao.join()
+
+
+def _loop(caminho_banco):
+    conn = conectar(caminho_banco)
+    while True:
+        try:
+            tarefa = TarefaRepository.reservar_proxima(conn, identificador_processo(), DURACAO_LEASE_S)
+        except sqlite3.Error as e:
+            logging.error(f"Erro ao consultar a fila de previsões: {e}")
+            tarefa = None
+
+        if tarefa is None:
+            _novas_tarefas.wait(INTERVALO_CONSULTA_S)
+            _novas_tarefas.clear()
+            continue
+
+        logging.info(f"Iniciando tarefa de previsão {tarefa['id']}")
+        try:
+            executar_tarefa(conn, caminho_banco, tarefa["id"], tarefa["dono"])
+        except Exception:
+            # Ex.: erro do SQLite ao gravar o status final. A tarefa fica 'executando'
+            # e volta para a fila quando o lease vencer; a thread segue consumindo.
+            logging.exception(f"Erro inesperado na tarefa de previsão {tarefa['id']}")
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+
+
+def iniciar_worker(caminho_banco) -> threading.Thread:
+    """
+    Inicia (uma única vez por processo) a thread que consome a fila.
+    Tarefas 'executando' com lease vencido (de um processo que parou) voltam para a fila.
+    """
+    global _worker
+    with _trava:
+        if _worker is not None and _worker.is_alive():
+            return _worker
+
+        conn = conectar(caminho_banco)
+        try:
+            TarefaRepository.criar_tabela(conn)
+            reenfileiradas = TarefaRepository.reenfileirar_interrompidas(conn)
+            if reenfileiradas:
+                logging.warning(f"{reenfileiradas} tarefa(s) de previsão interrompida(s) voltaram para a fila")
+        finally:
+            conn.close()
+
+        _worker = threading.Thread(
+            target=_loop, args=(str(Path(caminho_banco)),), name="fila-previsao", daemon=True
+        )
+        _worker.start()
+        return _worker
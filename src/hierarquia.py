@@ -0,0 +1,187 @@
+"""
+Previsão hierárquica: total → categoria → SKU.
+
+Os níveis agregados são montados somando as séries dos SKUs com a matriz de
+agregação A (uma linha para o total e uma por categoria; a matriz de soma
+completa é S = [A; I]). Todos os nós recebem previsões base do motor
+vetorizado e são reconciliados de forma coerente (a soma dos SKUs bate com a
+categoria e com o total) por um dos métodos:
+
+- "bottom_up": soma as previsões dos SKUs;
+- "top_down": distribui a previsão do total pela participação histórica de cada SKU;
+- "categoria": distribui a previsão de cada categoria pela participação do SKU nela;
+- "mint": combinação de mínimo traço (MinT) com covariância dos resíduos
+  encolhida em direção à diagonal; catálogos grandes usam só a diagonal.
+
+Todas as operações são matriciais sobre SKUs × horizonte; a única inversão
+é de uma matriz (1 + categorias) × (1 + categorias).
+"""
+import logging
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import src.previsao as previsao
+from src.repositories import ProdutoRepository
+
+CONFIG: Dict[str, Any] = {
+    "metodo": "mint",
+    "janela_proporcoes": 28,  # dias usados nas participações do top_down/categoria
+    "max_nos_covariancia": 500,  # acima disso o MinT usa só as variâncias (diagonal)
+}
+
+METODOS = ("bottom_up", "top_down", "categoria", "mint")
+
+
+def matriz_agregacao(categorias: List[str]) -> Tuple[List[str], np.ndarray]:
+    """
+    Matriz A (1 + n_categorias) × n_skus: a linha 0 soma todos os SKUs e as
+    demais somam os SKUs de cada categoria. Retorna (categorias_ordenadas, A).
+    """
+    nomes = sorted(set(categorias))
+    indice = {categoria: i for i, categoria in enumerate(nomes)}
+    agregacao = np.zeros((1 + len(nomes), len(categorias)))
+    agregacao[0, :] = 1.0
+    agregacao[1 + np.array([indice[c] for c in categorias]), np.arange(len(categorias))] = 1.0
+    return nomes, agregacao
+
+
+def agregar(agregacao: np.ndarray, matriz: np.ndarray) -> np.ndarray:
+    """Soma as séries dos SKUs por nó agregado; dias sem nenhuma venda nos membros ficam NaN."""
+    com_dado = agregacao @ (~np.isnan(matriz)).astype(np.float64)
+    soma = agregacao @ np.nan_to_num(matriz)
+    return np.where(com_dado > 0, soma, np.nan)
+
+
+def _proporcoes(historico: np.ndarray, divisores: np.ndarray) -> np.ndarray:
+    soma = np.nansum(historico[:, -CONFIG["janela_proporcoes"]:], axis=1)
+    return np.divide(soma, divisores, out=np.zeros_like(soma), where=divisores > 0)
+
+
+def covariancia_encolhida(residuos: np.ndarray) -> np.ndarray:
+    """
+    Covariância dos resíduos (nós × dias) encolhida em direção à diagonal,
+    com a intensidade de Schäfer & Strimmer usada no MinT(shrink).
+    """
+    x = np.nan_to_num(residuos).T
+    n = x.shape[0]
+    covariancia = x.T @ x / n
+    variancias = np.diag(covariancia).copy()
+    desvios = np.sqrt(np.where(variancias > 0, variancias, 1.0))
+
+    padronizados = x / desvios
+    correlacao = covariancia / np.outer(desvios, desvios)
+    v = (padronizados ** 2).T @ (padronizados ** 2) - (padronizados.T @ padronizados) ** 2 / n
+    v *= 1 / (n * (n - 1))
+    np.fill_diagonal(v, 0.0)
+    d = correlacao ** 2
+    np.fill_diagonal(d, 0.0)
+
+    intensidade = float(np.clip(v.sum() / d.sum(), 0.0, 1.0)) if d.sum() > 0 else 1.0
+    encolhida = (1 - intensidade) * covariancia
+    encolhida[np.diag_indices_from(encolhida)] = variancias
+    return encolhida
+
+
+def reconciliar_mint(base_agregados: np.ndarray, base_skus: np.ndarray, agregacao: np.ndarray,
+                     residuos: np.ndarray) -> np.ndarray:
+    """
+    MinT na forma de projeção: ỹ = ŷ - W Cᵀ (C W Cᵀ)⁻¹ C ŷ, com C = [I, -A]
+    (C ŷ é a incoerência de cada nó agregado). Retorna as previsões dos SKUs.
+    """
+    m = agregacao.shape[0]
+    base = np.vstack([base_agregados, base_skus])
+    restricao = np.hstack([np.eye(m), -agregacao])
+    incoerencia = restricao @ base
+
+    if base.shape[0] <= CONFIG["max_nos_covariancia"]:
+        w = covariancia_encolhida(residuos)
+        w_ct = w @ restricao.T
+    else:
+        variancias = np.nanvar(residuos, axis=1)
+        w_ct = np.nan_to_num(variancias, nan=0.0)[:, None] * restricao.T
+
+    # Variância nula (série constante) deixaria C W Cᵀ singular
+    regularizacao = 1e-9 * max(float(np.trace(restricao @ w_ct)), 1.0) * np.eye(m)
+    ajuste = w_ct @ np.linalg.solve(restricao @ w_ct + regularizacao, incoerencia)
+    return (base - ajuste)[m:]
+
+
+def reconciliar(metodo: str, base_agregados: np.ndarray, base_skus: np.ndarray, agregacao: np.ndarray,
+                historico_agregados: np.ndarray, historico_skus: np.ndarray) -> np.ndarray:
+    """
+    Reconcilia as previsões base (nós × horizonte) e retorna as previsões
+    dos SKUs; os níveis agregados coerentes são agregacao @ resultado.
+    """
+    base_agregados = np.nan_to_num(base_agregados)
+    base_skus = np.nan_to_num(base_skus)
+
+    if metodo == "bottom_up":
+        skus = base_skus
+    elif metodo == "top_down":
+        proporcoes = _proporcoes(historico_skus, np.nansum(historico_agregados[0, -CONFIG["janela_proporcoes"]:]))
+        skus = proporcoes[:, None] * base_agregados[0][None, :]
+    elif metodo == "categoria":
+        categoria_do_sku = np.argmax(agregacao[1:], axis=0)
+        totais = np.nansum(historico_agregados[1:, -CONFIG["janela_proporcoes"]:], axis=1)
+        proporcoes = _proporcoes(historico_skus, totais[categoria_do_sku])
+        skus = proporcoes[:, None] * base_agregados[1:][categoria_do_sku]
+    elif metodo == "mint":
+        # Resíduos do sazonal ingênuo dentro da amostra, para todos os nós
+        historico = np.vstack([historico_agregados, historico_skus])
+        residuos = historico[:, 7:] - historico[:, :-7]
+        skus = reconciliar_mint(base_agregados, base_skus, agregacao, residuos)
+    else:
+        raise ValueError(f"Método de reconciliação desconhecido: {metodo}. Disponíveis: {METODOS}")
+
+    # Negativos viram zero e os agregados são refeitos a partir dos SKUs
+    return np.clip(skus, 0, None)
+
+
+def prever_hierarquico(conn: sqlite3.Connection, metodo: Optional[str] = None) -> pd.DataFrame:
+    """
+    Prevê todos os níveis da hierarquia com o motor vetorizado e reconcilia.
+    Usa o mesmo recorte de validação e horizonte de prever_vetorizado.
+    Retorna um DataFrame longo com colunas nivel ('total', 'categoria', 'sku'),
+    chave, ds, yhat e metodo.
+    """
+    metodo = metodo or CONFIG["metodo"]
+    categoria_por_sku = {str(p['sku']): p['categoria'] for p in ProdutoRepository.buscar_produtos(conn)}
+    skus, datas, matriz = previsao.carregar_matriz_vendas(conn, list(categoria_por_sku))
+    if not skus:
+        return pd.DataFrame(columns=['nivel', 'chave', 'ds', 'yhat', 'metodo'])
+
+    categorias, agregacao = matriz_agregacao([categoria_por_sku[sku] for sku in skus])
+    agregados = agregar(agregacao, matriz)
+
+    dias_prev = previsao.CONFIG["dias_prev"]
+    treino_skus = matriz[:, :-dias_prev] if matriz.shape[1] > dias_prev else matriz
+    treino_agregados = agregados[:, :treino_skus.shape[1]]
+    datas_treino = datas[:treino_skus.shape[1]]
+    horizonte = previsao.horizonte_de_previsao(matriz.shape[1] - treino_skus.shape[1])
+
+    datas_futuras, base = previsao.previsao_vetorizada(
+        np.vstack([treino_agregados, treino_skus]), datas_treino, horizonte
+    )
+    m = agregacao.shape[0]
+    janela = previsao.CONFIG["janela_vetorizado"]
+    resultado_skus = reconciliar(
+        metodo, base[:m], base[m:], agregacao, treino_agregados[:, -janela:], treino_skus[:, -janela:]
+    )
+    resultado_agregados = agregacao @ resultado_skus
+
+    niveis = ['total'] + ['categoria'] * len(categorias) + ['sku'] * len(skus)
+    chaves = ['total'] + categorias + list(skus)
+    valores = np.vstack([resultado_agregados, resultado_skus])
+    logging.info(
+        f"Previsão hierárquica ({metodo}): {len(skus)} SKUs, {len(categorias)} categorias"
+    )
+    return pd.DataFrame({
+        'nivel': np.repeat(niveis, horizonte),
+        'chave': np.repeat(np.asarray(chaves, dtype=object), horizonte),
+        'ds': np.tile(datas_futuras.to_numpy(), len(chaves)),
+        'yhat': valores.ravel(),
+        'metodo': f"hierarquico_{metodo}",
+    })
@@ -0,0 +1,333 @@
+"""
+Busca de hiperparâmetros do Prophet por SKU (changepoint_prior_scale e
+fourier_order) com validação em origem móvel.
+
+Cada combinação é avaliada nos mesmos folds do SKU; os cortes ficam ancorados
+no calendário (um a cada `passo` dias), então uma nova busca após alguns dias
+de vendas só avalia os folds novos: os já calculados vêm da tabela
+hiperparametro_fold, desde que os dados do fold não tenham mudado.
+A combinação com menor RMSE médio é gravada em hiperparametro_sku e usada
+pelo prever (CONFIG["hiperparametros_por_sku"] em src/previsao.py).
+
+Uso:
+    python -m src.hiperparametros ajustar --workers 4
+    python -m src.hiperparametros ajustar --skus 237478 --amostras 6
+    python -m src.hiperparametros listar
+"""
+import argparse
+import copy
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import random
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src import calendario
+import src.previsao as previsao
+from src.backtest import calcular_metricas
+from src.repositories import HiperparametroRepository
+
+DATABASE = "src/data/data.db"
+
+CONFIG: Dict[str, Any] = {
+    "grade": {
+        "changepoint_prior_scale": [0.001, 0.01, 0.05, 0.1, 0.5],
+        "fourier_order": [2, 3, 5, 8],
+    },
+    "amostras": None,  # None avalia a grade inteira; N sorteia N combinações por SKU
+    "folds": 4,
+    "horizonte": 7,
+    "passo": 7,  # dias entre cortes consecutivos
+    "min_treino": 28,  # dias mínimos de histórico antes do primeiro corte
+    "workers": 1,
+}
+
+
+def combinacoes(sku: str, amostras: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Combinações a avaliar para o SKU: a grade inteira ou uma amostra dela.
+    A amostra é sorteada com semente derivada do SKU, para que buscas
+    seguintes repitam as mesmas combinações e aproveitem os folds em cache.
+    Os parâmetros padrão estão sempre incluídos.
+    """
+    grade = CONFIG["grade"]
+    todas = [
+        {"changepoint_prior_scale": float(cps), "fourier_order": int(fourier)}
+        for cps, fourier in itertools.product(grade["changepoint_prior_scale"], grade["fourier_order"])
+    ]
+    if amostras and amostras < len(todas):
+        semente = int(hashlib.sha256(str(sku).encode()).hexdigest()[:8], 16)
+        todas = random.Random(semente).sample(todas, amostras)
+
+    padrao = {
+        "changepoint_prior_scale": float(previsao.PARAMETROS_PADRAO["changepoint_prior_scale"]),
+        "fourier_order": int(previsao.PARAMETROS_PADRAO["fourier_order"]),
+    }
+    if padrao not in todas:
+        todas.append(padrao)
+    return todas
+
+
+def cortes_ancorados(datas: pd.Series, folds: int, horizonte: int, passo: int, min_treino: int) -> List[int]:
+    """
+    Índices de corte (linhas de treino) dos `folds` folds mais recentes. Só
+    dias cujo número (desde 1970-01-01) é múltiplo de `passo` servem de
+    último dia de treino, então os cortes não andam quando chegam vendas novas.
+    """
+    dias = datas.to_numpy(dtype='datetime64[D]').astype(np.int64)
+    cortes = [
+        corte for corte in range(min_treino, len(dias) - horizonte + 1)
+        if dias[corte - 1] % passo == 0
+    ]
+    return cortes[-folds:]
+
+
+def _checksum_fold(serie: pd.DataFrame, corte: int, horizonte: int) -> str:
+    dados = serie.iloc[:corte + horizonte].rename(columns={'data_dia': 'ds', 'total_venda_dia_kg': 'y'})
+    return previsao.calcular_fingerprint(dados)["checksum"]
+
+
+def avaliar_combinacao(serie: pd.DataFrame, parametros: Dict[str, Any], cortes: List[int],
+                       horizonte: int) -> List[Dict[str, Any]]:
+    """Ajusta e valida uma combinação de parâmetros em cada corte (roda nos workers)."""
+    resultados = []
+    for corte in cortes:
+        treino = serie.iloc[:corte].rename(columns={'data_dia': 'ds', 'total_venda_dia_kg': 'y'})
+        teste = serie.iloc[corte:corte + horizonte]
+        resultado = {
+            **parametros,
+            "corte": str(treino['ds'].iloc[-1].date()),
+            "checksum": _checksum_fold(serie, corte, horizonte),
+            "dias_avaliados": 0,
+            "mape": None,
+            "rmse": None,
+        }
+
+        feriados_df = calendario.feriados_dos_anos(treino['ds'].dt.year.unique(), previsao.CONFIG["regiao"])
+        model = previsao._criar_modelo(feriados_df, **parametros)
+        try:
+            previsao._ajustar_modelo(model, treino)
+        except (TimeoutError, previsao.AjusteNaoConvergiu) as e:
+            logging.warning(f"Fold {resultado['corte']} com {parametros} sem ajuste válido: {type(e).__name__}: {e}")
+            resultados.append(resultado)
+            continue
+
+        previsoes = previsao.prever_futuro(model, horizonte)
+        comparacao = teste.merge(previsoes, left_on='data_dia', right_on='ds', how='inner')
+        metricas = calcular_metricas(
+            comparacao['total_venda_dia_kg'].to_numpy(dtype=np.float64),
+            comparacao['yhat'].to_numpy(dtype=np.float64),
+        )
+        resultado.update(dias_avaliados=len(comparacao), mape=metricas["mape"], rmse=metricas["rmse"])
+        resultados.append(resultado)
+    return resultados
+
+
+def _avaliar_combinacao_worker(sku: str, serie: pd.DataFrame, parametros: Dict[str, Any],
+                               cortes: List[int], horizonte: int):
+    try:
+        return sku, avaliar_combinacao(serie, parametros, cortes, horizonte), None
+    except Exception as e:
+        return sku, [], f"{type(e).__name__}: {e}"
+
+
+def _criar_executor(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=previsao._inicializar_worker,
+        initargs=(copy.deepcopy(previsao.CONFIG),),
+    )
+
+
+def _avaliar_no_pool(executor: ProcessPoolExecutor, tarefas: List[tuple]) -> Tuple[List[tuple], bool]:
+    """
+    Avalia as tarefas no pool. Se um worker morre (o pool fica quebrado), as
+    tarefas afetadas voltam com erro em vez de interromper a busca; o segundo
+    item indica se o pool quebrou e precisa ser recriado.
+    """
+    resultados = []
+    quebrado = False
+    futuros = {}
+    for tarefa in tarefas:
+        try:
+            futuros[executor.submit(_avaliar_combinacao_worker, *tarefa)] = tarefa[0]
+        except BrokenProcessPool as e:
+            quebrado = True
+            resultados.append((tarefa[0], [], f"{type(e).__name__}: {e}"))
+    for futuro in as_completed(futuros):
+        try:
+            resultados.append(futuro.result())
+        except BrokenProcessPool as e:
+            quebrado = True
+            resultados.append((futuros[futuro], [], f"{type(e).__name__}: {e}"))
+    return resultados, quebrado
+
+
+def escolher_vencedor(conn: sqlite3.Connection, sku: str, serie: pd.DataFrame, cortes: List[int],
+                      candidatas: List[Dict[str, Any]], horizonte: int) -> Optional[Dict[str, Any]]:
+    """
+    Combinação com menor RMSE médio entre as que têm todos os folds atuais
+    avaliados (e com os mesmos dados). Retorna None se nenhuma tiver.
+    """
+    folds = HiperparametroRepository.buscar_folds(conn, sku, horizonte)
+    chaves = [
+        (str(serie['data_dia'].iloc[corte - 1].date()), _checksum_fold(serie, corte, horizonte))
+        for corte in cortes
+    ]
+
+    medias = []
+    for parametros in candidatas:
+        rmses = []
+        for corte, checksum in chaves:
+            fold = folds.get((parametros["changepoint_prior_scale"], parametros["fourier_order"], corte))
+            if fold is None or fold["checksum"] != checksum or fold["rmse"] is None:
+                break
+            rmses.append(fold["rmse"])
+        else:
+            medias.append((float(np.mean(rmses)), parametros))
+
+    if not medias:
+        return None
+
+    rmse, melhor = min(medias, key=lambda item: item[0])
+    rmse_padrao = next(
+        (media for media, parametros in medias if parametros == previsao.PARAMETROS_PADRAO), None
+    )
+    return {
+        **melhor,
+        "rmse": rmse,
+        "rmse_padrao": rmse_padrao,
+        "folds": len(cortes),
+        "combinacoes": len(medias),
+    }
+
+
+def ajustar_hiperparametros(conn: sqlite3.Connection, skus: Optional[List[str]] = None,
+                            workers: Optional[int] = None, **parametros) -> Dict[str, Dict[str, Any]]:
+    """
+    Busca os melhores hiperparâmetros de cada SKU (ou dos informados), em
+    paralelo quando workers > 1, avaliando só os folds que ainda não estão
+    em cache. Grava e retorna os vencedores por SKU. SKUs com alguma
+    combinação que falhou (inclusive por morte de um worker) ficam sem
+    vencedor novo nesta busca e mantêm o que já estava gravado.
+    """
+    folds = parametros.get("folds", CONFIG["folds"])
+    horizonte = parametros.get("horizonte", CONFIG["horizonte"])
+    passo = parametros.get("passo", CONFIG["passo"])
+    min_treino = parametros.get("min_treino", CONFIG["min_treino"])
+    amostras = parametros.get("amostras", CONFIG["amostras"])
+    workers = workers or CONFIG["workers"]
+
+    HiperparametroRepository.criar_tabelas(conn)
+    executor = _criar_executor(workers) if workers > 1 else None
+
+    vencedores: Dict[str, Dict[str, Any]] = {}
+    falhas = set()
+    try:
+        for bloco in previsao.iterar_historico_em_blocos(conn, skus):
+            series = {}
+            tarefas = []
+            for sku, grupo in bloco.groupby('produto_sku', observed=True, sort=False):
+                serie = previsao.serie_do_sku(grupo).sort_values('data_dia').reset_index(drop=True)
+                cortes = cortes_ancorados(serie['data_dia'], folds, horizonte, passo, min_treino)
+                if not cortes:
+                    logging.warning(f"SKU={sku} sem histórico suficiente para a busca de hiperparâmetros")
+                    continue
+
+                candidatas = combinacoes(sku, amostras)
+                series[sku] = (serie, cortes, candidatas)
+                cache = HiperparametroRepository.buscar_folds(conn, sku, horizonte)
+                for candidata in candidatas:
+                    faltantes = []
+                    for corte in cortes:
+                        fold = cache.get((candidata["changepoint_prior_scale"], candidata["fourier_order"],
+                                          str(serie['data_dia'].iloc[corte - 1].date())))
+                        if fold is None or fold["checksum"] != _checksum_fold(serie, corte, horizonte):
+                            faltantes.append(corte)
+                    if faltantes:
+                        tarefas.append((sku, serie, candidata, faltantes, horizonte))
+
+            logging.info(f"Busca de hiperparâmetros: {len(series)} SKUs, {len(tarefas)} combinações a avaliar")
+            quebrado = False
+            if executor is not None:
+                resultados, quebrado = _avaliar_no_pool(executor, tarefas)
+            else:
+                resultados = (_avaliar_combinacao_worker(*tarefa) for tarefa in tarefas)
+
+            for sku, linhas, erro in resultados:
+                if erro is not None:
+                    logging.error(f"Busca de hiperparâmetros falhou para SKU={sku}: {erro}")
+                    falhas.add(sku)
+                    continue
+                HiperparametroRepository.salvar_folds(conn, sku, horizonte, linhas)
+
+            if quebrado:
+                logging.warning("Pool de processos quebrado; os SKUs restantes seguem num pool novo")
+                executor.shutdown(cancel_futures=True)
+                executor = _criar_executor(workers)
+
+            for sku, (serie, cortes, candidatas) in series.items():
+                if sku in falhas:
+                    continue
+                vencedor = escolher_vencedor(conn, sku, serie, cortes, candidatas, horizonte)
+                if vencedor is None:
+                    logging.warning(f"Nenhuma combinação válida para SKU={sku}")
+                    continue
+                HiperparametroRepository.salvar_vencedor(conn, sku, vencedor)
+                vencedores[sku] = vencedor
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if falhas:
+        logging.warning(f"Busca de hiperparâmetros sem vencedor novo para {len(falhas)} SKU(s) com falha: "
+                        f"{', '.join(sorted(map(str, falhas)))}")
+    return vencedores
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Busca de hiperparâmetros do Prophet por SKU")
+    parser.add_argument("--banco", default=DATABASE, help="caminho do banco SQLite")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    ajustar = sub.add_parser("ajustar", help="busca e grava os melhores parâmetros por SKU")
+    ajustar.add_argument("--skus", nargs="*", help="limita a busca a estes SKUs")
+    ajustar.add_argument("--amostras", type=int, default=CONFIG["amostras"],
+                         help="busca aleatória com N combinações por SKU (padrão: grade inteira)")
+    ajustar.add_argument("--folds", type=int, default=CONFIG["folds"])
+    ajustar.add_argument("--horizonte", type=int, default=CONFIG["horizonte"])
+    ajustar.add_argument("--passo", type=int, default=CONFIG["passo"])
+    ajustar.add_argument("--workers", type=int, default=CONFIG["workers"])
+
+    sub.add_parser("listar", help="lista os parâmetros vencedores gravados")
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(args.banco)
+    HiperparametroRepository.criar_tabelas(conn)
+
+    try:
+        if args.comando == "ajustar":
+            vencedores = ajustar_hiperparametros(
+                conn, args.skus, args.workers, amostras=args.amostras,
+                folds=args.folds, horizonte=args.horizonte, passo=args.passo,
+            )
+            print(f"SKUs ajustados: {len(vencedores)}")
+        if args.comando in ("ajustar", "listar"):
+            tabela = pd.read_sql_query("SELECT * FROM hiperparametro_sku ORDER BY produto_sku", conn)
+            print(tabela.to_string(index=False, float_format="%.3f"))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
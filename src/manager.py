@@ -10,13 +10,17 @@ from sklearn.metrics import (
 )  # Adicionar esta linha
 
 import random
+import time
 import io
 import src.repositories.PrevisaoRepository as PrevisaoRepository
 import src.repositories.VendaRepository as VendaRepository
 import src.repositories.LoteRepository as LoteRepository
 import src.repositories.ProdutoRepository as ProdutoRepository
+import src.repositories.ExecucaoRepository as ExecucaoRepository
+import src.repositories.ResumoRepository as ResumoRepository
 
 import src.previsao as previsao
+import src.colunar as colunar
 
 # Configuração de logging
 logging.basicConfig(
@@ -26,6 +30,14 @@ logging.basicConfig(
 k_seg = 1.65  # Fator de segurança para 95% de confiança
 alpha = 0.85  # Fator de retração (15% de perda)
 validade_dias = 2  # Validade após descongelamento
+linhas_por_lote_upload = 50_000  # Linhas por transação na importação de histórico
+
+# Colunas do CSV de histórico de vendas -> colunas da tabela venda
+COLUNAS_UPLOAD_VENDAS = {
+    "data_dia": "data",
+    "id_produto": "produto_sku",
+    "total_venda_dia_kg": "quantidade",
+}
 
 
 def calcular_desvio_padrao(conn, produto_sku):
@@ -62,7 +74,7 @@ def calcular_retirada(conn, produto_sku, data_hoje):
     # 1. Obter previsão para t+2
     data_venda = data_hoje + timedelta(days=2)
 
-    Vp_t2 = PrevisaoRepository.obter_previsao(conn, produto_sku, data_venda)
+    Vp_t2, m_t2 = PrevisaoRepository.obter_previsao_e_desvio(conn, produto_sku, data_venda)
 
     if Vp_t2 is None:
         # Fallback para demanda média se não houver previsão
@@ -71,8 +83,10 @@ def calcular_retirada(conn, produto_sku, data_hoje):
             f"Previsão não encontrada para produto {produto_sku}. Usando demanda média: {Vp_t2}"
         )
 
-    # 2. Calcular desvio padrão para t+2
-    m_t2 = calcular_desvio_padrao(conn, produto_sku)  # MUDAR URGENTE
+    # 2. Desvio padrão para t+2: vem do intervalo gravado com a previsão;
+    # previsões antigas (sem intervalo) ainda usam o histórico de erros
+    if m_t2 is None:
+        m_t2 = calcular_desvio_padrao(conn, produto_sku)
 
     # 3. Obter retirada do dia anterior (t-1)
     R_t1 = LoteRepository.obter_retirada_anterior(conn, produto_sku, data_hoje)
@@ -114,24 +128,24 @@ def registrar_venda(conn, produto_sku, data, quantidade):
         (data_str, quantidade_efetiva, produto_sku),
     )
 
-    # 3. Atualizar lotes (FIFO)
+    # 3. Atualizar lotes (FIFO), em gramas
     cursor.execute(
         """
             SELECT id, quantidade_atual
             FROM lote
             WHERE produto_sku = ? 
-            AND status IN ('disponivel', 'sobra')
+            AND status IN (?, ?)
             AND data_venda <= ?
             ORDER BY data_retirado
         """,
-        (produto_sku, data_str),
+        (produto_sku, *LoteRepository.codigos_status("disponivel", "sobra"), LoteRepository.para_dia(data)),
     )
 
     lotes = cursor.fetchall()
-    quantidade_restante = quantidade_efetiva
+    quantidade_restante = LoteRepository.para_gramas(quantidade_efetiva)
 
     for lote in lotes:
-        lote_id, qtd_lote = lote["id"], lote["quantidade_atual"]
+        lote_id, qtd_lote = lote[0], lote[1]
         if quantidade_restante <= 0:
             break
 
@@ -155,10 +169,10 @@ def registrar_venda(conn, produto_sku, data, quantidade):
             cursor.execute(
                 """
                     UPDATE lote
-                    SET status = 'vendido'
+                    SET status = ?
                     WHERE id = ?
                 """,
-                (lote_id,),
+                (LoteRepository.STATUS["vendido"], lote_id),
             )
 
     conn.commit()
@@ -214,18 +228,19 @@ def calcular_qtd_disponivel(conn, produto_sku, data=None):
         data = datetime.now().date()
 
     cursor = conn.cursor()
+    dia = LoteRepository.para_dia(data)
+    disponivel, sobra, perda = LoteRepository.codigos_status("disponivel", "sobra", "perda")
 
     # Calcular R(t-2): quantidade retirada há 2 dias
-    data_retirada = data - timedelta(days=2)
     cursor.execute(
         """
         SELECT COALESCE(SUM(quantidade_retirada), 0) as retirada
         FROM lote
-        WHERE produto_sku = ? AND DATE(data_retirado) = ?
+        WHERE produto_sku = ? AND data_retirado = ?
         """,
-        (produto_sku, data_retirada.strftime("%Y-%m-%d")),
+        (produto_sku, dia - 2),
     )
-    R_t2 = cursor.fetchone()["retirada"]
+    R_t2 = LoteRepository.de_gramas(cursor.fetchone()[0])
 
     # Calcular D(t-1): quantidade disponível ontem
     data_ontem = data - timedelta(days=1)
@@ -234,36 +249,36 @@ def calcular_qtd_disponivel(conn, produto_sku, data=None):
         SELECT COALESCE(SUM(quantidade_atual), 0) as disponivel_ontem
         FROM lote
         WHERE produto_sku = ? 
-        AND DATE(data_retirado) <= ?
-        AND status IN ('disponivel', 'sobra')
+        AND status IN (?, ?)
+        AND data_retirado <= ?
         """,
-        (produto_sku, data_ontem.strftime("%Y-%m-%d")),
+        (produto_sku, disponivel, sobra, dia - 1),
     )
-    D_t1 = cursor.fetchone()["disponivel_ontem"]
+    D_t1 = LoteRepository.de_gramas(cursor.fetchone()[0])
 
     # Calcular V(t-1): vendas de ontem
     cursor.execute(
         """
         SELECT COALESCE(SUM(quantidade), 0) as vendas_ontem
         FROM venda
-        WHERE produto_sku = ? AND DATE(data) = ?
+        WHERE produto_sku = ? AND data = ?
         """,
         (produto_sku, data_ontem.strftime("%Y-%m-%d")),
     )
-    V_t1 = cursor.fetchone()["vendas_ontem"]
+    V_t1 = cursor.fetchone()[0]
 
-    # Calcular P(t-1): perdas de ontem (lotes que venceram)
+    # Calcular P(t-1): perdas de ontem (lotes que venceram; os antigos 'vencido' migram para 'perda')
     cursor.execute(
         """
         SELECT COALESCE(SUM(quantidade_atual), 0) as perdas_ontem
         FROM lote
         WHERE produto_sku = ?
-        AND DATE(data_retirado) = ?
-        AND status = 'vencido'
+        AND status = ?
+        AND data_retirado = ?
         """,
-        (produto_sku, data_ontem.strftime("%Y-%m-%d")),
+        (produto_sku, perda, dia - 1),
     )
-    P_t1 = cursor.fetchone()["perdas_ontem"]
+    P_t1 = LoteRepository.de_gramas(cursor.fetchone()[0])
 
     # Calcular S(t-1): sobra de ontem
     S_t1 = D_t1 - V_t1 - P_t1
@@ -286,9 +301,34 @@ def calcular_qtd_disponivel(conn, produto_sku, data=None):
     return max(0, D_t)  # Não pode ser negativo
 
 
-def realizar_previsao(conn):
-    previsao.importar_vendas_csv(conn, Path("src/data/dados_zenith.csv"))
-    previsao.prever(conn)
+def realizar_previsao(conn, progresso=None):
+    previsao.importar_vendas_csv_incremental(conn, Path("src/data/dados_zenith.csv"))
+    previsao.prever(conn, progresso=progresso)
+
+
+def obter_decisoes_reajuste(conn):
+    """Decisões de reajuste por SKU que a próxima rodada de previsão tomaria."""
+    decisoes = previsao.decidir_reajustes(conn)
+    return {
+        "skus_total": len(decisoes),
+        "skus_reajustar": sum(1 for d in decisoes if d["reajustar"]),
+        "decisoes": decisoes,
+    }
+
+
+def obter_execucoes_previsao(conn, limite=20):
+    """Últimas rodadas de previsão com tempos por etapa e acurácia contra as vendas"""
+    execucoes = ExecucaoRepository.listar_execucoes(conn, limite)
+    acuracia = {
+        a["execucao_id"]: a
+        for a in ExecucaoRepository.avaliar_execucoes(conn, [e["id"] for e in execucoes])
+    }
+    for execucao in execucoes:
+        a = acuracia.get(execucao["id"], {})
+        execucao["dias_avaliados"] = a.get("dias_avaliados", 0)
+        execucao["mae"] = a.get("mae")
+        execucao["wape"] = a.get("wape")
+    return execucoes
 
 
 def obter_lotes(conn, produto_sku):
@@ -341,48 +381,32 @@ def obter_metricas_dashboard(conn):
     cursor.execute("SELECT COUNT(*) FROM produto")
     total_produtos = cursor.fetchone()[0]
 
-    cursor.execute(
-        "SELECT COALESCE(SUM(quantidade), 0) FROM venda WHERE data = ?",
-        (hoje.strftime("%Y-%m-%d"),),
-    )
-    vendas_hoje = cursor.fetchone()[0]
+    # Vendas, estoque e perdas vêm das tabelas de resumo (ResumoRepository)
+    inicio_periodo = (hoje - timedelta(days=7)).strftime("%Y-%m-%d")
+    vendas_hoje = ResumoRepository.total_vendido_no_dia(conn, hoje.strftime("%Y-%m-%d"))
 
-    cursor.execute(
-        """
-        SELECT COALESCE(SUM(quantidade_atual), 0) 
-        FROM lote 
-        WHERE status IN ('disponivel', 'sobra')
-    """
-    )
-    estoque_total = cursor.fetchone()[0]
+    disponivel, sobra = LoteRepository.codigos_status("disponivel", "sobra")
+    dia_hoje = LoteRepository.para_dia(hoje)
+
+    estoque_por_sku = ResumoRepository.estoque_por_sku(conn, "disponivel", "sobra")
+    estoque_total = round(sum(estoque_por_sku.values()), 3)
+    perdas_periodo = ResumoRepository.perdas_por_dia(conn, dia_hoje - 7, dia_hoje)
 
     # 2. Produtos mais vendidos (top 5)
-    cursor.execute(
-        """
-        SELECT p.sku, p.nome, SUM(v.quantidade) as total_vendido
-        FROM venda v
-        JOIN produto p ON v.produto_sku = p.sku
-        WHERE v.data >= date('now', '-7 days')
-        GROUP BY p.sku
-        ORDER BY total_vendido DESC
-        LIMIT 5
-    """
-    )
-    top_produtos = [
-        dict(zip(("sku", "nome", "total_vendido"), row)) for row in cursor.fetchall()
-    ]
+    top_produtos = ResumoRepository.mais_vendidos(conn, inicio_periodo, 5)
 
     # 3. Lotes próximos ao vencimento
     cursor.execute(
         """
         SELECT l.id, p.nome, l.quantidade_atual, l.data_expiracao, 
-               julianday(l.data_expiracao) - julianday('now') as dias_restantes
+               l.data_expiracao - ? as dias_restantes
         FROM lote l
         JOIN produto p ON l.produto_sku = p.sku
-        WHERE l.status IN ('disponivel', 'sobra')
-          AND dias_restantes BETWEEN 0 AND 3
+        WHERE l.status IN (?, ?)
+          AND l.data_expiracao BETWEEN ? AND ?
         ORDER BY dias_restantes ASC
-    """
+    """,
+        (dia_hoje, disponivel, sobra, dia_hoje + 1, dia_hoje + 3),
     )
     lotes_proximo_vencer = []
     for row in cursor.fetchall():
@@ -390,29 +414,20 @@ def obter_metricas_dashboard(conn):
             {
                 "id": row[0],
                 "nome_produto": row[1],
-                "quantidade": row[2],
-                "data_expiracao": row[3],
+                "quantidade": LoteRepository.de_gramas(row[2]),
+                "data_expiracao": LoteRepository.de_dia(row[3]).strftime("%Y-%m-%d"),
                 "dias_restantes": int(row[4]) if row[4] else 0,
             }
         )
 
     # 4. Evolução de vendas (últimos 7 dias)
-    cursor.execute(
-        """
-        SELECT date(v.data) as dia, COALESCE(SUM(v.quantidade), 0) as total
-        FROM venda v
-        WHERE v.data >= date('now', '-7 days')
-        GROUP BY dia
-        ORDER BY dia ASC
-    """
-    )
-    evolucao_vendas = [{"dia": row[0], "total": row[1]} for row in cursor.fetchall()]
+    evolucao_vendas = ResumoRepository.vendas_por_dia(conn, inicio_periodo)
 
     # 5. Previsões de demanda (próximos 3 dias)
     cursor.execute(
         """
         SELECT p.data, SUM(p.quantidade_prevista) as total_previsto
-        FROM previsao p
+        FROM previsao_vigente p
         WHERE p.data BETWEEN date('now') AND date('now', '+3 days')
         GROUP BY p.data
         ORDER BY p.data ASC
@@ -420,22 +435,30 @@ def obter_metricas_dashboard(conn):
     )
     previsoes = [{"data": row[0], "quantidade": row[1]} for row in cursor.fetchall()]
 
+    # Com o motor hierárquico, o total reconciliado substitui a soma dos SKUs
+    inicio_previsao = hoje.strftime("%Y-%m-%d")
+    fim_previsao = (hoje + timedelta(days=3)).strftime("%Y-%m-%d")
+    totais = PrevisaoRepository.buscar_previsoes_agregadas(conn, "total", inicio_previsao, fim_previsao)
+    if totais:
+        previsoes = [{"data": t["data"], "quantidade": t["quantidade_prevista"]} for t in totais]
+
     # 6. Status de estoque por categoria
     cursor.execute(
         """
         SELECT p.categoria, 
-               SUM(l.quantidade_atual) as estoque,
+               SUM(e.quantidade) as estoque,
                COUNT(DISTINCT p.sku) as produtos
-        FROM lote l
-        JOIN produto p ON l.produto_sku = p.sku
-        WHERE l.status IN ('disponivel', 'sobra')
+        FROM estoque_sku e
+        JOIN produto p ON e.produto_sku = p.sku
+        WHERE e.status IN (?, ?) AND e.lotes > 0
         GROUP BY p.categoria
-    """
+    """,
+        (disponivel, sobra),
     )
     estoque_por_categoria = []
     for row in cursor.fetchall():
         estoque_por_categoria.append(
-            {"categoria": row[0], "estoque": row[1], "produtos": row[2]}
+            {"categoria": row[0], "estoque": LoteRepository.de_gramas(row[1]), "produtos": row[2]}
         )
 
     # 7. Alertas e notificações
@@ -444,13 +467,15 @@ def obter_metricas_dashboard(conn):
     cursor.execute(
         """
         SELECT p.sku, p.nome, 
-               COALESCE(SUM(l.quantidade_atual), 0) as estoque_atual,
-               (SELECT AVG(quantidade) FROM venda WHERE produto_sku = p.sku) as media_vendas
+               COALESCE(SUM(e.quantidade), 0) / 1000.0 as estoque_atual,
+               r.total / NULLIF(r.dias, 0) as media_vendas
         FROM produto p
-        LEFT JOIN lote l ON p.sku = l.produto_sku AND l.status IN ('disponivel', 'sobra')
+        LEFT JOIN estoque_sku e ON p.sku = e.produto_sku AND e.status IN (?, ?)
+        LEFT JOIN venda_resumo_sku r ON p.sku = r.produto_sku
         GROUP BY p.sku
         HAVING estoque_atual < (media_vendas * 0.2)
-    """
+    """,
+        (disponivel, sobra),
     )
     for row in cursor.fetchall():
         alertas.append(
@@ -469,9 +494,9 @@ def obter_metricas_dashboard(conn):
         SELECT COUNT(*) 
         FROM lote 
         WHERE data_expiracao = ? 
-          AND status IN ('disponivel', 'sobra')
+          AND status IN (?, ?)
     """,
-        (hoje.strftime("%Y-%m-%d"),),
+        (dia_hoje, disponivel, sobra),
     )
     count_vencendo_hoje = cursor.fetchone()[0]
     if count_vencendo_hoje > 0:
@@ -490,6 +515,7 @@ def obter_metricas_dashboard(conn):
             "estoque_total": estoque_total,
             "lotes_proximo_vencimento": len(lotes_proximo_vencer),
             "alertas_ativos": len(alertas),
+            "perdas_periodo": round(sum(p["quantidade"] for p in perdas_periodo), 3),
         },
         "detalhes": {
             "top_produtos": top_produtos,
@@ -497,6 +523,7 @@ def obter_metricas_dashboard(conn):
             "evolucao_vendas": evolucao_vendas,
             "previsoes_demanda": previsoes,
             "estoque_por_categoria": estoque_por_categoria,
+            "perdas_por_dia": perdas_periodo,
         },
         "alertas": alertas,
         "metadados": {
@@ -649,93 +676,85 @@ def obter_metricas_previsao(conn: sqlite3.Connection, dias_comparacao: int = 30)
     }
 
 
-def importar_historico_vendas_do_string_csv(conn: sqlite3.Connection, csv_content: str):
+def _ler_lotes_csv(arquivo, linhas_por_lote: int):
+    leitor = pd.read_csv(
+        arquivo, encoding="latin1", sep=",", chunksize=linhas_por_lote,
+        dtype={"id_produto": str}, usecols=lambda coluna: coluna in COLUNAS_UPLOAD_VENDAS,
+    )
+    for lote in leitor:
+        lote = lote.rename(columns=COLUNAS_UPLOAD_VENDAS)
+        faltando = [csv for csv, coluna in COLUNAS_UPLOAD_VENDAS.items() if coluna not in lote.columns]
+        if faltando:
+            raise ValueError(
+                f"CSV faltando colunas necessárias: {faltando}. Esperado: {list(COLUNAS_UPLOAD_VENDAS)}"
+            )
+        lote["data"] = pd.to_datetime(lote["data"], format=previsao.FORMATO_DATA_CSV).dt.strftime("%Y-%m-%d")
+        lote["quantidade"] = pd.to_numeric(lote["quantidade"]).astype(float)
+        yield lote
+
+
+def importar_historico_vendas_em_lotes(conn: sqlite3.Connection, arquivo, linhas_por_lote: int = None,
+                                       formato: str = "csv"):
     """
-    Importa o histórico de vendas de uma string CSV para o banco de dados.
+    Importa o histórico de vendas de um arquivo lido em lotes, sem carregar o
+    arquivo inteiro em memória. Cada lote é gravado numa única transação e,
+    ao final dele, o progresso acumulado é devolvido (gerador).
 
     Args:
         conn: Conexão com o banco de dados.
-        csv_content: O conteúdo do CSV como uma string.
+        arquivo: Caminho ou objeto de arquivo com o histórico.
+        linhas_por_lote: Linhas lidas e gravadas por transação.
+        formato: 'csv', 'parquet' ou 'arrow' (os dois últimos requerem o pyarrow).
+
+    Yields:
+        dict com lote, linhas_lidas, vendas_gravadas, vendas_rejeitadas,
+        segundos e linhas_por_segundo acumulados.
     """
-    logging.info("Iniciando importação de vendas do conteúdo CSV em string.")
-    try:
-        csv_file_like_object = io.StringIO(csv_content)
-        df_vendas = pd.read_csv(
-            csv_file_like_object, encoding="latin1", sep=","
-        )  # Adicione codificação e separador se necessário
-
-        # Renomeie as colunas para corresponder ao esquema do banco de dados esperado
-        df_vendas = df_vendas.rename(
-            columns={
-                "data_dia": "data",
-                "id_produto": "produto_sku",
-                "total_venda_dia_kg": "quantidade",
-            }
-        )
+    linhas_por_lote = linhas_por_lote or linhas_por_lote_upload
+    logging.info(f"Iniciando importação de vendas em lotes de {linhas_por_lote} linhas.")
+    inicio = time.perf_counter()
+    progresso = {"lote": 0, "linhas_lidas": 0, "vendas_gravadas": 0, "vendas_rejeitadas": 0}
 
-        # Garanta que as colunas essenciais agora existam após a renomeação
-        required_columns = ["data", "produto_sku", "quantidade"]
-        if not all(col in df_vendas.columns for col in required_columns):
-            raise ValueError(
-                f"CSV faltando colunas necessárias após a renomeação. Esperado: {required_columns}, Encontrado: {df_vendas.columns.tolist()}"
-            )
+    if formato == "csv":
+        lotes = _ler_lotes_csv(arquivo, linhas_por_lote)
+    else:
+        lotes = colunar.ler_lotes_vendas(arquivo, formato, linhas_por_lote)
 
-        # Converta a coluna 'data' para datetime e formate para o banco de dados
-        df_vendas["data"] = pd.to_datetime(
-            df_vendas["data"], dayfirst=True
-        ).dt.strftime("%Y-%m-%d")
-        # Nota: dayfirst=True é importante se o formato de data_dia for DD/MM/AAAA
+    for lote in lotes:
+        gravadas, rejeitadas = VendaRepository.gravar_vendas_em_lote(
+            conn, lote[["data", "quantidade", "produto_sku"]].itertuples(index=False, name=None)
+        )
+        segundos = time.perf_counter() - inicio
+        progresso["lote"] += 1
+        progresso["linhas_lidas"] += len(lote)
+        progresso["vendas_gravadas"] += gravadas
+        progresso["vendas_rejeitadas"] += rejeitadas
+        progresso["segundos"] = round(segundos, 3)
+        progresso["linhas_por_segundo"] = round(progresso["linhas_lidas"] / segundos, 1) if segundos > 0 else None
+        yield dict(progresso)
 
-        print(df_vendas)
+    logging.info(
+        f"Importação de vendas concluída: {progresso['vendas_gravadas']} gravadas, "
+        f"{progresso['vendas_rejeitadas']} rejeitadas (ver venda_rejeitada) em {progresso['lote']} lotes "
+        f"({progresso.get('linhas_por_segundo')} linhas/s)."
+    )
 
-        cursor = conn.cursor()
-        for index, row in df_vendas.iterrows():
-            try:
-                # Primeiro, verifique se o produto_sku existe na tabela de produtos
-                cursor.execute(
-                    "SELECT sku FROM produto WHERE sku = ?",
-                    (str(row["produto_sku"]),),  # Garanta que o SKU seja string
-                )
-                if cursor.fetchone() is None:
-                    # Tente criar o produto se ele não existir, usando 'descricao_produto' para o nome e 'Equipe responsável' para a categoria.
-                    # Você precisaria passar 'descricao_produto' e 'Equipe responsável' do df original para esta função ou buscá-los.
-                    # Para simplificar, se essas colunas não forem estritamente necessárias na tabela 'venda', você pode omiti-las aqui.
-                    # No entanto, se você quiser criar produtos dinamicamente, você precisaria da 'descricao_produto' e 'Equipe responsável' originais.
-                    # Por enquanto, para este erro específico, vamos nos concentrar nas colunas para 'venda'.
-
-                    # Como uma solução alternativa para este erro específico, vamos apenas registrar e pular se o produto não for encontrado.
-                    # Uma solução melhor pode ser chamar uma função de criação de produto aqui se você espera novos produtos.
-                    logging.warning(
-                        f"SKU do produto '{row['produto_sku']}' não encontrado. Pulando a venda. Por favor, certifique-se de que os produtos estejam pré-importados."
-                    )
-                    continue
-
-                # Insira ou atualize a venda
-                cursor.execute(
-                    """
-                    INSERT INTO venda (data, quantidade, produto_sku)
-                    VALUES (?, ?, ?)
-                    ON CONFLICT(data, produto_sku) DO UPDATE SET quantidade = excluded.quantidade
-                    """,
-                    (
-                        row["data"],
-                        row["quantidade"],
-                        str(row["produto_sku"]),
-                    ),  # Garanta que o SKU seja string
-                )
-            except sqlite3.Error as e:
-                logging.error(
-                    f"Erro ao inserir venda para SKU {row['produto_sku']} na data {row['data']}: {e}"
-                )
-                # Dependendo das suas necessidades, você pode querer relançar a exceção ou continuar
 
-        conn.commit()
-        logging.info("Importação de vendas da string CSV concluída com sucesso.")
+def importar_historico_vendas_do_string_csv(conn: sqlite3.Connection, csv_content: str):
+    """
+    Importa o histórico de vendas de uma string CSV para o banco de dados.
 
-    except Exception as e:
-        conn.rollback()
-        logging.error(f"Erro durante a importação de vendas da string CSV: {e}")
-        raise  # Relançar para que o chamador possa lidar com o erro
+    Args:
+        conn: Conexão com o banco de dados.
+        csv_content: O conteúdo do CSV como uma string.
+
+    Returns:
+        O progresso final (ver importar_historico_vendas_em_lotes).
+    """
+    resumo = {}
+    for resumo in importar_historico_vendas_em_lotes(conn, io.StringIO(csv_content)):
+        pass
+    return resumo
 
 
 # NOVA FUNÇÂO
@@ -0,0 +1,185 @@
+"""
+Migrações versionadas do esquema.
+
+A versão do esquema fica em PRAGMA user_version. Cada migração tem um número
+crescente e é aplicada uma única vez, em ordem, numa transação que também
+grava a nova versão; as instruções são idempotentes (IF NOT EXISTS), então
+um banco que já tenha parte delas migra sem erro.
+
+O esquema base (produto, lote, venda, previsao) continua sendo criado por
+database.criar_banco_e_tabelas, que aplica as migrações ao final; bancos sem
+o esquema base não são migrados.
+"""
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, Union
+
+import src.conexoes as Conexoes
+from src.repositories import (
+    EstadoPrevisaoRepository, ExecucaoRepository, HiperparametroRepository, ImportacaoRepository,
+    LoteRepository, PrevisaoRepository, ResumoRepository, TarefaRepository, VendaRepository,
+)
+
+INDICES_LOTE = [
+    # retirada do dia e lotes do SKU: produto_sku = ? [AND status] ORDER BY data_retirado
+    "CREATE INDEX IF NOT EXISTS idx_lote_sku_status_retirado ON lote (produto_sku, status, data_retirado)",
+    # transições de status: status = ? AND data_venda <=/</= ?
+    "CREATE INDEX IF NOT EXISTS idx_lote_status_venda ON lote (status, data_venda)",
+    "CREATE INDEX IF NOT EXISTS idx_lote_expiracao ON lote (data_expiracao)",
+]
+
+
+# Status em texto que versões antigas gravavam -> status atual
+STATUS_LEGADOS = {"vencido": "perda"}
+
+
+def _lote_compacto(conn: sqlite3.Connection):
+    """
+    Reescreve lote no formato compacto de LoteRepository: datas em dias desde
+    1970-01-01, quantidades em gramas e status como código. Lotes 'vencido'
+    viram 'perda' (STATUS_LEGADOS); outros status fora de LoteRepository.STATUS
+    fazem a migração falhar (NOT NULL); saldos negativos viram zero.
+    """
+    tipos = {row[1]: row[2].upper() for row in conn.execute("PRAGMA table_info(lote)")}
+    if tipos.get("status") != "INTEGER":
+        codigos = {**LoteRepository.STATUS,
+                   **{legado: LoteRepository.STATUS[atual] for legado, atual in STATUS_LEGADOS.items()}}
+        casos = " ".join(f"WHEN '{nome}' THEN {codigo}" for nome, codigo in codigos.items())
+        dia = "CAST(julianday({coluna}) - 2440587.5 AS INTEGER)"
+        conn.execute("DROP VIEW IF EXISTS lote_legivel")
+        conn.execute(LoteRepository.ESQUEMA.format(tabela="lote_compacto"))
+        conn.execute(
+            f"""
+            INSERT INTO lote_compacto (
+                id, quantidade_retirada, quantidade_atual, idade, status,
+                data_retirado, data_venda, data_expiracao, produto_sku
+            )
+            SELECT id,
+                   CAST(round(quantidade_retirada * 1000) AS INTEGER),
+                   CAST(round(MAX(quantidade_atual, 0) * 1000) AS INTEGER),
+                   idade,
+                   CASE status {casos} END,
+                   {dia.format(coluna="data_retirado")},
+                   {dia.format(coluna="data_venda")},
+                   {dia.format(coluna="data_expiracao")},
+                   produto_sku
+            FROM lote
+            """
+        )
+        conn.execute("DROP TABLE lote")
+        conn.execute("ALTER TABLE lote_compacto RENAME TO lote")
+    for sql in INDICES_LOTE:
+        conn.execute(sql)
+    conn.execute(LoteRepository.VISAO_LEGIVEL)
+
+
+def _tabelas_auxiliares(conn: sqlite3.Connection):
+    """
+    Cria as tabelas que os repositórios criavam sob demanda, para que rotas de
+    leitura (conexões somente leitura) não precisem escrever no esquema.
+    Nenhum criar_tabela faz commit: tudo entra na transação da migração.
+    """
+    for criar in (
+        TarefaRepository.criar_tabela,
+        EstadoPrevisaoRepository.criar_tabela,
+        ExecucaoRepository.criar_tabelas,
+        HiperparametroRepository.criar_tabelas,
+        PrevisaoRepository.criar_tabela_agregada,
+        VendaRepository.criar_tabela_rejeitadas,
+        ImportacaoRepository.criar_tabela,
+    ):
+        criar(conn)
+
+
+def _resumos(conn: sqlite3.Connection):
+    """Tabelas de resumo com gatilhos em venda e lote, preenchidas com o histórico atual."""
+    ResumoRepository.criar_tabelas_e_gatilhos(conn)
+    ResumoRepository.recalcular(conn)
+
+
+Migracao = Tuple[int, str, Union[List[str], Callable[[sqlite3.Connection], None]]]
+
+MIGRACOES: List[Migracao] = [
+    (1, "colunas de intervalo, método e execução em previsao", PrevisaoRepository.garantir_colunas),
+    (2, "índices de lote para fluxo diário e dashboard", INDICES_LOTE),
+    (3, "índices de cobertura por data em venda e previsao", [
+        "CREATE INDEX IF NOT EXISTS idx_venda_data ON venda (data, produto_sku, quantidade)",
+        "CREATE INDEX IF NOT EXISTS idx_previsao_data ON previsao (data, produto_sku, quantidade_prevista)",
+    ]),
+    (4, "lote com datas em dias, quantidades em gramas e status inteiro", _lote_compacto),
+    (5, "tabelas auxiliares de fila, estado, execuções, hiperparâmetros e importação", _tabelas_auxiliares),
+    (6, "resumos de vendas diárias, estoque por SKU/status e perdas diárias", _resumos),
+    (7, "dono e lease das tarefas da fila de previsão", TarefaRepository.garantir_colunas),
+    (8, "marca de histórico alterado em estado_previsao", EstadoPrevisaoRepository.garantir_colunas_e_gatilhos),
+    (9, "visão das previsões da última rodada de cada SKU", [
+        PrevisaoRepository.INDICE_EXECUCAO,
+        PrevisaoRepository.VISAO_VIGENTE,
+    ]),
+]
+
+_TABELAS_BASE = ("produto", "lote", "venda", "previsao")
+
+_migrados = set()
+_trava = threading.Lock()
+
+
+def versao_atual(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def aplicar_migracoes(conn: sqlite3.Connection) -> int:
+    """
+    Aplica as migrações pendentes em ordem e retorna a versão final do esquema.
+    """
+    existentes = {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    if not all(tabela in existentes for tabela in _TABELAS_BASE):
+        logging.warning("Esquema base ausente; migrações adiadas até a criação das tabelas.")
+        return versao_atual(conn)
+
+    conn.commit()
+    versao = versao_atual(conn)
+    pendentes = [m for m in sorted(MIGRACOES, key=lambda m: m[0]) if m[0] > versao]
+    for numero, descricao, passos in pendentes:
+        conn.execute("BEGIN")
+        try:
+            if callable(passos):
+                passos(conn)
+            else:
+                for sql in passos:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {int(numero)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logging.error(f"Falha na migração {numero} ({descricao}); esquema permanece na versão {versao}")
+            raise
+        versao = numero
+        logging.info(f"Migração {numero} aplicada: {descricao}")
+
+    if pendentes:
+        # Atualiza as estatísticas do planejador para os índices novos
+        conn.execute("ANALYZE")
+        conn.commit()
+    return versao
+
+
+def migrar(caminho_banco: Union[str, Path]) -> Optional[int]:
+    """
+    Aplica as migrações do banco uma única vez por processo (chamado na
+    inicialização). Retorna None se o banco já foi migrado neste processo.
+    """
+    caminho = str(Path(caminho_banco).resolve())
+    with _trava:
+        if caminho in _migrados:
+            return None
+        conn = Conexoes.conectar(caminho)
+        try:
+            versao = aplicar_migracoes(conn)
+        finally:
+            conn.close()
+        _migrados.add(caminho)
+        return versao
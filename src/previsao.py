@@ -1,14 +1,35 @@
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import copy
+import itertools
+import hashlib
+import io
+import os
+import re
+import time
+import json
+from statistics import NormalDist
 import numpy as np
 import pandas as pd
 import sqlite3
 import logging
-from typing import Union, Dict, Any
+from typing import Union, Dict, Any, List, Tuple, Optional, Iterator, Callable
 from prophet import Prophet
-import holidays
+from prophet.serialize import model_to_json, model_from_json
 from sklearn.metrics import mean_squared_error
 
-from src.repositories import ProdutoRepository, PrevisaoRepository
+from src.repositories import (
+    ProdutoRepository, PrevisaoRepository, ModeloRepository, EstadoPrevisaoRepository, ExecucaoRepository,
+    HiperparametroRepository, ImportacaoRepository,
+)
+from src import calendario
+
+try:
+    import resource
+except ImportError:  # Windows não possui o módulo resource
+    resource = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,57 +37,236 @@ logging.basicConfig(
 )
 
 CONFIG: Dict[str, Any] = {
-    "dias_prev": 7 
+    "dias_prev": 7,
+    "regiao": None,  # sigla do estado para incluir feriados estaduais (ex.: "MA")
+    # Paralelismo do prever: 1 mantém o loop sequencial original
+    "workers": 1,
+    "memoria_max_mb_worker": 4096,  # None desativa o limite de memória por worker
+    "tarefas_por_worker": 500,  # recicla o processo após N SKUs (evita vazamentos)
+    # Cache de modelos ajustados em disco (reaproveitados se o histórico não mudou)
+    "cache_modelos": True,
+    "modelos_dir": None,  # None usa ModeloRepository.DIRETORIO_PADRAO
+    "modelos_max_mb": 512,  # aplicado uma vez ao fim de cada rodada do prever
+    # Inicia o otimizador Stan com os parâmetros do ajuste anterior quando o histórico só cresceu
+    "ajuste_incremental": True,
+    # Prevê só as datas futuras, sem amostragem de incerteza; o intervalo
+    # (yhat_lower/yhat_upper) é calculado analiticamente a partir de sigma_obs
+    "previsao_rapida": True,
+    # Orçamento por SKU: ajustes que estouram o tempo (segundos) caem para uma
+    # estimativa barata (sazonal ingênuo ou média); None desativa o limite
+    "tempo_max_ajuste_s": 60,
+    "iteracoes_max_ajuste": 2000,  # teto de iterações do otimizador Stan (padrão do Prophet: 10000)
+    # Motor de previsão: "prophet", "vetorizado" (Holt-Winters + sazonal ingênuo
+    # para todos os SKUs de uma vez), "hierarquico" (total/categoria/SKU
+    # reconciliados, ver src/hierarquia.py) ou "auto" (Prophet só para SKUs de
+    # alto volume; os demais usam CONFIG["motor_baixo_volume"])
+    "motor": "prophet",
+    "motor_por_sku": {},  # ex.: {"237478": "prophet"} sobrepõe o motor global
+    "volume_min_prophet": 100.0,  # kg/dia médios (últimos 28 dias) para usar Prophet no modo auto
+    "motor_baixo_volume": "vetorizado",  # ou "hierarquico": SKU como parcela da categoria
+    "janela_vetorizado": 182,  # dias de histórico usados pelo motor vetorizado
+    "hw_alpha": 0.3,
+    "hw_beta": 0.05,
+    "hw_gamma": 0.2,
+    "hw_phi": 0.9,
+    "peso_sazonal_ingenuo": 0.5,  # peso do sazonal ingênuo na mistura com o Holt-Winters
+    "semanas_sazonal_ingenuo": 4,
+    "skus_por_bloco": 500,  # SKUs lidos por consulta ao percorrer o histórico em blocos
+    # Reajuste seletivo: o prever só reajusta SKUs sem ajuste, com ajuste velho
+    # ou cujo erro recente (WAPE) passou do limite; os demais mantêm as previsões
+    "reajuste_seletivo": True,
+    "limite_erro_reajuste": 0.25,
+    "min_dias_erro": 3,  # vendas comparadas com previsões antes de o erro valer
+    "janela_erro_dias": 28,
+    "dias_max_sem_ajuste": 7,  # dias de vendas novas após o ajuste que forçam reajuste
+    # Usa os hiperparâmetros vencedores por SKU (ver src/hiperparametros.py) quando existirem
+    "hiperparametros_por_sku": True,
+}
+
+# Hiperparâmetros do Prophet usados quando o SKU não tem ajuste próprio
+PARAMETROS_PADRAO: Dict[str, Any] = {
+    "changepoint_prior_scale": 0.01,
+    "fourier_order": 3,
 }
+# Chaves do fingerprint que descrevem só os dados de treino
+CHAVES_DADOS_FINGERPRINT = ("linhas", "data_max", "checksum")
+
+# metodo das linhas previstas no processo principal porque o worker do SKU morreu
+METODO_RESERVA_WORKER = "reserva_worker"
+
+# Dias entre a época juliana do SQLite e 1970-01-01 (julianday('1970-01-01'))
+EPOCA_JULIANA = 2440587.5
+# Formato de data_dia nos CSVs de vendas (dd/mm/aaaa)
+FORMATO_DATA_CSV = "%d/%m/%Y"
+# SQLite limita a quantidade de parâmetros por consulta
+MAX_PARAMETROS_SQL = 900
+
+
+class AjusteNaoConvergiu(Exception):
+    """O otimizador do Stan parou no teto de CONFIG["iteracoes_max_ajuste"] sem convergir."""
+
+
+def importar_vendas_df(conn: sqlite3.Connection, df: pd.DataFrame,
+                       formato_data: str = FORMATO_DATA_CSV) -> Dict[str, Any]:
+    """
+    Importa em lote um DataFrame com as colunas do CSV de vendas
+    (data_dia, id_produto, descricao_produto, total_venda_dia_kg, Equipe responsável).
+    Duplicatas (mesmo SKU e dia) são descartadas no pandas mantendo a primeira;
+    produtos novos e vendas entram com um executemany INSERT OR IGNORE cada,
+    na mesma transação. Vendas já existentes no banco são ignoradas.
+
+    Returns:
+        dict com linhas_lidas, duplicadas_no_arquivo, vendas_inseridas,
+        vendas_ignoradas, produtos_criados, segundos e linhas_por_segundo.
+    """
+    inicio = time.perf_counter()
+    vendas = pd.DataFrame({
+        'data': pd.to_datetime(df['data_dia'], format=formato_data).dt.strftime("%Y-%m-%d"),
+        'quantidade': pd.to_numeric(df['total_venda_dia_kg']).astype(float),
+        'produto_sku': df['id_produto'].astype(str),
+        'nome': df['descricao_produto'],
+        'categoria': df['Equipe responsável'],
+    })
+    return gravar_vendas(conn, vendas, inicio)
 
-def importar_vendas_csv(conn: sqlite3.Connection, caminho_csv: Union[str, Path]):
+def gravar_vendas(conn: sqlite3.Connection, vendas: pd.DataFrame,
+                  inicio: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Grava vendas já no formato do banco (data 'AAAA-MM-DD', quantidade,
+    produto_sku, nome, categoria), com a mesma semântica de importar_vendas_df.
+    Produtos sem nome não são criados.
+    """
+    inicio = inicio if inicio is not None else time.perf_counter()
+    unicas = vendas.drop_duplicates(subset=['data', 'produto_sku'], keep='first')
+    produtos = unicas.drop_duplicates(subset='produto_sku', keep='first').dropna(subset=['nome'])
+
+    # rowcount do executemany não inclui as alterações feitas pelos gatilhos de resumo
+    with conn:
+        produtos_criados = conn.executemany(
+            "INSERT OR IGNORE INTO produto (sku, nome, categoria) VALUES (?, ?, ?)",
+            produtos[['produto_sku', 'nome', 'categoria']].itertuples(index=False, name=None),
+        ).rowcount
+        vendas_inseridas = conn.executemany(
+            "INSERT OR IGNORE INTO venda (data, quantidade, produto_sku) VALUES (?, ?, ?)",
+            unicas[['data', 'quantidade', 'produto_sku']].itertuples(index=False, name=None),
+        ).rowcount
+
+    segundos = time.perf_counter() - inicio
+    resumo = {
+        "linhas_lidas": len(vendas),
+        "duplicadas_no_arquivo": len(vendas) - len(unicas),
+        "vendas_inseridas": vendas_inseridas,
+        "vendas_ignoradas": len(unicas) - vendas_inseridas,
+        "produtos_criados": produtos_criados,
+        "segundos": round(segundos, 3),
+        "linhas_por_segundo": round(len(vendas) / segundos, 1) if segundos > 0 else None,
+    }
+    logging.info(
+        f"Importação finalizada: {produtos_criados} produtos criados, {vendas_inseridas} vendas inseridas, "
+        f"{resumo['vendas_ignoradas']} já existentes e {resumo['duplicadas_no_arquivo']} duplicadas ignoradas, "
+        f"{len(vendas)} linhas em {segundos:.2f}s ({resumo['linhas_por_segundo']} linhas/s)."
+    )
+    return resumo
+
+def importar_vendas_csv(conn: sqlite3.Connection, caminho_csv: Union[str, Path],
+                        formato_data: str = FORMATO_DATA_CSV) -> Dict[str, Any]:
     """
     Importa vendas a partir de um arquivo CSV com colunas:
     data_dia, id_produto, descricao_produto, total_venda_dia_kg, Equipe responsável.
-    Cria o produto se não existir e insere as vendas.
+    Cria o produto se não existir e insere as vendas (ver importar_vendas_df).
     """
-    df = pd.read_csv(caminho_csv, parse_dates=["data_dia"], dayfirst=True)
+    df = pd.read_csv(caminho_csv, dtype={"id_produto": str})
+    return importar_vendas_df(conn, df, formato_data)
 
-    cursor = conn.cursor()
-    total_linhas = 0
-    produtos_criados = 0
-    vendas_inseridas = 0
+def _fim_ultima_linha(arquivo, tamanho: int, bloco: int = 1 << 16) -> int:
+    """Posição logo após o último '\n' do arquivo (0 se não houver nenhuma linha completa)."""
+    fim = tamanho
+    while fim > 0:
+        inicio = max(0, fim - bloco)
+        arquivo.seek(inicio)
+        posicao = arquivo.read(fim - inicio).rfind(b"\n")
+        if posicao >= 0:
+            return inicio + posicao + 1
+        fim = inicio
+    return 0
 
-    for _, row in df.iterrows():
-        sku = str(row["id_produto"])
-        nome = row["descricao_produto"]
-        categoria = row["Equipe responsável"]
-        data = row["data_dia"].strftime("%Y-%m-%d")
-        quantidade = float(row["total_venda_dia_kg"])
 
-        cursor.execute("SELECT sku FROM produto WHERE sku = ?", (sku,))
-        resultado = cursor.fetchone()
+def _hash_prefixos(arquivo, offset_anterior: int, offset_novo: int, bloco: int = 1 << 20) -> Tuple[Optional[str], str]:
+    """
+    sha256 dos bytes [0, offset_anterior) e [0, offset_novo) numa única leitura.
+    O primeiro é None quando offset_anterior passa do offset_novo.
+    """
+    hasher = hashlib.sha256()
+    hash_anterior = hasher.hexdigest() if offset_anterior == 0 else None
+    arquivo.seek(0)
+    lidos = 0
+    while lidos < offset_novo:
+        dados = arquivo.read(min(bloco, offset_novo - lidos))
+        if 0 < offset_anterior - lidos <= len(dados):
+            parcial = hasher.copy()
+            parcial.update(dados[:offset_anterior - lidos])
+            hash_anterior = parcial.hexdigest()
+        hasher.update(dados)
+        lidos += len(dados)
+    return hash_anterior, hasher.hexdigest()
 
-        if not resultado:
-            cursor.execute(
-                "INSERT INTO produto (sku, nome, categoria) VALUES (?, ?, ?)",
-                (sku, nome, categoria)
-            )
-            produtos_criados += 1
-            logging.info(f"Produto criado: SKU={sku}, Nome={nome}")
 
-        cursor.execute(
-            "SELECT id FROM venda WHERE produto_sku = ? AND data = ?",
-            (sku, data)
-        )
-        if cursor.fetchone():
-            logging.warning(f"Venda já registrada para SKU={sku} em {data}. Ignorando.")
-            continue
+def importar_vendas_csv_incremental(conn: sqlite3.Connection, caminho_csv: Union[str, Path],
+                                    formato_data: str = FORMATO_DATA_CSV) -> Dict[str, Any]:
+    """
+    Importa um CSV de vendas consultando o manifesto de importações
+    (importacao_arquivo):
 
-        cursor.execute(
-            "INSERT INTO venda (data, quantidade, produto_sku) VALUES (?, ?, ?)",
-            (data, quantidade, sku)
-        )
-        vendas_inseridas += 1
-        total_linhas += 1
+    - tamanho e mtime iguais aos do manifesto: nada é lido ("inalterado");
+    - o conteúdo até o último offset importado não mudou: só as linhas
+      acrescentadas depois dele são importadas ("incremental");
+    - caso contrário (arquivo novo, truncado ou editado): importação completa.
+
+    Uma última linha sem '\n' pode estar sendo escrita e fica para a próxima
+    chamada; se nessa chamada o arquivo ainda tiver o mesmo tamanho e mtime,
+    ele é considerado estável e o fim do arquivo encerra a linha.
+    """
+    caminho = str(Path(caminho_csv).resolve())
+    info = os.stat(caminho)
+    manifesto = ImportacaoRepository.buscar_manifesto(conn, caminho)
+    resumo: Dict[str, Any] = {"caminho": caminho, "modo": "inalterado", "linhas_lidas": 0}
+
+    estavel = (manifesto is not None and manifesto["tamanho"] == info.st_size
+               and manifesto["mtime_ns"] == info.st_mtime_ns)
+    if estavel and manifesto["offset"] == info.st_size:
+        logging.info(f"{caminho} não mudou desde a última importação; nada a importar.")
+        return resumo
+
+    with open(caminho, "rb") as arquivo:
+        offset_novo = info.st_size if estavel else _fim_ultima_linha(arquivo, info.st_size)
+        offset_anterior = manifesto["offset"] if manifesto else 0
+        hash_anterior, hash_novo = _hash_prefixos(arquivo, offset_anterior, offset_novo)
+
+        if manifesto and hash_anterior == manifesto["hash"]:
+            inicio, linhas = offset_anterior, manifesto["linhas"]
+            if offset_novo > inicio:
+                resumo["modo"] = "incremental"
+        else:
+            inicio, linhas = 0, 0
+            resumo["modo"] = "completo"
 
-    conn.commit()
-    logging.info(f"Importação finalizada: {produtos_criados} produtos criados, {vendas_inseridas} vendas inseridas, {total_linhas} linhas processadas.")
+        if resumo["modo"] != "inalterado":
+            arquivo.seek(0)
+            cabecalho = arquivo.readline() if inicio > 0 else b""
+            arquivo.seek(inicio)
+            conteudo = io.BytesIO(cabecalho + arquivo.read(offset_novo - inicio))
+            df = pd.read_csv(conteudo, dtype={"id_produto": str})
+            resumo.update(importar_vendas_df(conn, df, formato_data))
+            linhas += len(df)
+
+    ImportacaoRepository.salvar_manifesto(
+        conn, caminho, info.st_size, info.st_mtime_ns, hash_novo, offset_novo, linhas
+    )
+    logging.info(
+        f"Importação {resumo['modo']} de {caminho}: {resumo['linhas_lidas']} linhas lidas "
+        f"a partir do byte {inicio} ({linhas} linhas no manifesto)."
+    )
+    return resumo
 
 def carregar_dados_do_banco(conn: sqlite3.Connection, sku: str) -> pd.DataFrame:
     """
@@ -85,83 +285,855 @@ def carregar_dados_do_banco(conn: sqlite3.Connection, sku: str) -> pd.DataFrame:
     df = df.drop(columns=['data'])
     return df
 
-def treinar_e_prever(df: pd.DataFrame) -> pd.DataFrame:
+def carregar_historico_em_lote(conn: sqlite3.Connection, skus: Optional[List[str]] = None) -> pd.DataFrame:
     """
-    Treina Prophet usando todo o histórico do DataFrame,
-    prevê os próximos N dias, e valida contra os últimos N dias reais se existirem.
+    Busca as vendas diárias de todos os SKUs (ou do subconjunto informado)
+    sem uma consulta por SKU. Retorna um DataFrame compacto, ordenado por SKU e dia:
+    produto_sku (category), dia (int32, dias desde 1970-01-01), quantidade (float32).
     """
-    df = df.sort_values('data_dia').reset_index(drop=True)
-
-    if len(df) > CONFIG["dias_prev"]:
-        df_treino = df[:-CONFIG["dias_prev"]].copy()
-        df_teste_real = df[-CONFIG["dias_prev"]:].copy()
+    query = f"""
+        SELECT v.produto_sku,
+               CAST(julianday(v.data) - {EPOCA_JULIANA} AS INTEGER) as dia,
+               SUM(v.quantidade) as quantidade
+        FROM venda v
+        {{filtro}}
+        GROUP BY v.produto_sku, v.data
+        ORDER BY v.produto_sku, v.data
+    """
+    if skus is None:
+        blocos = [pd.read_sql_query(query.format(filtro=""), conn)]
     else:
-        df_treino = df.copy()
-        df_teste_real = None
+        skus = [str(sku) for sku in skus]
+        blocos = []
+        for i in range(0, len(skus), MAX_PARAMETROS_SQL):
+            parte = skus[i:i + MAX_PARAMETROS_SQL]
+            filtro = f"WHERE v.produto_sku IN ({','.join('?' * len(parte))})"
+            blocos.append(pd.read_sql_query(query.format(filtro=filtro), conn, params=parte))
+
+    df = pd.concat(blocos, ignore_index=True) if blocos else pd.DataFrame(columns=['produto_sku', 'dia', 'quantidade'])
+    return df.astype({'produto_sku': 'category', 'dia': 'int32', 'quantidade': 'float32'})
+
+def iterar_historico_em_blocos(conn: sqlite3.Connection, skus: Optional[List[str]] = None,
+                               skus_por_bloco: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Percorre o histórico em blocos de SKUs (uma consulta por bloco), para que a
+    memória fique limitada ao tamanho do bloco mesmo em históricos muito grandes.
+    Cada bloco tem o formato de carregar_historico_em_lote.
+    """
+    if skus is None:
+        skus = [row[0] for row in conn.execute("SELECT DISTINCT produto_sku FROM venda ORDER BY produto_sku")]
+    skus_por_bloco = skus_por_bloco or CONFIG["skus_por_bloco"]
+
+    for i in range(0, len(skus), skus_por_bloco):
+        bloco = carregar_historico_em_lote(conn, skus[i:i + skus_por_bloco])
+        if not bloco.empty:
+            yield bloco
+
+def serie_do_sku(grupo: pd.DataFrame) -> pd.DataFrame:
+    """Converte as linhas de um SKU do histórico em lote para o formato de carregar_dados_do_banco."""
+    return pd.DataFrame({
+        'total_venda_dia_kg': grupo['quantidade'].to_numpy(dtype=np.float64),
+        'data_dia': pd.to_datetime(grupo['dia'].to_numpy(dtype=np.int64), unit='D'),
+    })
 
-    df_prophet = df_treino.rename(columns={'data_dia': 'ds', 'total_venda_dia_kg': 'y'})
+def calcular_fingerprint(df_prophet: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Resume os dados de treino (colunas ds, y) em quantidade de linhas,
+    data máxima e checksum, para detectar se o histórico de um SKU mudou.
+    """
+    dias = df_prophet['ds'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    valores = df_prophet['y'].to_numpy(dtype=np.float64)
+
+    checksum = hashlib.sha256()
+    checksum.update(dias.tobytes())
+    checksum.update(valores.tobytes())
+
+    return {
+        "linhas": int(len(df_prophet)),
+        "data_max": str(df_prophet['ds'].max().date()) if len(df_prophet) else None,
+        "checksum": checksum.hexdigest(),
+    }
+
+def _parametros_iniciais(registro: Dict[str, Any], df_prophet: pd.DataFrame):
+    """
+    Retorna os parâmetros (k, m, delta, beta, sigma_obs) do ajuste salvo para
+    iniciar o otimizador, ou None se o histórico anterior foi reescrito
+    (as primeiras linhas de hoje não batem com o fingerprint salvo).
+    """
+    anterior = {chave: registro["fingerprint"].get(chave) for chave in CHAVES_DADOS_FINGERPRINT}
+    linhas = anterior.get("linhas") or 0
+    if linhas == 0 or linhas > len(df_prophet):
+        return None
+    if calcular_fingerprint(df_prophet.iloc[:linhas]) != anterior:
+        return None
 
-    anos = df_prophet['ds'].dt.year.unique().tolist()
-    feriados = holidays.Brazil(years=anos)
-    feriados_df = pd.DataFrame([
-        {'holiday': 'feriado', 'ds': pd.to_datetime(date), 'lower_window': 0, 'upper_window': 1}
-        for date in feriados.keys()
-    ])
+    params = json.loads(registro["modelo"]).get("params")
+    if not params:
+        return None
 
+    # Dimensões diferentes (ex.: novos feriados) são trocadas pelo padrão pelo próprio Prophet
+    return {
+        'k': float(params['k'][0][0]),
+        'm': float(params['m'][0][0]),
+        'sigma_obs': float(params['sigma_obs'][0][0]),
+        'delta': np.asarray(params['delta'][0], dtype=float),
+        'beta': np.asarray(params['beta'][0], dtype=float),
+    }
+
+def _criar_modelo(feriados_df: pd.DataFrame,
+                  changepoint_prior_scale: float = PARAMETROS_PADRAO["changepoint_prior_scale"],
+                  fourier_order: int = PARAMETROS_PADRAO["fourier_order"]) -> Prophet:
     model = Prophet(
         yearly_seasonality=False,
         weekly_seasonality=True,
         daily_seasonality=False,
-        changepoint_prior_scale=0.01,
+        changepoint_prior_scale=changepoint_prior_scale,
         holidays=feriados_df
     )
-    model.add_seasonality(name='weekly_custom', period=7, fourier_order=3)
-    model.fit(df_prophet)
+    model.add_seasonality(name='weekly_custom', period=7, fourier_order=int(fourier_order))
+    return model
+
+def _tempo_restante(inicio: float) -> Dict[str, float]:
+    """Argumento timeout com o que sobra de CONFIG["tempo_max_ajuste_s"] desde inicio."""
+    if not CONFIG["tempo_max_ajuste_s"]:
+        return {}
+    restante = CONFIG["tempo_max_ajuste_s"] - (time.perf_counter() - inicio)
+    if restante <= 0:
+        raise TimeoutError(f"orçamento de {CONFIG['tempo_max_ajuste_s']}s esgotado")
+    return {'timeout': restante}
+
+def _atingiu_teto_iteracoes(model: Prophet, iteracoes_max: int) -> bool:
+    """
+    O cmdstan termina "normalmente" ao atingir o teto de iterações: o LBFGS
+    avisa na saída e o Newton apenas para de iterar, então a saída é lida.
+    """
+    try:
+        saida = Path(model.stan_fit.runset.stdout_files[0]).read_text()
+    except (AttributeError, IndexError, OSError):  # série constante: o Stan nem roda
+        return False
+    if "Maximum number of iterations hit" in saida:
+        return True
+    iteracoes = re.findall(r"^Iteration\s+(\d+)\.", saida, re.M)
+    return bool(iteracoes) and int(iteracoes[-1]) >= iteracoes_max
+
+def _ajustar_modelo(model: Prophet, df_prophet: pd.DataFrame, inicial: Optional[Dict[str, Any]] = None):
+    """
+    Ajusta o modelo respeitando CONFIG["tempo_max_ajuste_s"] e CONFIG["iteracoes_max_ajuste"].
+    O orçamento de tempo vale para o ajuste inteiro, inclusive a nova tentativa
+    com Newton quando o LBFGS termina com erro. Levanta TimeoutError se o
+    orçamento estourar e AjusteNaoConvergiu se o otimizador parar no teto de iterações.
+    """
+    argumentos: Dict[str, Any] = {}
+    if CONFIG["iteracoes_max_ajuste"]:
+        argumentos['iter'] = int(CONFIG["iteracoes_max_ajuste"])
+    if inicial is not None:
+        argumentos['init'] = inicial
+
+    # A troca de LBFGS por Newton é feita aqui, para descontar o tempo já gasto
+    model.stan_backend.newton_fallback = False
+    inicio = time.perf_counter()
+    try:
+        model.fit(df_prophet, **argumentos, **_tempo_restante(inicio))
+    except RuntimeError:
+        # Mesma regra do Prophet: com menos de 100 pontos o ajuste já usou Newton
+        if model.history is None or len(model.history) < 100:
+            raise
+        logging.warning("Otimização LBFGS terminou de forma anormal; tentando Newton com o tempo restante")
+        model.history = None  # o Prophet só aceita um fit por objeto
+        model.fit(df_prophet, algorithm='Newton', **argumentos, **_tempo_restante(inicio))
+
+    if CONFIG["iteracoes_max_ajuste"] and _atingiu_teto_iteracoes(model, int(CONFIG["iteracoes_max_ajuste"])):
+        raise AjusteNaoConvergiu(f"otimizador parou no teto de {CONFIG['iteracoes_max_ajuste']} iterações")
+
+def previsao_reserva(df_prophet: pd.DataFrame, dias_prev: int) -> pd.DataFrame:
+    """
+    Estimativa barata para quando o Prophet não cabe no orçamento: sazonal
+    ingênuo (média das últimas semanas no mesmo dia da semana) e, nos dias
+    sem histórico suficiente, a média geral do SKU.
+    A coluna metodo indica qual estimativa foi usada em cada dia.
+    """
+    serie = df_prophet.set_index('ds')['y'].asfreq('D')
+    inicio, fim = calendario.intervalo_em_dias(serie.index)
+    dias_semana = calendario.dias_da_semana(inicio, fim + dias_prev)
+    valores = serie.to_numpy(dtype=float)[None, :]
+
+    yhat = sazonal_ingenuo_vetorizado(valores, dias_semana[:-dias_prev], dias_semana[-dias_prev:])[0]
+    sem_sazonal = np.isnan(yhat)
+    media = float(np.nan_to_num(_media_sem_nan(valores, axis=1)[0]))
+    yhat = np.where(sem_sazonal, media, yhat)
+
+    desvio = float(np.nanstd(valores)) if np.isfinite(valores).sum() > 1 else 0.0
+    z = NormalDist().inv_cdf(0.5 + 0.8 / 2)  # mesma largura padrão do Prophet (interval_width=0.8)
+    return pd.DataFrame({
+        'ds': pd.date_range(serie.index[-1] + pd.Timedelta(days=1), periods=dias_prev, freq='D'),
+        'yhat': yhat,
+        'yhat_lower': yhat - z * desvio,
+        'yhat_upper': yhat + z * desvio,
+        'metodo': np.where(sem_sazonal, "media", "sazonal_ingenuo"),
+    })
+
+def prever_futuro(model: Prophet, dias_prev: int) -> pd.DataFrame:
+    """
+    Avalia o modelo apenas nos dias seguintes ao histórico de treino, sem as
+    ~1000 trajetórias simuladas do Prophet. O intervalo usa o ruído de
+    observação ajustado (sigma_obs) com a mesma largura de interval_width;
+    não inclui a incerteza da tendência.
+    """
+    inicio = model.history_dates.max() + pd.Timedelta(days=1)
+    future = pd.DataFrame({'ds': pd.date_range(inicio, periods=dias_prev, freq='D')})
 
-    future = model.make_future_dataframe(periods=CONFIG["dias_prev"])
+    amostras = model.uncertainty_samples
+    model.uncertainty_samples = 0
+    try:
+        forecast = model.predict(future)
+    finally:
+        model.uncertainty_samples = amostras
+
+    sigma = float(model.params['sigma_obs'][0][0]) * model.y_scale
+    z = NormalDist().inv_cdf(0.5 + model.interval_width / 2)
+    forecast['yhat_lower'] = forecast['yhat'] - z * sigma
+    forecast['yhat_upper'] = forecast['yhat'] + z * sigma
+    return forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
+
+def prever_com_modelo(model: Optional[Prophet], df_prophet: pd.DataFrame, dias_prev: int) -> pd.DataFrame:
+    """
+    Previsão dos dias_prev dias seguintes ao treino com o modelo ajustado
+    (prever_futuro ou, sem CONFIG["previsao_rapida"], o predict completo) ou,
+    se model for None, com previsao_reserva.
+    Retorna ds, yhat, yhat_lower, yhat_upper e metodo.
+    """
+    if model is None:
+        return previsao_reserva(df_prophet, dias_prev)
+    if CONFIG["previsao_rapida"]:
+        return prever_futuro(model, dias_prev).assign(metodo="prophet")
+
+    future = model.make_future_dataframe(periods=dias_prev)
     forecast = model.predict(future)
+    previsoes = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(dias_prev).reset_index(drop=True)
+    previsoes['metodo'] = "prophet"
+    return previsoes
+
+def _separar_validacao(df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """
+    Separa os últimos CONFIG["dias_prev"] dias para validação. Retorna o treino
+    no formato do Prophet (ds, y) e os dias reais separados (None se o
+    histórico for curto demais).
+    """
+    df = df.sort_values('data_dia').reset_index(drop=True)
+
+    if len(df) > CONFIG["dias_prev"]:
+        df_treino = df[:-CONFIG["dias_prev"]].copy()
+        df_teste_real = df[-CONFIG["dias_prev"]:].copy()
+    else:
+        df_treino = df.copy()
+        df_teste_real = None
+
+    return df_treino.rename(columns={'data_dia': 'ds', 'total_venda_dia_kg': 'y'}), df_teste_real
+
+def horizonte_de_previsao(dias_validacao: int) -> int:
+    """
+    Dias a prever contados do fim do treino: os dias separados para validação
+    e mais CONFIG["dias_prev"] dias depois da última venda, para que as
+    previsões gravadas cubram datas que ainda não têm venda.
+    """
+    return dias_validacao + CONFIG["dias_prev"]
+
+def treinar_e_prever(df: pd.DataFrame, sku: str = None,
+                     parametros: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """
+    Treina Prophet sem os últimos N dias do histórico, valida contra esses dias
+    reais (se existirem) e prevê até N dias depois da última venda
+    (horizonte_de_previsao); as linhas retornadas cobrem os dois trechos.
+    Se o SKU for informado e o histórico de treino não mudou desde o último ajuste,
+    o modelo salvo em disco é reaproveitado e apenas a previsão é executada;
+    se o histórico apenas recebeu novos dias, o ajuste parte dos parâmetros anteriores.
+    Se o ajuste estourar CONFIG["tempo_max_ajuste_s"] ou não convergir dentro de
+    CONFIG["iteracoes_max_ajuste"], usa previsao_reserva e não salva o modelo.
+    parametros sobrepõe PARAMETROS_PADRAO (changepoint_prior_scale, fourier_order)
+    e faz parte do fingerprint do modelo salvo, junto com a região e os feriados.
+    Retorna ds, yhat, yhat_lower, yhat_upper e metodo ("prophet" ou o da reserva).
+    """
+    df_prophet, df_teste_real = _separar_validacao(df)
+
+    usar_cache = sku is not None and CONFIG["cache_modelos"]
+    parametros = {**PARAMETROS_PADRAO, **(parametros or {})}
+    anos = df_prophet['ds'].dt.year.unique()
+    fingerprint = {
+        **calcular_fingerprint(df_prophet),
+        "parametros": parametros,
+        "regiao": CONFIG["regiao"],
+        "feriados": calendario.assinatura_feriados(anos, CONFIG["regiao"]),
+    }
+    model = None
+    inicial = None
 
-    previsoes = forecast[['ds', 'yhat']].tail(CONFIG["dias_prev"]).reset_index(drop=True)
+    if usar_cache:
+        registro = ModeloRepository.buscar_modelo(sku, CONFIG["modelos_dir"])
+        if registro is not None and registro["fingerprint"] == fingerprint:
+            model = model_from_json(registro["modelo"])
+            logging.info(f"Modelo reaproveitado para SKU={sku} (histórico inalterado)")
+        elif registro is not None and CONFIG["ajuste_incremental"]:
+            inicial = _parametros_iniciais(registro, df_prophet)
 
-    if df_teste_real is not None and len(df_teste_real) == CONFIG["dias_prev"]:
-        previsoes['real'] = df_teste_real['total_venda_dia_kg'].values
-        previsoes['erro_abs'] = (previsoes['yhat'] - previsoes['real']).abs()
-        mae = previsoes['erro_abs'].mean()
-        rmse = np.sqrt(mean_squared_error(previsoes['real'], previsoes['yhat']))
+    if model is None:
+        feriados_df = calendario.feriados_dos_anos(anos, CONFIG["regiao"])
+
+        model = _criar_modelo(feriados_df, **parametros)
+        if inicial is not None:
+            logging.info(f"Ajuste incremental para SKU={sku} a partir dos parâmetros anteriores")
+        try:
+            _ajustar_modelo(model, df_prophet, inicial)
+        except TimeoutError:
+            logging.warning(
+                f"Ajuste do SKU={sku} excedeu {CONFIG['tempo_max_ajuste_s']}s; usando previsão de reserva"
+            )
+            model = None
+        except AjusteNaoConvergiu as e:
+            logging.warning(f"Ajuste do SKU={sku} não convergiu ({e}); usando previsão de reserva")
+            model = None
+
+        if model is not None and usar_cache:
+            ModeloRepository.salvar_modelo(sku, fingerprint, model_to_json(model), CONFIG["modelos_dir"])
+
+    dias_validacao = len(df_teste_real) if df_teste_real is not None else 0
+    previsoes = prever_com_modelo(model, df_prophet, horizonte_de_previsao(dias_validacao))
+
+    if dias_validacao == CONFIG["dias_prev"]:
+        validacao = previsoes.head(dias_validacao).copy()
+        validacao['real'] = df_teste_real['total_venda_dia_kg'].values
+        validacao['erro_abs'] = (validacao['yhat'] - validacao['real']).abs()
+        mae = validacao['erro_abs'].mean()
+        rmse = np.sqrt(mean_squared_error(validacao['real'], validacao['yhat']))
 
         logging.info("\n🔎 Validação dos últimos 7 dias:")
-        for i, row in previsoes.iterrows():
+        for i, row in validacao.iterrows():
             logging.info(f"{row['ds'].date()} | Previsto: {row['yhat']:.2f} | Real: {row['real']:.2f} | Erro: {row['erro_abs']:.2f}")
         logging.info(f"\nMAE: {mae:.2f} kg | RMSE: {rmse:.2f} kg")
 
-    return previsoes[['ds', 'yhat']]
+    return previsoes[['ds', 'yhat', 'yhat_lower', 'yhat_upper', 'metodo']]
+
+def carregar_matriz_vendas(conn: sqlite3.Connection, skus: List[str]) -> Tuple[List[str], pd.DatetimeIndex, np.ndarray]:
+    """
+    Monta, a partir do histórico em lote, a matriz SKU × dia dos SKUs
+    informados (NaN nos dias sem venda registrada).
+    Retorna (skus, datas, matriz), com as linhas na ordem de skus.
+    """
+    historico = carregar_historico_em_lote(conn, skus)
+    if historico.empty:
+        return [], pd.DatetimeIndex([]), np.empty((0, 0))
+
+    historico['produto_sku'] = historico['produto_sku'].cat.remove_unused_categories()
+    linhas = historico['produto_sku'].cat.codes.to_numpy()
+    primeiro_dia = int(historico['dia'].min())
+    colunas = historico['dia'].to_numpy() - primeiro_dia
+
+    matriz = np.full((len(historico['produto_sku'].cat.categories), colunas.max() + 1), np.nan)
+    matriz[linhas, colunas] = historico['quantidade'].to_numpy(dtype=np.float64)
+
+    datas = pd.date_range(pd.Timestamp(primeiro_dia, unit='D'), periods=matriz.shape[1], freq='D')
+    return list(historico['produto_sku'].cat.categories), datas, matriz
+
+def _media_sem_nan(valores: np.ndarray, axis: int) -> np.ndarray:
+    """np.nanmean sem o aviso de fatia vazia (linhas sem dados viram NaN)."""
+    contagem = np.sum(~np.isnan(valores), axis=axis)
+    soma = np.nansum(valores, axis=axis)
+    return np.divide(soma, contagem, out=np.full(soma.shape, np.nan), where=contagem > 0)
+
+def holt_winters_vetorizado(matriz: np.ndarray, dias_semana: np.ndarray,
+                            dias_semana_futuros: np.ndarray) -> np.ndarray:
+    """
+    Holt-Winters aditivo com tendência amortecida e sazonalidade semanal,
+    aplicado a todas as linhas da matriz ao mesmo tempo (o laço é só no tempo).
+    Dias sem venda (NaN) não atualizam os estados.
+    Retorna um array (n_skus, horizonte).
+    """
+    alpha, beta = CONFIG["hw_alpha"], CONFIG["hw_beta"]
+    gamma, phi = CONFIG["hw_gamma"], CONFIG["hw_phi"]
+    n = matriz.shape[0]
+    linhas = np.arange(n)
+
+    # Estado inicial: desvio médio de cada dia da semana em relação à média do SKU
+    media = _media_sem_nan(matriz, axis=1)
+    sazonal = np.zeros((n, 7))
+    for dia in range(7):
+        colunas = dias_semana == dia
+        if colunas.any():
+            sazonal[:, dia] = _media_sem_nan(matriz[:, colunas], axis=1) - media
+    sazonal = np.nan_to_num(sazonal)
+
+    nivel = np.full(n, np.nan)
+    tendencia = np.zeros(n)
+
+    for t in range(matriz.shape[1]):
+        y = matriz[:, t]
+        dia = dias_semana[t]
+        valido = ~np.isnan(y)
+
+        inicio = valido & np.isnan(nivel)
+        nivel[inicio] = y[inicio] - sazonal[inicio, dia]
+
+        previsto = nivel + phi * tendencia
+        atualiza = valido & ~inicio
+        novo_nivel = alpha * (y - sazonal[:, dia]) + (1 - alpha) * previsto
+        nova_tendencia = beta * (novo_nivel - nivel) + (1 - beta) * phi * tendencia
+        novo_sazonal = gamma * (y - novo_nivel) + (1 - gamma) * sazonal[:, dia]
+
+        sem_dado = ~valido & ~np.isnan(nivel)
+        nivel = np.where(atualiza, novo_nivel, np.where(sem_dado, previsto, nivel))
+        tendencia = np.where(atualiza, nova_tendencia, np.where(sem_dado, phi * tendencia, tendencia))
+        sazonal[linhas[atualiza], dia] = novo_sazonal[atualiza]
+
+    amortecimento = np.cumsum(phi ** np.arange(1, len(dias_semana_futuros) + 1))
+    return nivel[:, None] + amortecimento[None, :] * tendencia[:, None] + sazonal[:, dias_semana_futuros]
+
+def sazonal_ingenuo_vetorizado(matriz: np.ndarray, dias_semana: np.ndarray,
+                               dias_semana_futuros: np.ndarray) -> np.ndarray:
+    """Média das últimas N ocorrências do mesmo dia da semana, para todos os SKUs."""
+    janela = 7 * CONFIG["semanas_sazonal_ingenuo"]
+    recente = matriz[:, -janela:]
+    dias_recentes = dias_semana[-janela:]
+
+    por_dia = np.full((matriz.shape[0], 7), np.nan)
+    for dia in range(7):
+        colunas = dias_recentes == dia
+        if colunas.any():
+            por_dia[:, dia] = _media_sem_nan(recente[:, colunas], axis=1)
+    return por_dia[:, dias_semana_futuros]
+
+def previsao_vetorizada(treino: np.ndarray, datas_treino: pd.DatetimeIndex,
+                        horizonte: int) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+    """
+    Prevê os `horizonte` dias seguintes a datas_treino para todas as linhas da
+    matriz de treino, misturando Holt-Winters e sazonal ingênuo.
+    Retorna (datas_futuras, yhat) com yhat de forma (n_skus, horizonte).
+    """
+    treino = treino[:, -CONFIG["janela_vetorizado"]:]
+    datas_treino = datas_treino[-CONFIG["janela_vetorizado"]:]
+    datas_futuras = pd.date_range(datas_treino[-1] + pd.Timedelta(days=1), periods=horizonte, freq='D')
+
+    inicio, fim = calendario.intervalo_em_dias(datas_treino)
+    dias_semana = calendario.dias_da_semana(inicio, fim + horizonte)
+    dias_semana, dias_semana_futuros = dias_semana[:-horizonte], dias_semana[-horizonte:]
+
+    # Feriados não atualizam nível nem sazonalidade (são tratados como dias sem dado)
+    feriado = calendario.mascara_feriados(inicio, fim, CONFIG["regiao"])
+    if feriado.any():
+        treino = np.where(feriado[None, :], np.nan, treino)
+
+    hw = holt_winters_vetorizado(treino, dias_semana, dias_semana_futuros)
+    ingenuo = sazonal_ingenuo_vetorizado(treino, dias_semana, dias_semana_futuros)
+
+    peso = CONFIG["peso_sazonal_ingenuo"]
+    yhat = np.where(np.isnan(ingenuo), hw, peso * ingenuo + (1 - peso) * hw)
+    return datas_futuras, np.clip(yhat, 0, None)
+
+def prever_vetorizado(skus: List[str], datas: pd.DatetimeIndex, matriz: np.ndarray) -> pd.DataFrame:
+    """
+    Motor rápido: prevê todos os SKUs da matriz em uma única passada NumPy.
+    Usa o mesmo recorte de validação de treinar_e_prever (treina sem os
+    últimos N dias, os prevê e segue até N dias depois da última venda).
+    Retorna um DataFrame longo com colunas produto_sku, ds, yhat, yhat_lower,
+    yhat_upper, metodo.
+    """
+    dias_prev = CONFIG["dias_prev"]
+    if matriz.shape[1] > dias_prev:
+        treino, real = matriz[:, :-dias_prev], matriz[:, -dias_prev:]
+        datas_treino = datas[:-dias_prev]
+    else:
+        treino, real = matriz, None
+        datas_treino = datas
+
+    horizonte = horizonte_de_previsao(real.shape[1] if real is not None else 0)
+    datas_futuras, yhat = previsao_vetorizada(treino, datas_treino, horizonte)
+
+    # Intervalo de 80% a partir da escala dos resíduos de validação de cada SKU
+    desvio = np.full(len(skus), np.nan)
+    if real is not None:
+        residuos = yhat[:, :dias_prev] - real
+        logging.info(f"Motor vetorizado: {len(skus)} SKUs | MAE validação: {np.nanmean(np.abs(residuos)):.2f} kg")
+        desvio = np.sqrt(_media_sem_nan(residuos ** 2, axis=1))
+    margem = NormalDist().inv_cdf(0.9) * desvio[:, None]
+
+    previsoes = pd.DataFrame({
+        'produto_sku': np.repeat(np.asarray(skus, dtype=object), horizonte),
+        'ds': np.tile(datas_futuras.to_numpy(), len(skus)),
+        'yhat': yhat.ravel(),
+        'yhat_lower': (yhat - margem).ravel(),
+        'yhat_upper': (yhat + margem).ravel(),
+        'metodo': "vetorizado",
+    })
+    return previsoes.dropna(subset=['yhat'])
+
+def escolher_motor(sku: str, volume_medio: float) -> str:
+    """Motor de previsão do SKU conforme CONFIG["motor_por_sku"] e CONFIG["motor"]."""
+    motor = CONFIG["motor_por_sku"].get(str(sku), CONFIG["motor"])
+    if motor == "auto":
+        motor = "prophet" if volume_medio >= CONFIG["volume_min_prophet"] else CONFIG["motor_baixo_volume"]
+    return motor
 
 def salvar_previsoes(conn: sqlite3.Connection, sku: str, nome_produto: str, previsoes: pd.DataFrame):
-    for _, row in previsoes.iterrows():
-        PrevisaoRepository.salvar_previsao_no_banco(
-            conn=conn,
-            sku=sku,
-            nome_produto=nome_produto,
-            categoria_produto="Frango",
-            data_prevista=pd.Timestamp(row['ds']),
-            quantidade_prevista=row['yhat']
-        )
+    conn.execute(
+        "INSERT OR IGNORE INTO produto (sku, nome, categoria) VALUES (?, ?, ?)",
+        (str(sku), nome_produto, "Frango")
+    )
+    PrevisaoRepository.salvar_previsoes_em_lote(conn, _com_sku(previsoes, sku))
 
-def prever(conn: sqlite3.Connection):
-    produtos = ProdutoRepository.buscar_produtos(conn)
+def _com_sku(previsoes: pd.DataFrame, sku: str) -> pd.DataFrame:
+    return previsoes[['ds', 'yhat', 'yhat_lower', 'yhat_upper', 'metodo']].assign(produto_sku=str(sku))
 
-    for produto in produtos:
-        sku = produto['sku']
-        nome = produto['nome']
+def _inicializar_worker(config: Dict[str, Any]):
+    """
+    Prepara um processo do pool: aplica a cópia do CONFIG de quem criou o pool
+    (processos spawn reimportam este módulo com o CONFIG padrão), o limite de
+    memória, restringe o BLAS a uma thread e carrega o backend Stan uma única
+    vez por processo.
+    """
+    CONFIG.update(config)
+    memoria_max_mb = CONFIG["memoria_max_mb_worker"]
+    if memoria_max_mb and resource is not None:
+        limite = int(memoria_max_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    # Instanciar o Prophet compila/carrega o modelo Stan; o processo fica "quente"
+    Prophet()
+
+def _prever_sku(sku: str, df: pd.DataFrame, parametros: Optional[Dict[str, Any]] = None):
+    """Executado no worker: devolve (sku, previsoes, erro)."""
+    try:
+        return sku, treinar_e_prever(df, sku, parametros), None
+    except Exception as e:
+        return sku, None, f"{type(e).__name__}: {e}"
+
+def _iterar_series(conn: sqlite3.Connection, produtos) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """Gera (sku, df) de cada produto com vendas, lendo o histórico em blocos de SKUs."""
+    skus = [str(produto['sku']) for produto in produtos]
+    com_vendas = set()
 
-        df = carregar_dados_do_banco(conn, sku)
-        if df.empty:
+    for bloco in iterar_historico_em_blocos(conn, skus):
+        for sku, grupo in bloco.groupby('produto_sku', observed=True, sort=False):
+            com_vendas.add(sku)
+            yield sku, serie_do_sku(grupo)
+
+    for sku in skus:
+        if sku not in com_vendas:
             logging.warning(f"Nenhuma venda encontrada para SKU={sku}")
+
+def _coletar_resultados(futuros, pendentes: Dict[Any, Tuple[str, pd.DataFrame]],
+                        coletadas: List[pd.DataFrame], ao_concluir: Callable[[str, bool], None]) -> bool:
+    """
+    Junta os resultados dos futuros concluídos e os tira de pendentes.
+    Retorna False se algum worker morreu (ex.: pelo limite de memória); os
+    futuros afetados continuam em pendentes.
+    """
+    intacto = True
+    for futuro in futuros:
+        try:
+            sku, previsoes, erro = futuro.result()
+        except BrokenProcessPool:
+            intacto = False
+            continue
+        del pendentes[futuro]
+        if erro is not None:
+            logging.error(f"Falha ao prever SKU={sku}: {erro}")
+            ao_concluir(sku, False)
             continue
+        coletadas.append(_com_sku(previsoes, sku))
+        logging.info(f"Previsões calculadas para SKU={sku}")
+        ao_concluir(sku, True)
+    return intacto
+
+def _prever_reserva(series, coletadas: List[pd.DataFrame], ao_concluir: Callable[[str, bool], None]) -> List[str]:
+    """
+    Previsão de reserva, no processo principal, para os SKUs cujo worker morreu.
+    As linhas saem com metodo METODO_RESERVA_WORKER e os SKUs contam como falha
+    (a previsão é gravada, mas não é a do Prophet). Retorna os SKUs atendidos.
+    """
+    atendidos = []
+    for sku, df in series:
+        logging.warning(f"Worker encerrado durante o SKU={sku} (ex.: limite de memória); usando previsão de reserva")
+        try:
+            df_prophet, df_teste_real = _separar_validacao(df)
+            horizonte = horizonte_de_previsao(len(df_teste_real) if df_teste_real is not None else 0)
+            previsoes = previsao_reserva(df_prophet, horizonte).assign(metodo=METODO_RESERVA_WORKER)
+            coletadas.append(_com_sku(previsoes, sku))
+            atendidos.append(sku)
+        except Exception as e:
+            logging.error(f"Falha ao prever SKU={sku}: {type(e).__name__}: {e}")
+        ao_concluir(sku, False)
+    return atendidos
+
+def _prever_paralelo(conn: sqlite3.Connection, produtos, workers: int, coletadas: List[pd.DataFrame],
+                     ao_concluir: Callable[[str, bool], None],
+                     parametros_por_sku: Optional[Dict[str, Dict[str, Any]]] = None) -> List[str]:
+    """
+    Distribui treinar_e_prever entre processos e junta os resultados em
+    coletadas; apenas o processo principal escreve no SQLite. O número de
+    séries em trânsito é limitado para que a memória não cresça com o catálogo.
+    Os workers recebem uma cópia do CONFIG atual. Se um worker morre (o pool
+    fica quebrado), os SKUs em trânsito usam _prever_reserva e os restantes
+    seguem num pool novo. Retorna os SKUs que ficaram com a previsão de reserva.
+    """
+    contexto = multiprocessing.get_context("spawn")
+    parametros_por_sku = parametros_por_sku or {}
+    series = _iterar_series(conn, produtos)
+    reservas: List[str] = []
+
+    while True:
+        pendentes: Dict[Any, Tuple[str, pd.DataFrame]] = {}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=contexto,
+            initializer=_inicializar_worker,
+            initargs=(copy.deepcopy(CONFIG),),
+            max_tasks_per_child=CONFIG["tarefas_por_worker"],
+        ) as executor:
+            try:
+                intacto = True
+                for sku, df in series:
+                    try:
+                        futuro = executor.submit(_prever_sku, sku, df, parametros_por_sku.get(sku))
+                    except BrokenProcessPool:
+                        series = itertools.chain([(sku, df)], series)
+                        intacto = False
+                        break
+                    pendentes[futuro] = (sku, df)
+                    if len(pendentes) >= workers * 4:
+                        concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                        if not _coletar_resultados(concluidos, pendentes, coletadas, ao_concluir):
+                            intacto = False
+                            break
+
+                restantes = as_completed(list(pendentes))
+                intacto = _coletar_resultados(restantes, pendentes, coletadas, ao_concluir) and intacto
+            except BaseException:
+                # Interrupção (ex.: cancelamento): descarta o que ainda não começou
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+        if intacto:
+            return reservas
+        reservas.extend(_prever_reserva(pendentes.values(), coletadas, ao_concluir))
+        logging.warning("Pool de processos quebrado; os SKUs restantes seguem num pool novo")
+
+def _prever_motor_vetorizado(conn: sqlite3.Connection, produtos, coletadas: List[pd.DataFrame],
+                             agregadas: Optional[List[pd.DataFrame]] = None) -> list:
+    """
+    Prevê com os motores vetorizado e hierárquico os SKUs que não usam Prophet
+    (resultados em coletadas; os níveis total/categoria do hierárquico vão para
+    agregadas) e devolve a lista de produtos que ainda precisam do Prophet.
+    """
+    motores = set(CONFIG["motor_por_sku"].values()) | {CONFIG["motor"]}
+    if motores == {"prophet"}:
+        return produtos
+
+    skus, datas, matriz = carregar_matriz_vendas(conn, [produto['sku'] for produto in produtos])
+    if not skus:
+        return produtos
+
+    volumes = _media_sem_nan(matriz[:, -28:], axis=1)
+    motor_do_sku = {sku: escolher_motor(sku, np.nan_to_num(volumes[i])) for i, sku in enumerate(skus)}
+    linha = {sku: i for i, sku in enumerate(skus)}
+    vetorizados = [sku for sku in skus if motor_do_sku[sku] == "vetorizado"]
+    hierarquicos = {sku for sku in skus if motor_do_sku[sku] == "hierarquico"}
+
+    if vetorizados:
+        indices = [linha[sku] for sku in vetorizados]
+        coletadas.append(prever_vetorizado(vetorizados, datas, matriz[indices]))
+        logging.info(f"Previsões do motor vetorizado calculadas para {len(vetorizados)} SKUs")
+
+    if hierarquicos:
+        from src import hierarquia  # importado aqui: hierarquia depende deste módulo
+
+        niveis = hierarquia.prever_hierarquico(conn)
+        do_sku = niveis[(niveis['nivel'] == 'sku') & niveis['chave'].isin(hierarquicos)]
+        coletadas.append(do_sku.rename(columns={'chave': 'produto_sku'}).drop(columns='nivel'))
+        if agregadas is not None:
+            agregadas.append(niveis[niveis['nivel'] != 'sku'])
+        logging.info(f"Previsões do motor hierárquico calculadas para {len(hierarquicos)} SKUs")
+
+    feitos = set(vetorizados) | hierarquicos
+    return [produto for produto in produtos if str(produto['sku']) not in feitos]
+
+def decidir_reajustes(conn: sqlite3.Connection, produtos=None) -> List[Dict[str, Any]]:
+    """
+    Decide, para cada produto, se o modelo precisa ser reajustado nesta rodada.
+    Motivos de reajuste: "sem_ajuste" (nunca ajustado), "historico_alterado"
+    (as vendas recuaram ou sumiram, ou vendas já usadas no ajuste foram
+    reenviadas com outros valores), "horizonte" (as vendas chegaram a
+    horizonte_fim e não resta previsão gravada para datas sem venda), "idade"
+    (CONFIG["dias_max_sem_ajuste"] dias de vendas novas desde o ajuste) e
+    "erro" (WAPE das vendas chegadas depois do ajuste contra as previsões
+    gravadas para essas datas acima de CONFIG["limite_erro_reajuste"]).
+    SKUs em dia recebem motivo "em_dia" e os sem nenhuma venda "sem_vendas",
+    ambos com reajustar=False.
+    """
+    if produtos is None:
+        produtos = ProdutoRepository.buscar_produtos(conn)
+
+    estados = EstadoPrevisaoRepository.buscar_estados(conn)
+    ultimas = EstadoPrevisaoRepository.ultimas_vendas(conn)
+    erros = EstadoPrevisaoRepository.calcular_erros(conn, CONFIG["janela_erro_dias"])
+
+    decisoes = []
+    for produto in produtos:
+        sku = str(produto['sku'])
+        estado = estados.get(sku)
+        ultima = ultimas.get(sku)
+        erro, dias_avaliados = erros.get(sku, (None, 0))
+
+        dias_sem_ajuste = None
+        if estado is not None and ultima is not None and estado["data_historico"] is not None:
+            dias_sem_ajuste = (pd.Timestamp(ultima) - pd.Timestamp(estado["data_historico"])).days
+
+        if ultima is None and estado is None:
+            motivo = "sem_vendas"
+        elif estado is None:
+            motivo = "sem_ajuste"
+        elif dias_sem_ajuste is None or dias_sem_ajuste < 0 or estado["historico_alterado"]:
+            motivo = "historico_alterado"
+        elif pd.Timestamp(ultima) >= pd.Timestamp(estado["horizonte_fim"]):
+            motivo = "horizonte"
+        elif dias_sem_ajuste >= CONFIG["dias_max_sem_ajuste"]:
+            motivo = "idade"
+        elif (dias_sem_ajuste > 0 and erro is not None and dias_avaliados >= CONFIG["min_dias_erro"]
+              and erro > CONFIG["limite_erro_reajuste"]):
+            motivo = "erro"
+        else:
+            motivo = "em_dia"
+
+        decisoes.append({
+            "sku": sku,
+            "reajustar": motivo not in ("em_dia", "sem_vendas"),
+            "motivo": motivo,
+            "erro": round(erro, 4) if erro is not None else None,
+            "dias_avaliados": dias_avaliados,
+            "dias_sem_ajuste": dias_sem_ajuste,
+            "ultima_venda": ultima,
+            "data_ajuste": estado["data_ajuste"] if estado else None,
+            "horizonte_fim": estado["horizonte_fim"] if estado else None,
+        })
+    return decisoes
+
+def prever(conn: sqlite3.Connection, workers: int = None,
+           progresso: Optional[Callable[[int, int, List[str]], None]] = None) -> int:
+    """
+    Treina e salva previsões para todos os produtos.
+    SKUs atribuídos ao motor vetorizado (CONFIG["motor"]/["motor_por_sku"]) são
+    previstos juntos; os demais seguem pelo Prophet.
+    Com workers > 1 (ou CONFIG["workers"] > 1) os ajustes Prophet rodam em um pool de processos.
+    Todas as previsões são gravadas ao final, em uma única transação.
+    Com CONFIG["reajuste_seletivo"], só os SKUs apontados por decidir_reajustes
+    são previstos de novo; os demais mantêm as previsões gravadas.
+
+    Cada chamada é registrada em previsao_execucao (motor, CONFIG com o workers
+    efetivo, tempos por etapa e contagens) e suas previsões ficam também em
+    previsao_historico. Se algum worker morre, os SKUs afetados contam como
+    falha e a execução termina como 'degradada'. As tabelas de execução, estado
+    e previsões agregadas vêm das migrações (src/migracoes.py).
+
+    progresso, se informado, é chamado como progresso(concluidos, total, skus_com_falha)
+    a cada SKU; uma exceção lançada por ele interrompe a rodada sem gravar nada.
+
+    Returns:
+        int: id da execução em previsao_execucao.
+    """
+    produtos = ProdutoRepository.buscar_produtos(conn)
+    workers = workers or CONFIG["workers"]
+    total = len(produtos)
+    falhas: List[str] = []
+    concluidos = 0
+
+    def ao_concluir(sku: str, sucesso: bool, quantidade: int = 1):
+        nonlocal concluidos
+        concluidos += quantidade
+        if not sucesso:
+            falhas.append(sku)
+        if progresso is not None:
+            progresso(concluidos, total, falhas)
+
+    execucao_id = ExecucaoRepository.iniciar_execucao(conn, CONFIG["motor"], {**CONFIG, "workers": workers})
+    etapas: Dict[str, float] = {}
+
+    try:
+        inicio = time.perf_counter()
+        if CONFIG["reajuste_seletivo"]:
+            decisoes = decidir_reajustes(conn, produtos)
+            EstadoPrevisaoRepository.registrar_avaliacoes(conn, decisoes)
+            reajustar = {d["sku"] for d in decisoes if d["reajustar"]}
+            produtos = [produto for produto in produtos if str(produto['sku']) in reajustar]
+            logging.info(f"Reajuste seletivo: {len(produtos)} de {total} SKUs serão reajustados")
+            if len(produtos) < total:
+                ao_concluir(None, True, total - len(produtos))
+        etapas["selecao"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        coletadas: List[pd.DataFrame] = []
+        agregadas: List[pd.DataFrame] = []
+        pendentes = len(produtos)
+        produtos = _prever_motor_vetorizado(conn, produtos, coletadas, agregadas)
+        if len(produtos) < pendentes:
+            ao_concluir(None, True, pendentes - len(produtos))
+        etapas["vetorizado"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        parametros_por_sku = {}
+        reservas: List[str] = []
+        if CONFIG["hiperparametros_por_sku"] and produtos:
+            parametros_por_sku = HiperparametroRepository.buscar_vencedores(conn)
+        if workers > 1:
+            reservas = _prever_paralelo(conn, produtos, workers, coletadas, ao_concluir, parametros_por_sku)
+        else:
+            for sku, df in _iterar_series(conn, produtos):
+                try:
+                    previsoes = treinar_e_prever(df, sku, parametros_por_sku.get(sku))
+                    coletadas.append(_com_sku(previsoes, sku))
+                except Exception as e:
+                    logging.error(f"Falha ao prever SKU={sku}: {type(e).__name__}: {e}")
+                    ao_concluir(sku, False)
+                    continue
+                logging.info(f"Previsões calculadas para SKU={sku}")
+                ao_concluir(sku, True)
+        if produtos and CONFIG["cache_modelos"] and CONFIG["modelos_max_mb"]:
+            ModeloRepository.remover_excedentes(CONFIG["modelos_dir"], CONFIG["modelos_max_mb"])
+        etapas["prophet"] = time.perf_counter() - inicio
+
+        # Escrita única, em uma transação, de todas as previsões da rodada
+        inicio = time.perf_counter()
+        alteradas = 0
+        previstos = 0
+        if coletadas:
+            todas = pd.concat(coletadas, ignore_index=True)
+            alteradas = PrevisaoRepository.salvar_previsoes_em_lote(conn, todas, execucao_id)
+            horizontes = pd.to_datetime(todas['ds']).groupby(todas['produto_sku']).max().dt.strftime("%Y-%m-%d")
+            EstadoPrevisaoRepository.registrar_ajustes(conn, horizontes.to_dict())
+            previstos = len(horizontes)
+        if agregadas:
+            PrevisaoRepository.salvar_previsoes_agregadas(conn, pd.concat(agregadas, ignore_index=True), execucao_id)
+        etapas["gravacao"] = time.perf_counter() - inicio
+    except BaseException as e:
+        ExecucaoRepository.finalizar_execucao(
+            conn, execucao_id, "interrompida", etapas, total, skus_falha=len(falhas),
+            erro=f"{type(e).__name__}: {e}"
+        )
+        raise
+
+    # Com workers perdidos a rodada termina, mas parte dela saiu da previsão de reserva
+    status = "degradada" if reservas else "concluida"
+    ExecucaoRepository.finalizar_execucao(
+        conn, execucao_id, status, etapas, total, previstos, len(falhas), alteradas
+    )
 
-        previsoes = treinar_e_prever(df)
-        salvar_previsoes(conn, sku, nome, previsoes)
-        logging.info(f"Previsões salvas no banco para SKU={sku}")
+    # SKUs sem vendas não passam pelos motores, mas contam como processados
+    if progresso is not None:
+        progresso(total, total, falhas)
+    return execucao_id
 
 def executar_rotina_previsao(conn: sqlite3.Connection):
     prever(conn)
\ No newline at end of file
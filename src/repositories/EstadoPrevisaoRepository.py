@@ -0,0 +1,144 @@
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Tuple
+
+COLUNAS_ADICIONAIS = {
+    # 1 quando vendas até data_historico mudaram depois do ajuste (gatilhos em venda)
+    "historico_alterado": "INTEGER NOT NULL DEFAULT 0",
+}
+
+# Marca o SKU quando uma venda já conhecida no ajuste é inserida, alterada ou
+# removida (reenvios com ON CONFLICT DO UPDATE); {r} é NEW ou OLD
+_MARCAR_HISTORICO = """
+    UPDATE estado_previsao SET historico_alterado = 1
+    WHERE produto_sku = {r}.produto_sku AND {r}.data <= data_historico AND historico_alterado = 0;
+"""
+
+GATILHOS = [
+    f"CREATE TRIGGER IF NOT EXISTS trg_venda_historico_ins AFTER INSERT ON venda BEGIN "
+    f"{_MARCAR_HISTORICO.format(r='NEW')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_venda_historico_del AFTER DELETE ON venda BEGIN "
+    f"{_MARCAR_HISTORICO.format(r='OLD')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_venda_historico_upd AFTER UPDATE OF data, quantidade, produto_sku ON venda "
+    f"WHEN OLD.quantidade IS NOT NEW.quantidade OR OLD.data IS NOT NEW.data OR OLD.produto_sku IS NOT NEW.produto_sku "
+    f"BEGIN {_MARCAR_HISTORICO.format(r='OLD')} {_MARCAR_HISTORICO.format(r='NEW')} END",
+]
+
+
+def criar_tabela(conn: sqlite3.Connection):
+    """Cria a tabela com o estado do último ajuste de cada SKU, se ainda não existir (sem commit)."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS estado_previsao (
+            produto_sku TEXT PRIMARY KEY,
+            data_ajuste TEXT NOT NULL,      -- quando o modelo foi ajustado
+            data_historico DATE,            -- última venda conhecida no ajuste
+            horizonte_fim DATE NOT NULL,    -- última data prevista
+            erro REAL,                      -- WAPE recente das previsões contra as vendas
+            dias_avaliados INTEGER NOT NULL DEFAULT 0,
+            motivo TEXT,                    -- última decisão de reajuste
+            avaliado_em TEXT,
+            historico_alterado INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (produto_sku) REFERENCES produto(sku)
+        )
+        """
+    )
+
+
+def garantir_colunas_e_gatilhos(conn: sqlite3.Connection):
+    """Colunas novas de estado_previsao e os gatilhos que marcam histórico alterado (sem commit)."""
+    existentes = {row[1] for row in conn.execute("PRAGMA table_info(estado_previsao)")}
+    for coluna, tipo in COLUNAS_ADICIONAIS.items():
+        if coluna not in existentes:
+            conn.execute(f"ALTER TABLE estado_previsao ADD COLUMN {coluna} {tipo}")
+            logging.info(f"Coluna estado_previsao.{coluna} criada")
+    for sql in GATILHOS:
+        conn.execute(sql)
+
+
+def buscar_estados(conn: sqlite3.Connection) -> Dict[str, Dict]:
+    cursor = conn.execute("SELECT * FROM estado_previsao")
+    cursor.row_factory = sqlite3.Row
+    return {row["produto_sku"]: dict(zip(row.keys(), row)) for row in cursor}
+
+
+def ultimas_vendas(conn: sqlite3.Connection) -> Dict[str, str]:
+    """Data da última venda de cada SKU."""
+    cursor = conn.execute("SELECT produto_sku, MAX(data) FROM venda GROUP BY produto_sku")
+    return {str(sku): data for sku, data in cursor}
+
+
+def calcular_erros(conn: sqlite3.Connection, janela_dias: int) -> Dict[str, Tuple[float, int]]:
+    """
+    Erro das previsões do último ajuste contra as vendas que chegaram depois
+    dele (datas após data_historico, até horizonte_fim), limitado aos últimos
+    `janela_dias` dias de venda de cada SKU, como WAPE (soma dos erros
+    absolutos / soma das vendas). O recorte de validação do ajuste não entra.
+
+    Returns:
+        {sku: (wape, dias_avaliados)}
+    """
+    cursor = conn.execute(
+        """
+        SELECT p.produto_sku,
+               SUM(ABS(v.quantidade - p.quantidade_prevista)),
+               SUM(ABS(v.quantidade)),
+               COUNT(*)
+        FROM estado_previsao e
+        JOIN (SELECT produto_sku, MAX(data) AS ultima FROM venda GROUP BY produto_sku) u
+            ON u.produto_sku = e.produto_sku
+        JOIN previsao p ON p.produto_sku = e.produto_sku
+        JOIN venda v ON v.produto_sku = p.produto_sku AND v.data = p.data
+        WHERE p.data > e.data_historico
+          AND p.data <= e.horizonte_fim
+          AND p.data > date(u.ultima, ?)
+        GROUP BY p.produto_sku
+        """,
+        (f"-{int(janela_dias)} days",),
+    )
+    erros = {}
+    for sku, erro_abs, real, dias in cursor:
+        erros[str(sku)] = ((erro_abs / real) if real else None, dias)
+    return erros
+
+
+def registrar_ajustes(conn: sqlite3.Connection, horizontes: Dict[str, str]):
+    """
+    Registra os SKUs reajustados nesta rodada: {sku: última data prevista}.
+    A data do histórico é a última venda do SKU no momento do registro, e a
+    marca de histórico alterado volta a zero.
+    """
+    agora = datetime.now().isoformat()
+    linhas = [(str(sku), agora, fim, str(sku)) for sku, fim in horizontes.items()]
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO estado_previsao (produto_sku, data_ajuste, horizonte_fim, data_historico)
+            VALUES (?, ?, ?, (SELECT MAX(data) FROM venda WHERE produto_sku = ?))
+            ON CONFLICT(produto_sku) DO UPDATE SET
+                data_ajuste = excluded.data_ajuste,
+                horizonte_fim = excluded.horizonte_fim,
+                data_historico = excluded.data_historico,
+                historico_alterado = 0
+            """,
+            linhas,
+        )
+    logging.info(f"Estado de ajuste registrado para {len(linhas)} SKUs")
+
+
+def registrar_avaliacoes(conn: sqlite3.Connection, decisoes: Iterable[Dict]):
+    """Guarda o erro e o motivo da última decisão de reajuste de cada SKU já ajustado."""
+    agora = datetime.now().isoformat()
+    with conn:
+        conn.executemany(
+            """
+            UPDATE estado_previsao
+            SET erro = ?, dias_avaliados = ?, motivo = ?, avaliado_em = ?
+            WHERE produto_sku = ?
+            """,
+            [
+                (d["erro"], d["dias_avaliados"], d["motivo"], agora, d["sku"])
+                for d in decisoes
+            ],
+        )
@@ -0,0 +1,129 @@
+import json
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# status: 'executando', 'concluida', 'degradada' (algum worker morreu), 'interrompida'
+
+
+def criar_tabelas(conn: sqlite3.Connection):
+    """
+    Cria a tabela de rodadas de previsão e o histórico compacto das previsões
+    de cada rodada (a tabela previsao guarda só o valor mais recente). Sem commit.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS previsao_execucao (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            motor TEXT NOT NULL,
+            parametros TEXT NOT NULL,        -- CONFIG do previsao em JSON
+            status TEXT NOT NULL,
+            iniciado_em TEXT NOT NULL,
+            finalizado_em TEXT,
+            etapas TEXT NOT NULL DEFAULT '{}', -- segundos por etapa, em JSON
+            skus_total INTEGER NOT NULL DEFAULT 0,
+            skus_previstos INTEGER NOT NULL DEFAULT 0,
+            skus_falha INTEGER NOT NULL DEFAULT 0,
+            linhas_alteradas INTEGER NOT NULL DEFAULT 0,
+            erro TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS previsao_historico (
+            execucao_id INTEGER NOT NULL,
+            produto_sku TEXT NOT NULL,
+            data DATE NOT NULL,
+            quantidade_prevista FLOAT NOT NULL,
+            PRIMARY KEY (execucao_id, produto_sku, data)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def _para_dict(row: sqlite3.Row) -> Dict:
+    execucao = dict(zip(row.keys(), row))
+    execucao["parametros"] = json.loads(execucao["parametros"])
+    execucao["etapas"] = json.loads(execucao["etapas"])
+    return execucao
+
+
+def iniciar_execucao(conn: sqlite3.Connection, motor: str, parametros: Dict) -> int:
+    with conn:
+        cursor = conn.execute(
+            """
+            INSERT INTO previsao_execucao (motor, parametros, status, iniciado_em)
+            VALUES (?, ?, 'executando', ?)
+            """,
+            (motor, json.dumps(parametros, default=str), datetime.now().isoformat()),
+        )
+    return cursor.lastrowid
+
+
+def finalizar_execucao(conn: sqlite3.Connection, execucao_id: int, status: str, etapas: Dict[str, float],
+                       skus_total: int = 0, skus_previstos: int = 0, skus_falha: int = 0,
+                       linhas_alteradas: int = 0, erro: Optional[str] = None):
+    with conn:
+        conn.execute(
+            """
+            UPDATE previsao_execucao
+            SET status = ?, finalizado_em = ?, etapas = ?, skus_total = ?,
+                skus_previstos = ?, skus_falha = ?, linhas_alteradas = ?, erro = ?
+            WHERE id = ?
+            """,
+            (
+                status, datetime.now().isoformat(),
+                json.dumps({etapa: round(segundos, 3) for etapa, segundos in etapas.items()}),
+                skus_total, skus_previstos, skus_falha, linhas_alteradas, erro, execucao_id,
+            ),
+        )
+    logging.info(f"Execução de previsão {execucao_id} finalizada com status '{status}'")
+
+
+def buscar_execucao(conn: sqlite3.Connection, execucao_id: int) -> Optional[Dict]:
+    cursor = conn.execute("SELECT * FROM previsao_execucao WHERE id = ?", (execucao_id,))
+    cursor.row_factory = sqlite3.Row
+    row = cursor.fetchone()
+    return _para_dict(row) if row else None
+
+
+def ultima_execucao(conn: sqlite3.Connection) -> Optional[Dict]:
+    """Última rodada que chegou ao fim (concluída ou degradada)."""
+    cursor = conn.execute(
+        "SELECT * FROM previsao_execucao WHERE status IN ('concluida', 'degradada') ORDER BY id DESC LIMIT 1"
+    )
+    cursor.row_factory = sqlite3.Row
+    row = cursor.fetchone()
+    return _para_dict(row) if row else None
+
+
+def listar_execucoes(conn: sqlite3.Connection, limite: int = 20) -> List[Dict]:
+    cursor = conn.execute("SELECT * FROM previsao_execucao ORDER BY id DESC LIMIT ?", (limite,))
+    cursor.row_factory = sqlite3.Row
+    return [_para_dict(row) for row in cursor]
+
+
+def avaliar_execucoes(conn: sqlite3.Connection, execucao_ids: Optional[List[int]] = None) -> List[Dict]:
+    """
+    Acurácia de cada rodada contra as vendas já registradas, a partir do
+    histórico (sem reprocessar nada): MAE, WAPE e dias comparados.
+    """
+    query = """
+        SELECT h.execucao_id,
+               COUNT(*) AS dias_avaliados,
+               AVG(ABS(v.quantidade - h.quantidade_prevista)) AS mae,
+               SUM(ABS(v.quantidade - h.quantidade_prevista)) / NULLIF(SUM(ABS(v.quantidade)), 0) AS wape
+        FROM previsao_historico h
+        JOIN venda v ON v.produto_sku = h.produto_sku AND v.data = h.data
+    """
+    params: List = []
+    if execucao_ids:
+        query += f" WHERE h.execucao_id IN ({', '.join('?' * len(execucao_ids))})"
+        params.extend(execucao_ids)
+    query += " GROUP BY h.execucao_id ORDER BY h.execucao_id"
+
+    cursor = conn.execute(query, params)
+    cursor.row_factory = sqlite3.Row
+    return [dict(zip(row.keys(), row)) for row in cursor]
@@ -0,0 +1,105 @@
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, Tuple
+
+
+def criar_tabelas(conn: sqlite3.Connection):
+    """
+    Cria as tabelas da busca de hiperparâmetros: o resultado de cada
+    combinação em cada fold (cache) e a combinação vencedora de cada SKU.
+    Sem commit.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS hiperparametro_fold (
+            produto_sku TEXT NOT NULL,
+            changepoint_prior_scale FLOAT NOT NULL,
+            fourier_order INTEGER NOT NULL,
+            corte DATE NOT NULL,        -- último dia de treino do fold
+            horizonte INTEGER NOT NULL,
+            checksum TEXT NOT NULL,     -- dados de treino + teste do fold
+            dias_avaliados INTEGER NOT NULL,
+            mape FLOAT,
+            rmse FLOAT,
+            avaliado_em TEXT NOT NULL,
+            PRIMARY KEY (produto_sku, changepoint_prior_scale, fourier_order, corte, horizonte)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS hiperparametro_sku (
+            produto_sku TEXT PRIMARY KEY,
+            changepoint_prior_scale FLOAT NOT NULL,
+            fourier_order INTEGER NOT NULL,
+            rmse FLOAT NOT NULL,        -- média dos folds da combinação vencedora
+            rmse_padrao FLOAT,          -- média dos folds com os parâmetros padrão
+            folds INTEGER NOT NULL,
+            combinacoes INTEGER NOT NULL,
+            ajustado_em TEXT NOT NULL,
+            FOREIGN KEY (produto_sku) REFERENCES produto(sku)
+        )
+        """
+    )
+
+
+def buscar_folds(conn: sqlite3.Connection, sku: str, horizonte: int) -> Dict[Tuple[float, int, str], Dict[str, Any]]:
+    """Folds já avaliados do SKU, indexados por (changepoint_prior_scale, fourier_order, corte)."""
+    cursor = conn.execute(
+        """
+        SELECT changepoint_prior_scale, fourier_order, corte, checksum, dias_avaliados, mape, rmse
+        FROM hiperparametro_fold
+        WHERE produto_sku = ? AND horizonte = ?
+        """,
+        (str(sku), horizonte),
+    )
+    return {
+        (cps, fourier, corte): {"checksum": checksum, "dias_avaliados": dias, "mape": mape, "rmse": rmse}
+        for cps, fourier, corte, checksum, dias, mape, rmse in cursor
+    }
+
+
+def salvar_folds(conn: sqlite3.Connection, sku: str, horizonte: int, resultados: Iterable[Dict[str, Any]]):
+    agora = datetime.now().isoformat()
+    with conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO hiperparametro_fold (
+                produto_sku, changepoint_prior_scale, fourier_order, corte, horizonte,
+                checksum, dias_avaliados, mape, rmse, avaliado_em
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (str(sku), r["changepoint_prior_scale"], r["fourier_order"], r["corte"], horizonte,
+                 r["checksum"], r["dias_avaliados"], r["mape"], r["rmse"], agora)
+                for r in resultados
+            ],
+        )
+
+
+def salvar_vencedor(conn: sqlite3.Connection, sku: str, vencedor: Dict[str, Any]):
+    with conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO hiperparametro_sku (
+                produto_sku, changepoint_prior_scale, fourier_order, rmse, rmse_padrao,
+                folds, combinacoes, ajustado_em
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (str(sku), vencedor["changepoint_prior_scale"], vencedor["fourier_order"], vencedor["rmse"],
+             vencedor["rmse_padrao"], vencedor["folds"], vencedor["combinacoes"], datetime.now().isoformat()),
+        )
+    logging.info(
+        f"Hiperparâmetros de SKU={sku}: changepoint_prior_scale={vencedor['changepoint_prior_scale']} "
+        f"fourier_order={vencedor['fourier_order']} (RMSE {vencedor['rmse']:.2f})"
+    )
+
+
+def buscar_vencedores(conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+    """{sku: {"changepoint_prior_scale": ..., "fourier_order": ...}} dos SKUs já ajustados."""
+    cursor = conn.execute("SELECT produto_sku, changepoint_prior_scale, fourier_order FROM hiperparametro_sku")
+    return {
+        str(sku): {"changepoint_prior_scale": cps, "fourier_order": int(fourier)}
+        for sku, cps, fourier in cursor
+    }
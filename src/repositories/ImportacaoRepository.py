@@ -0,0 +1,40 @@
+import sqlite3
+from datetime import datetime
+from typing import Dict, Optional
+
+
+def criar_tabela(conn: sqlite3.Connection):
+    """Cria o manifesto dos arquivos de vendas já importados, se ainda não existir (sem commit)."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS importacao_arquivo (
+            caminho TEXT PRIMARY KEY,
+            tamanho INTEGER NOT NULL,       -- bytes no momento da importação
+            mtime_ns INTEGER NOT NULL,
+            hash TEXT NOT NULL,             -- sha256 dos bytes [0, offset)
+            offset INTEGER NOT NULL,        -- fim da última linha importada
+            linhas INTEGER NOT NULL,        -- linhas de dados importadas até o offset
+            importado_em TEXT NOT NULL
+        )
+        """
+    )
+
+
+def buscar_manifesto(conn: sqlite3.Connection, caminho: str) -> Optional[Dict]:
+    cursor = conn.execute("SELECT * FROM importacao_arquivo WHERE caminho = ?", (caminho,))
+    cursor.row_factory = sqlite3.Row
+    row = cursor.fetchone()
+    return dict(zip(row.keys(), row)) if row else None
+
+
+def salvar_manifesto(conn: sqlite3.Connection, caminho: str, tamanho: int, mtime_ns: int,
+                     hash_conteudo: str, offset: int, linhas: int):
+    with conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO importacao_arquivo (
+                caminho, tamanho, mtime_ns, hash, offset, linhas, importado_em
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (caminho, tamanho, mtime_ns, hash_conteudo, offset, linhas, datetime.now().isoformat()),
+        )
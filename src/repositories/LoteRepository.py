@@ -1,8 +1,86 @@
 import sqlite3
 import logging
 from queue import Queue
-from typing import Dict, List
-from datetime import datetime, timedelta
+from typing import Dict, List, Union
+from datetime import date, datetime, timedelta
+
+# Armazenamento compacto: datas como número de dias desde 1970-01-01,
+# quantidades em gramas inteiras e status como código inteiro.
+# Os dicionários devolvidos pelo repositório continuam com datas (date),
+# quantidades em kg (float) e status por nome.
+STATUS = {"descongelando": 0, "disponivel": 1, "sobra": 2, "perda": 3, "vendido": 4}
+STATUS_POR_CODIGO = {codigo: nome for nome, codigo in STATUS.items()}
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS {tabela} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        quantidade_retirada INTEGER NOT NULL CHECK (quantidade_retirada >= 0), -- gramas
+        quantidade_atual INTEGER NOT NULL CHECK (quantidade_atual >= 0),       -- gramas
+        idade INTEGER NOT NULL,
+        status INTEGER NOT NULL CHECK (status BETWEEN 0 AND 4),                -- ver STATUS
+        data_retirado INTEGER NOT NULL,                                        -- dias desde 1970-01-01
+        data_venda INTEGER NOT NULL,
+        data_expiracao INTEGER NOT NULL,
+        produto_sku TEXT NOT NULL,
+        FOREIGN KEY (produto_sku) REFERENCES produto(sku)
+    )
+"""
+
+# Visão com as colunas decodificadas (datas ISO, kg e status por nome), para consultas e exportação
+VISAO_LEGIVEL = """
+    CREATE VIEW IF NOT EXISTS lote_legivel AS
+    SELECT id,
+           quantidade_retirada / 1000.0 AS quantidade_retirada,
+           quantidade_atual / 1000.0 AS quantidade_atual,
+           idade,
+           CASE status {casos} END AS status,
+           date(data_retirado * 86400, 'unixepoch') AS data_retirado,
+           date(data_venda * 86400, 'unixepoch') AS data_venda,
+           date(data_expiracao * 86400, 'unixepoch') AS data_expiracao,
+           produto_sku
+    FROM lote
+""".format(casos=" ".join(f"WHEN {codigo} THEN '{nome}'" for nome, codigo in STATUS.items()))
+
+_EPOCA = date(1970, 1, 1).toordinal()
+_COLUNAS_DATA = ("data_retirado", "data_venda", "data_expiracao")
+_COLUNAS_QUANTIDADE = ("quantidade_retirada", "quantidade_atual")
+
+
+def para_dia(data: Union[date, datetime, str]) -> int:
+    """Data (date, datetime ou 'AAAA-MM-DD') -> dias desde 1970-01-01."""
+    if isinstance(data, str):
+        data = datetime.strptime(data[:10], "%Y-%m-%d").date()
+    elif isinstance(data, datetime):
+        data = data.date()
+    return data.toordinal() - _EPOCA
+
+
+def de_dia(dia: int) -> date:
+    return date.fromordinal(dia + _EPOCA)
+
+
+def para_gramas(kg: float) -> int:
+    return int(round(kg * 1000))
+
+
+def de_gramas(gramas: int) -> float:
+    return gramas / 1000
+
+
+def codigos_status(*nomes: str) -> tuple:
+    return tuple(STATUS[nome] for nome in nomes)
+
+
+def _decodificar(lote: Dict) -> Dict:
+    for coluna in _COLUNAS_DATA:
+        if lote.get(coluna) is not None:
+            lote[coluna] = de_dia(lote[coluna])
+    for coluna in _COLUNAS_QUANTIDADE:
+        if lote.get(coluna) is not None:
+            lote[coluna] = de_gramas(lote[coluna])
+    if "status" in lote:
+        lote["status"] = STATUS_POR_CODIGO[lote["status"]]
+    return lote
 
 
 def buscar_lotes_por_produto_em_fila(
@@ -27,7 +105,7 @@ def buscar_lotes_por_produto_em_fila(
         lote
         for lote in lotes
         if lote["status"] in ("sobra", "disponivel")
-        and lote["data_venda"] <= datetime.strptime(data_atual, "%Y-%m-%d").date()
+        and lote["data_venda"] <= de_dia(para_dia(data_atual))
     ]
 
     # Ordena por: sobras primeiro, depois menor quantidade, depois mais antigo
@@ -68,14 +146,15 @@ def criar_lote(conn: sqlite3.Connection, produto_sku, quantidade_bruta, data_ret
                 data_venda,
                 data_expiracao,
                 produto_sku
-            ) VALUES (?, ?, 0, 'descongelando', ?, ?, ?, ?)
+            ) VALUES (?, ?, 0, ?, ?, ?, ?, ?)
         """,
         (
-            quantidade_liquida,  # quantidade_retirada
-            quantidade_liquida,  # quantidade_atual (saldo inicial igual ao retirado)
-            data_retirada.strftime("%Y-%m-%d"),
-            data_venda.strftime("%Y-%m-%d"),
-            data_expiracao.strftime("%Y-%m-%d"),
+            para_gramas(quantidade_liquida),  # quantidade_retirada
+            para_gramas(quantidade_liquida),  # quantidade_atual (saldo inicial igual ao retirado)
+            STATUS["descongelando"],
+            para_dia(data_retirada),
+            para_dia(data_venda),
+            para_dia(data_expiracao),
             produto_sku,
         ),
     )
@@ -87,60 +166,62 @@ def criar_lote(conn: sqlite3.Connection, produto_sku, quantidade_bruta, data_ret
 
 def obter_retirada_anterior(conn: sqlite3.Connection, produto_sku, data_hoje):
     """Obtém a retirada do dia anterior (t-1) para o produto"""
-    data_ontem = (data_hoje - timedelta(days=1)).strftime("%Y-%m-%d")
     cursor = conn.cursor()
     cursor.execute(
         "SELECT quantidade_retirada FROM lote WHERE produto_sku = ? AND data_retirado = ?",
-        (produto_sku, data_ontem),
+        (produto_sku, para_dia(data_hoje) - 1),
     )
     row = cursor.fetchone()
-    return row["quantidade_retirada"] if row else 0.0
+    return de_gramas(row[0]) if row else 0.0
 
 
 def atualizar_status_lotes_diario(conn: sqlite3.Connection, data_hoje):
     """Atualiza o status dos lotes baseado na data atual"""
     cursor = conn.cursor()
-    data_hoje_str = data_hoje.strftime("%Y-%m-%d")
+    hoje = para_dia(data_hoje)
+    descongelando, disponivel, sobra, perda, vendido = codigos_status(
+        "descongelando", "disponivel", "sobra", "perda", "vendido"
+    )
 
     # Gerar uma função para cada
     # Atualizar lotes que estão prontos para venda
     cursor.execute(
         """
             UPDATE lote
-            SET status = 'disponivel'
-            WHERE data_venda = ? AND status = 'descongelando'
+            SET status = ?
+            WHERE data_venda = ? AND status = ?
         """,
-        (data_hoje_str,),
+        (disponivel, hoje, descongelando),
     )
 
     # Atualizar lotes que se tornam sobra
     cursor.execute(
         """
             UPDATE lote
-            SET status = 'sobra'
-            WHERE data_venda < ? AND status = 'disponivel' AND  quantidade_atual > 0
+            SET status = ?
+            WHERE data_venda < ? AND status = ? AND  quantidade_atual > 0
         """,
-        (data_hoje_str,),
+        (sobra, hoje, disponivel),
     )
 
     # Atualizar lotes que expiraram
     cursor.execute(
         """
             UPDATE lote
-            SET status = 'perda'
+            SET status = ?
             WHERE data_expiracao
-             <= ? AND status IN ('disponivel', 'sobra')
+             <= ? AND status IN (?, ?)
         """,
-        (data_hoje_str,),
+        (perda, hoje, disponivel, sobra),
     )
 
     cursor.execute(
         """
             UPDATE lote
-            SET status  = 'vendido'
-            WHERE data_venda <= ? AND status IN ('disponivel', 'sobra') AND quantidade_atual = 0
+            SET status  = ?
+            WHERE data_venda <= ? AND status IN (?, ?) AND quantidade_atual = 0
         """,
-        (data_hoje_str,),
+        (vendido, hoje, disponivel, sobra),
     )
 
     conn.commit()
@@ -181,17 +262,8 @@ def obter_lotes_por_sku(conn, produto_sku):
     lotes = []
 
     for row in cursor.fetchall():
-        lote = dict(zip(colunas, row))
-        # Converter datas de string para objeto date
-        if lote["data_retirado"]:
-            lote["data_retirado"] = datetime.strptime(
-                lote["data_retirado"], "%Y-%m-%d"
-            ).date()
-        if lote["data_venda"]:
-            lote["data_venda"] = datetime.strptime(
-                lote["data_venda"], "%Y-%m-%d"
-            ).date()
-        lotes.append(lote)
+        # Converter datas, quantidades e status do formato compacto
+        lotes.append(_decodificar(dict(zip(colunas, row))))
 
     return lotes
 
@@ -223,27 +295,14 @@ def obter_lotes_por_status(conn: sqlite3.Connection, status: str):
         WHERE status = ?
         ORDER BY data_retirado DESC
         """,
-        (status,),
+        (STATUS[status],),
     )
 
     colunas = [description[0] for description in cursor.description]
     lotes = []
 
     for row in cursor.fetchall():
-        lote = dict(zip(colunas, row))
-        if lote["data_retirado"]:
-            lote["data_retirado"] = datetime.strptime(
-                lote["data_retirado"], "%Y-%m-%d"
-            ).date()
-        if lote["data_venda"]:
-            lote["data_venda"] = datetime.strptime(
-                lote["data_venda"], "%Y-%m-%d"
-            ).date()
-        if lote["data_expiracao"]:
-            lote["data_expiracao"] = datetime.strptime(
-                lote["data_expiracao"], "%Y-%m-%d"
-            ).date()
-        lotes.append(lote)
+        lotes.append(_decodificar(dict(zip(colunas, row))))
 
     return lotes
 
@@ -271,28 +330,16 @@ def obter_todos_lotes_ativos(conn: sqlite3.Connection) -> List[Dict]:
             data_venda,
             data_expiracao
         FROM lote
-        WHERE status IN ('descongelando', 'disponivel', 'sobra')
+        WHERE status IN (?, ?, ?)
         ORDER BY data_retirado DESC
-        """
+        """,
+        codigos_status("descongelando", "disponivel", "sobra"),
     )
 
     colunas = [description[0] for description in cursor.description]
     lotes = []
 
     for row in cursor.fetchall():
-        lote = dict(zip(colunas, row))
-        if lote["data_retirado"]:
-            lote["data_retirado"] = datetime.strptime(
-                lote["data_retirado"], "%Y-%m-%d"
-            ).date()
-        if lote["data_venda"]:
-            lote["data_venda"] = datetime.strptime(
-                lote["data_venda"], "%Y-%m-%d"
-            ).date()
-        if lote["data_expiracao"]:
-            lote["data_expiracao"] = datetime.strptime(
-                lote["data_expiracao"], "%Y-%m-%d"
-            ).date()
-        lotes.append(lote)
+        lotes.append(_decodificar(dict(zip(colunas, row))))
 
     return lotes
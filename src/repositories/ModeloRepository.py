@@ -0,0 +1,97 @@
+import hashlib
+import os
+import re
+import json
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+# Diretório padrão dos modelos serializados (um arquivo JSON por SKU)
+DIRETORIO_PADRAO = Path(__file__).resolve().parent.parent / "data" / "modelos"
+
+
+def _caminho_modelo(diretorio: Path, sku: str) -> Path:
+    nome = re.sub(r"[^0-9A-Za-z_-]", "_", str(sku))
+    if nome != str(sku):
+        # SKUs diferentes podem virar o mesmo nome ("a/b" e "a_b"); o hash os separa
+        nome = f"{nome}-{hashlib.sha1(str(sku).encode()).hexdigest()[:10]}"
+    return diretorio / f"{nome}.json"
+
+
+def buscar_modelo(sku: str, diretorio: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """
+    Busca o modelo salvo para o SKU.
+
+    Returns:
+        dict com as chaves 'sku', 'fingerprint' e 'modelo' (JSON do Prophet),
+        ou None se não houver modelo salvo, o arquivo estiver corrompido ou
+        pertencer a outro SKU.
+    """
+    caminho = _caminho_modelo(Path(diretorio or DIRETORIO_PADRAO), sku)
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            registro = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Modelo salvo inválido para SKU={sku}: {e}")
+        return None
+    if registro.get("sku") != str(sku):
+        logging.warning(f"Modelo em {caminho.name} pertence ao SKU={registro.get('sku')}, não a SKU={sku}")
+        return None
+
+    # Marca o acesso para que a remoção por tamanho descarte os menos usados
+    try:
+        os.utime(caminho)
+    except OSError:
+        pass
+    return registro
+
+
+def salvar_modelo(sku: str, fingerprint: Dict[str, Any], modelo_json: str,
+                  diretorio: Optional[Path] = None):
+    """
+    Salva o modelo serializado do SKU junto com o fingerprint dos dados de treino.
+    A escrita é atômica (arquivo temporário + os.replace), pois vários workers
+    podem gravar no mesmo diretório. O limite de tamanho do diretório é aplicado
+    uma vez por rodada, com remover_excedentes.
+    """
+    diretorio = Path(diretorio or DIRETORIO_PADRAO)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    caminho = _caminho_modelo(diretorio, sku)
+    temporario = caminho.with_suffix(f".{os.getpid()}.tmp")
+
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump({"sku": str(sku), "fingerprint": fingerprint, "modelo": modelo_json}, f)
+    os.replace(temporario, caminho)
+
+
+def remover_excedentes(diretorio: Optional[Path] = None, tamanho_max_mb: float = 512):
+    """
+    Remove os modelos acessados há mais tempo até que o diretório
+    fique abaixo de tamanho_max_mb.
+    """
+    diretorio = Path(diretorio or DIRETORIO_PADRAO)
+    limite = tamanho_max_mb * 1024 * 1024
+
+    arquivos = []
+    for caminho in diretorio.glob("*.json"):
+        try:
+            info = caminho.stat()
+        except FileNotFoundError:
+            continue
+        arquivos.append((info.st_mtime, info.st_size, caminho))
+
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    if total <= limite:
+        return
+
+    for _, tamanho, caminho in sorted(arquivos):
+        try:
+            caminho.unlink()
+        except FileNotFoundError:
+            pass
+        total -= tamanho
+        logging.info(f"Modelo removido do cache por tamanho: {caminho.name}")
+        if total <= limite:
+            break
@@ -1,14 +1,47 @@
 import sqlite3
 import logging
 import pandas as pd
-from typing import Optional, List, Dict
+from statistics import NormalDist
+from typing import Optional, List, Dict, Tuple
+
+# Colunas acrescentadas à tabela previsao depois da criação original;
+# bancos antigos recebem as colunas via ALTER TABLE na migração 1 (src/migracoes.py)
+COLUNAS_ADICIONAIS = {
+    "metodo": "TEXT",  # 'prophet', 'vetorizado', 'sazonal_ingenuo', 'media' ou 'reserva_worker'
+    "yhat_lower": "FLOAT",
+    "yhat_upper": "FLOAT",
+    "execucao_id": "INTEGER",  # rodada (previsao_execucao) que gravou o valor atual
+}
+
+# Previsões da rodada mais recente de cada SKU (maior execucao_id; SKUs que
+# nunca passaram por uma rodada registrada aparecem com execucao_id nulo).
+# Datas que a última rodada não previu mais ficam só na tabela.
+VISAO_VIGENTE = """
+    CREATE VIEW IF NOT EXISTS previsao_vigente AS
+    SELECT p.*
+    FROM previsao p
+    WHERE COALESCE(p.execucao_id, 0) = (
+        SELECT COALESCE(MAX(q.execucao_id), 0) FROM previsao q WHERE q.produto_sku = p.produto_sku
+    )
+"""
+INDICE_EXECUCAO = "CREATE INDEX IF NOT EXISTS idx_previsao_sku_execucao ON previsao (produto_sku, execucao_id)"
+
+# Os intervalos gravados têm 80% de cobertura (interval_width padrão do Prophet)
+Z_INTERVALO = NormalDist().inv_cdf(0.9)
+
+def garantir_colunas(conn: sqlite3.Connection):
+    existentes = {row[1] for row in conn.execute("PRAGMA table_info(previsao)")}
+    for coluna, tipo in COLUNAS_ADICIONAIS.items():
+        if coluna not in existentes:
+            conn.execute(f"ALTER TABLE previsao ADD COLUMN {coluna} {tipo}")
+            logging.info(f"Coluna previsao.{coluna} criada")
 
 def buscar_previsoes(conn: sqlite3.Connection, sku: Optional[str] = None,
                       data_inicio: Optional[str] = None, data_fim: Optional[str] = None) -> List[Dict]:
     cursor = conn.cursor()
     query = """
-        SELECT p.id, pr.sku, p.data, p.quantidade_prevista, pr.nome
-        FROM previsao p
+        SELECT p.id, pr.sku, p.data, p.quantidade_prevista, pr.nome, p.metodo, p.execucao_id
+        FROM previsao_vigente p
         JOIN produto pr ON p.produto_sku = pr.sku
         WHERE 1=1
     """
@@ -27,13 +60,15 @@ def buscar_previsoes(conn: sqlite3.Connection, sku: Optional[str] = None,
     linhas = cursor.fetchall()
 
     previsoes = []
-    for id_, sku, data_, quantidade_prevista, nome_produto in linhas:
+    for id_, sku, data_, quantidade_prevista, nome_produto, metodo, execucao_id in linhas:
         previsoes.append({
             "id": id_,
             "sku": sku,
             "data": data_,
             "quantidade_prevista": quantidade_prevista,
-            "nome_produto": nome_produto
+            "nome_produto": nome_produto,
+            "metodo": metodo,
+            "execucao_id": execucao_id
         })
     return previsoes
 
@@ -41,27 +76,159 @@ def obter_previsao(conn: sqlite3.Connection, produto_sku, data_venda):
         """Obtém a previsão de demanda para um produto em uma data específica"""
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT quantidade_prevista FROM previsao WHERE produto_sku = ? AND data = ?",
+            "SELECT quantidade_prevista FROM previsao_vigente WHERE produto_sku = ? AND data = ?",
             (produto_sku, data_venda.strftime("%Y-%m-%d")),
         )
         row = cursor.fetchone()
         return row["quantidade_prevista"] if row else None
 
-def salvar_previsao_no_banco(conn: sqlite3.Connection, sku: str, nome_produto: str,
-                              categoria_produto: str, data_prevista: pd.Timestamp,
-                              quantidade_prevista: float):
-    c = conn.cursor()
-    c.execute("SELECT sku FROM produto WHERE sku = ?", (sku,))
-    if not c.fetchone():
-        c.execute(
-            "INSERT INTO produto (sku, nome, categoria) VALUES (?, ?, ?)",
-            (sku, nome_produto, categoria_produto)
+def obter_previsao_e_desvio(conn: sqlite3.Connection, produto_sku,
+                            data_venda) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Previsão de um produto em uma data e o desvio padrão implícito no
+    intervalo gravado junto com ela, em uma única leitura pelo índice
+    (produto_sku, data). O desvio é None se a previsão não tem intervalo.
+    """
+    row = conn.execute(
+        "SELECT quantidade_prevista, yhat_lower, yhat_upper FROM previsao_vigente WHERE produto_sku = ? AND data = ?",
+        (produto_sku, data_venda.strftime("%Y-%m-%d")),
+    ).fetchone()
+    if row is None:
+        return None, None
+
+    quantidade, inferior, superior = row[0], row[1], row[2]
+    if inferior is None or superior is None:
+        return quantidade, None
+    return quantidade, (superior - inferior) / (2 * Z_INTERVALO)
+
+def salvar_previsoes_em_lote(conn: sqlite3.Connection, previsoes: pd.DataFrame,
+                             execucao_id: Optional[int] = None) -> int:
+    """
+    Grava todas as previsões do DataFrame (colunas produto_sku, ds, yhat e,
+    opcionalmente, metodo, yhat_lower e yhat_upper) com um único executemany
+    em uma transação. Previsões já existentes para o mesmo produto e data são
+    atualizadas, mas só quando algum valor mudou.
+    Com execucao_id, todas as linhas (inclusive as que não mudaram) passam a
+    ser da rodada, para a visão previsao_vigente, e são copiadas, na mesma
+    transação, para previsao_historico (ver ExecucaoRepository).
+
+    Returns:
+        int: Quantidade de linhas inseridas ou com valores alterados.
+    """
+    if previsoes.empty:
+        return 0
+
+    def opcional(coluna, casas=None):
+        if coluna not in previsoes:
+            return [None] * len(previsoes)
+        valores = previsoes[coluna]
+        if casas is not None:
+            valores = valores.astype(float).round(casas)
+        return valores.astype(object).where(valores.notna(), None)
+
+    linhas = list(zip(
+        pd.to_datetime(previsoes["ds"]).dt.strftime("%Y-%m-%d"),
+        previsoes["yhat"].astype(float).round(3),
+        previsoes["produto_sku"].astype(str),
+        opcional("metodo"),
+        opcional("yhat_lower", 3),
+        opcional("yhat_upper", 3),
+        [execucao_id] * len(previsoes),
+    ))
+
+    with conn:
+        alteradas = conn.executemany(
+            """
+            INSERT INTO previsao (data, quantidade_prevista, produto_sku, metodo, yhat_lower, yhat_upper, execucao_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(produto_sku, data) DO UPDATE
+                SET quantidade_prevista = excluded.quantidade_prevista,
+                    metodo = excluded.metodo,
+                    yhat_lower = excluded.yhat_lower,
+                    yhat_upper = excluded.yhat_upper,
+                    execucao_id = excluded.execucao_id
+                WHERE quantidade_prevista IS NOT excluded.quantidade_prevista
+                   OR metodo IS NOT excluded.metodo
+                   OR yhat_lower IS NOT excluded.yhat_lower
+                   OR yhat_upper IS NOT excluded.yhat_upper
+            """,
+            linhas,
+        ).rowcount
+        if execucao_id is not None:
+            conn.executemany(
+                "UPDATE previsao SET execucao_id = ? WHERE produto_sku = ? AND data = ? AND execucao_id IS NOT ?",
+                [(execucao_id, sku, data, execucao_id) for data, _, sku, *_ in linhas],
+            )
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO previsao_historico (execucao_id, produto_sku, data, quantidade_prevista)
+                VALUES (?, ?, ?, ?)
+                """,
+                [(execucao_id, sku, data, quantidade) for data, quantidade, sku, *_ in linhas],
+            )
+    logging.info(f"Previsões gravadas: {alteradas} de {len(linhas)} linhas inseridas/atualizadas")
+    return alteradas
+
+def criar_tabela_agregada(conn: sqlite3.Connection):
+    """
+    Previsões reconciliadas dos níveis agregados (total e categoria), ver
+    src/hierarquia.py. Cria a tabela se ainda não existir (sem commit).
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS previsao_agregada (
+            nivel TEXT NOT NULL,        -- 'total' ou 'categoria'
+            chave TEXT NOT NULL,        -- 'total' ou o nome da categoria
+            data DATE NOT NULL,
+            quantidade_prevista FLOAT NOT NULL,
+            metodo TEXT NOT NULL,
+            execucao_id INTEGER,
+            PRIMARY KEY (nivel, chave, data)
+        ) WITHOUT ROWID
+        """
+    )
+
+def salvar_previsoes_agregadas(conn: sqlite3.Connection, previsoes: pd.DataFrame,
+                               execucao_id: Optional[int] = None) -> int:
+    """Grava (substituindo) as previsões agregadas (colunas nivel, chave, ds, yhat, metodo)."""
+    if previsoes.empty:
+        return 0
+
+    linhas = list(zip(
+        previsoes["nivel"].astype(str),
+        previsoes["chave"].astype(str),
+        pd.to_datetime(previsoes["ds"]).dt.strftime("%Y-%m-%d"),
+        previsoes["yhat"].astype(float).round(3),
+        previsoes["metodo"].astype(str),
+        [execucao_id] * len(previsoes),
+    ))
+    with conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO previsao_agregada (nivel, chave, data, quantidade_prevista, metodo, execucao_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            linhas,
         )
+    logging.info(f"Previsões agregadas gravadas: {len(linhas)} linhas")
+    return len(linhas)
+
+def buscar_previsoes_agregadas(conn: sqlite3.Connection, nivel: Optional[str] = None,
+                               data_inicio: Optional[str] = None, data_fim: Optional[str] = None) -> List[Dict]:
+    query = "SELECT nivel, chave, data, quantidade_prevista, metodo FROM previsao_agregada WHERE 1=1"
+    params = []
+    if nivel is not None:
+        query += " AND nivel = ?"
+        params.append(nivel)
+    if data_inicio is not None:
+        query += " AND data >= ?"
+        params.append(data_inicio)
+    if data_fim is not None:
+        query += " AND data <= ?"
+        params.append(data_fim)
+    query += " ORDER BY nivel, chave, data"
 
-    data_str = data_prevista.strftime("%Y-%m-%d")
-    c.execute("SELECT id FROM previsao WHERE produto_sku = ? AND data = ?",
-              (sku, data_str))
-    if not c.fetchone():
-        c.execute("INSERT INTO previsao (data, quantidade_prevista, produto_sku) VALUES (?, ?, ?)",
-                  (data_str, quantidade_prevista, sku))
-        conn.commit()
\ No newline at end of file
+    return [
+        {"nivel": nivel_, "chave": chave, "data": data_, "quantidade_prevista": quantidade, "metodo": metodo}
+        for nivel_, chave, data_, quantidade, metodo in conn.execute(query, params)
+    ]
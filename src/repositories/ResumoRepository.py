@@ -0,0 +1,201 @@
+import sqlite3
+import logging
+from typing import Dict, List
+
+from src.repositories import LoteRepository
+
+# Tabelas de resumo mantidas por gatilhos em venda e lote, para que o
+# dashboard e os relatórios leiam O(SKUs) linhas em vez de varrer o histórico.
+# A venda diária por SKU já é a própria tabela venda (UNIQUE (data, produto_sku)).
+#
+# - venda_diaria: total vendido por dia (todos os SKUs)
+# - venda_resumo_sku: total e dias com venda de cada SKU (média = total / dias)
+# - estoque_sku: saldo atual (gramas) e quantidade de lotes por SKU e status
+# - perda_diaria_sku: gramas perdidas por SKU no dia de expiração do lote
+
+TABELAS = [
+    """
+    CREATE TABLE IF NOT EXISTS venda_diaria (
+        data DATE PRIMARY KEY,
+        total FLOAT NOT NULL DEFAULT 0,
+        registros INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS venda_resumo_sku (
+        produto_sku TEXT PRIMARY KEY,
+        total FLOAT NOT NULL DEFAULT 0,
+        dias INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estoque_sku (
+        produto_sku TEXT NOT NULL,
+        status INTEGER NOT NULL,
+        quantidade INTEGER NOT NULL DEFAULT 0,  -- gramas
+        lotes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (produto_sku, status)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS perda_diaria_sku (
+        data INTEGER NOT NULL,                  -- dias desde 1970-01-01
+        produto_sku TEXT NOT NULL,
+        quantidade INTEGER NOT NULL DEFAULT 0,  -- gramas
+        lotes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (data, produto_sku)
+    ) WITHOUT ROWID
+    """,
+]
+
+# Trechos reutilizados pelos gatilhos; {r} é NEW ou OLD e {s} é +1 ou -1
+_VENDA = """
+    INSERT INTO venda_diaria (data, total, registros) VALUES ({r}.data, {s} * {r}.quantidade, {s})
+    ON CONFLICT(data) DO UPDATE SET
+        total = total + excluded.total, registros = registros + excluded.registros;
+    INSERT INTO venda_resumo_sku (produto_sku, total, dias) VALUES ({r}.produto_sku, {s} * {r}.quantidade, {s})
+    ON CONFLICT(produto_sku) DO UPDATE SET
+        total = total + excluded.total, dias = dias + excluded.dias;
+"""
+_ESTOQUE = """
+    INSERT INTO estoque_sku (produto_sku, status, quantidade, lotes)
+    VALUES ({r}.produto_sku, {r}.status, {s} * {r}.quantidade_atual, {s})
+    ON CONFLICT(produto_sku, status) DO UPDATE SET
+        quantidade = quantidade + excluded.quantidade, lotes = lotes + excluded.lotes;
+"""
+_PERDA = """
+    INSERT INTO perda_diaria_sku (data, produto_sku, quantidade, lotes)
+    VALUES ({r}.data_expiracao, {r}.produto_sku, {s} * {r}.quantidade_atual, {s})
+    ON CONFLICT(data, produto_sku) DO UPDATE SET
+        quantidade = quantidade + excluded.quantidade, lotes = lotes + excluded.lotes;
+"""
+_PERDA_STATUS = LoteRepository.STATUS["perda"]
+
+GATILHOS = [
+    f"CREATE TRIGGER IF NOT EXISTS trg_venda_resumo_ins AFTER INSERT ON venda BEGIN "
+    f"{_VENDA.format(r='NEW', s='1')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_venda_resumo_del AFTER DELETE ON venda BEGIN "
+    f"{_VENDA.format(r='OLD', s='-1')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_venda_resumo_upd AFTER UPDATE OF data, quantidade, produto_sku ON venda BEGIN "
+    f"{_VENDA.format(r='OLD', s='-1')} {_VENDA.format(r='NEW', s='1')} END",
+
+    f"CREATE TRIGGER IF NOT EXISTS trg_lote_estoque_ins AFTER INSERT ON lote BEGIN "
+    f"{_ESTOQUE.format(r='NEW', s='1')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_lote_estoque_del AFTER DELETE ON lote BEGIN "
+    f"{_ESTOQUE.format(r='OLD', s='-1')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_lote_estoque_upd AFTER UPDATE OF quantidade_atual, status, produto_sku ON lote BEGIN "
+    f"{_ESTOQUE.format(r='OLD', s='-1')} {_ESTOQUE.format(r='NEW', s='1')} END",
+
+    # Perdas acompanham os lotes com status 'perda', datadas pela expiração
+    f"CREATE TRIGGER IF NOT EXISTS trg_lote_perda_ins AFTER INSERT ON lote WHEN NEW.status = {_PERDA_STATUS} BEGIN "
+    f"{_PERDA.format(r='NEW', s='1')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_lote_perda_del AFTER DELETE ON lote WHEN OLD.status = {_PERDA_STATUS} BEGIN "
+    f"{_PERDA.format(r='OLD', s='-1')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_lote_perda_upd_old "
+    f"AFTER UPDATE OF quantidade_atual, status, produto_sku, data_expiracao ON lote "
+    f"WHEN OLD.status = {_PERDA_STATUS} BEGIN {_PERDA.format(r='OLD', s='-1')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_lote_perda_upd_new "
+    f"AFTER UPDATE OF quantidade_atual, status, produto_sku, data_expiracao ON lote "
+    f"WHEN NEW.status = {_PERDA_STATUS} BEGIN {_PERDA.format(r='NEW', s='1')} END",
+]
+
+
+def criar_tabelas_e_gatilhos(conn: sqlite3.Connection):
+    """Cria as tabelas de resumo e os gatilhos que as mantêm (sem commit)."""
+    for sql in TABELAS + GATILHOS:
+        conn.execute(sql)
+
+
+def recalcular(conn: sqlite3.Connection):
+    """Refaz os resumos a partir de venda e lote (sem commit)."""
+    for tabela in ("venda_diaria", "venda_resumo_sku", "estoque_sku", "perda_diaria_sku"):
+        conn.execute(f"DELETE FROM {tabela}")
+    conn.execute(
+        "INSERT INTO venda_diaria (data, total, registros) "
+        "SELECT data, SUM(quantidade), COUNT(*) FROM venda GROUP BY data"
+    )
+    conn.execute(
+        "INSERT INTO venda_resumo_sku (produto_sku, total, dias) "
+        "SELECT produto_sku, SUM(quantidade), COUNT(*) FROM venda GROUP BY produto_sku"
+    )
+    conn.execute(
+        "INSERT INTO estoque_sku (produto_sku, status, quantidade, lotes) "
+        "SELECT produto_sku, status, SUM(quantidade_atual), COUNT(*) FROM lote GROUP BY produto_sku, status"
+    )
+    conn.execute(
+        "INSERT INTO perda_diaria_sku (data, produto_sku, quantidade, lotes) "
+        "SELECT data_expiracao, produto_sku, SUM(quantidade_atual), COUNT(*) FROM lote "
+        "WHERE status = ? GROUP BY data_expiracao, produto_sku",
+        (_PERDA_STATUS,),
+    )
+    logging.info("Tabelas de resumo recalculadas")
+
+
+def total_vendido_no_dia(conn: sqlite3.Connection, data: str) -> float:
+    row = conn.execute("SELECT total FROM venda_diaria WHERE data = ?", (data,)).fetchone()
+    return row[0] if row else 0.0
+
+
+def vendas_por_dia(conn: sqlite3.Connection, data_inicio: str) -> List[Dict]:
+    cursor = conn.execute(
+        "SELECT data, total FROM venda_diaria WHERE data >= ? AND registros > 0 ORDER BY data", (data_inicio,)
+    )
+    return [{"dia": data, "total": total} for data, total in cursor]
+
+
+def mais_vendidos(conn: sqlite3.Connection, data_inicio: str, limite: int = 5) -> List[Dict]:
+    """
+    SKUs mais vendidos desde data_inicio, lidos da venda diária por SKU (venda,
+    pelo índice de cobertura idx_venda_data): o período é agregado numa única
+    passada e só os `limite` primeiros são juntados a produto.
+    """
+    cursor = conn.execute(
+        """
+        SELECT t.produto_sku, p.nome, t.total
+        FROM (
+            SELECT produto_sku, SUM(quantidade) AS total
+            FROM venda
+            WHERE data >= ? AND produto_sku IN (SELECT sku FROM produto)
+            GROUP BY produto_sku
+            ORDER BY total DESC
+            LIMIT ?
+        ) t
+        JOIN produto p ON p.sku = t.produto_sku
+        ORDER BY t.total DESC
+        """,
+        (data_inicio, limite),
+    )
+    return [{"sku": sku, "nome": nome, "total_vendido": total} for sku, nome, total in cursor]
+
+
+def estoque_por_sku(conn: sqlite3.Connection, *status: str) -> Dict[str, float]:
+    """{sku: saldo em kg} somando os status informados."""
+    codigos = LoteRepository.codigos_status(*status)
+    cursor = conn.execute(
+        f"""
+        SELECT produto_sku, SUM(quantidade) FROM estoque_sku
+        WHERE status IN ({', '.join('?' * len(codigos))})
+        GROUP BY produto_sku
+        """,
+        codigos,
+    )
+    return {sku: LoteRepository.de_gramas(gramas) for sku, gramas in cursor}
+
+
+def perdas_por_dia(conn: sqlite3.Connection, dia_inicio: int, dia_fim: int) -> List[Dict]:
+    """Perdas (kg) somadas por dia de expiração, entre dia_inicio e dia_fim (dias desde 1970-01-01)."""
+    cursor = conn.execute(
+        """
+        SELECT data, SUM(quantidade), SUM(lotes) FROM perda_diaria_sku
+        WHERE data BETWEEN ? AND ?
+        GROUP BY data
+        HAVING SUM(lotes) > 0
+        ORDER BY data
+        """,
+        (dia_inicio, dia_fim),
+    )
+    return [
+        {"dia": LoteRepository.de_dia(data).strftime("%Y-%m-%d"),
+         "quantidade": LoteRepository.de_gramas(gramas), "lotes": lotes}
+        for data, gramas, lotes in cursor
+    ]
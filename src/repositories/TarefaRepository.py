@@ -0,0 +1,230 @@
+import json
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# status: 'pendente', 'executando', 'concluida', 'falhou', 'cancelada'
+
+# Colunas acrescentadas à tabela depois da criação original (ver migração 7)
+COLUNAS_ADICIONAIS = {
+    "dono": "TEXT",       # processo que executa a tarefa (host:pid)
+    "lease_ate": "TEXT",  # sem renovação até este instante, a tarefa volta para a fila
+}
+
+
+def criar_tabela(conn: sqlite3.Connection):
+    """Cria a tabela da fila de tarefas de previsão, se ainda não existir (sem commit)."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tarefa_previsao (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chave TEXT NOT NULL,
+            status TEXT NOT NULL,
+            criado_em TEXT NOT NULL,
+            iniciado_em TEXT,
+            finalizado_em TEXT,
+            skus_total INTEGER NOT NULL DEFAULT 0,
+            skus_concluidos INTEGER NOT NULL DEFAULT 0,
+            falhas TEXT NOT NULL DEFAULT '[]',
+            cancelar INTEGER NOT NULL DEFAULT 0,
+            erro TEXT,
+            dono TEXT,
+            lease_ate TEXT
+        )
+        """
+    )
+    # Garante no máximo uma tarefa ativa por chave (deduplica envios concorrentes)
+    conn.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_tarefa_previsao_ativa
+        ON tarefa_previsao (chave) WHERE status IN ('pendente', 'executando')
+        """
+    )
+
+
+def garantir_colunas(conn: sqlite3.Connection):
+    existentes = {row[1] for row in conn.execute("PRAGMA table_info(tarefa_previsao)")}
+    for coluna, tipo in COLUNAS_ADICIONAIS.items():
+        if coluna not in existentes:
+            conn.execute(f"ALTER TABLE tarefa_previsao ADD COLUMN {coluna} {tipo}")
+            logging.info(f"Coluna tarefa_previsao.{coluna} criada")
+
+
+def _lease_ate(duracao_s: float) -> str:
+    return (datetime.now() + timedelta(seconds=duracao_s)).isoformat()
+
+
+def _para_dict(row: sqlite3.Row) -> Dict:
+    tarefa = dict(zip(row.keys(), row))
+    tarefa["falhas"] = json.loads(tarefa["falhas"])
+    tarefa["cancelar"] = bool(tarefa["cancelar"])
+    return tarefa
+
+
+def enfileirar(conn: sqlite3.Connection, chave: str) -> Tuple[int, bool]:
+    """
+    Enfileira uma tarefa. Se já houver uma tarefa ativa com a mesma chave,
+    retorna o id dela em vez de criar outra.
+
+    Returns:
+        (id da tarefa, True se foi criada agora)
+    """
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO tarefa_previsao (chave, status, criado_em) VALUES (?, 'pendente', ?)",
+                (chave, datetime.now().isoformat()),
+            )
+        return cursor.lastrowid, True
+    except sqlite3.IntegrityError:
+        row = conn.execute(
+            "SELECT id FROM tarefa_previsao WHERE chave = ? AND status IN ('pendente', 'executando')",
+            (chave,),
+        ).fetchone()
+        if row is None:  # a tarefa ativa terminou entre o INSERT e o SELECT
+            return enfileirar(conn, chave)
+        return row[0], False
+
+
+def buscar_tarefa(conn: sqlite3.Connection, tarefa_id: int) -> Optional[Dict]:
+    """Retorna a tarefa com progresso e ETA estimada (segundos), ou None."""
+    cursor = conn.execute("SELECT * FROM tarefa_previsao WHERE id = ?", (tarefa_id,))
+    cursor.row_factory = sqlite3.Row
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    tarefa = _para_dict(row)
+    tarefa["eta_segundos"] = None
+    if tarefa["status"] == "executando" and tarefa["iniciado_em"] and tarefa["skus_concluidos"]:
+        decorrido = (datetime.now() - datetime.fromisoformat(tarefa["iniciado_em"])).total_seconds()
+        restantes = max(tarefa["skus_total"] - tarefa["skus_concluidos"], 0)
+        tarefa["eta_segundos"] = round(decorrido / tarefa["skus_concluidos"] * restantes, 1)
+    return tarefa
+
+
+def reservar_proxima(conn: sqlite3.Connection, dono: str, duracao_lease_s: float) -> Optional[Dict]:
+    """
+    Marca a tarefa pendente mais antiga como 'executando' em nome de dono, com
+    lease de duracao_lease_s segundos, e a retorna. Antes, devolve para a fila
+    as tarefas cujo lease venceu (ver reenfileirar_interrompidas).
+    """
+    reenfileiradas = reenfileirar_interrompidas(conn)
+    if reenfileiradas:
+        logging.warning(f"{reenfileiradas} tarefa(s) de previsão com lease vencido voltaram para a fila")
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id FROM tarefa_previsao WHERE status = 'pendente' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            """
+            UPDATE tarefa_previsao
+            SET status = 'executando', iniciado_em = ?, dono = ?, lease_ate = ?
+            WHERE id = ?
+            """,
+            (datetime.now().isoformat(), dono, _lease_ate(duracao_lease_s), row[0]),
+        )
+    return buscar_tarefa(conn, row[0])
+
+
+def renovar_lease(conn: sqlite3.Connection, tarefa_id: int, dono: str, duracao_lease_s: float) -> bool:
+    """
+    Estende o lease da tarefa. Retorna False se ela não está mais em execução
+    por este dono (o lease venceu e outro processo a reservou, ou foi finalizada).
+    """
+    with conn:
+        cursor = conn.execute(
+            "UPDATE tarefa_previsao SET lease_ate = ? WHERE id = ? AND dono = ? AND status = 'executando'",
+            (_lease_ate(duracao_lease_s), tarefa_id, dono),
+        )
+    return cursor.rowcount == 1
+
+
+def atualizar_progresso(conn: sqlite3.Connection, tarefa_id: int, concluidos: int,
+                        total: int, falhas: List[str]):
+    with conn:
+        conn.execute(
+            """
+            UPDATE tarefa_previsao
+            SET skus_concluidos = ?, skus_total = ?, falhas = ?
+            WHERE id = ?
+            """,
+            (concluidos, total, json.dumps(falhas), tarefa_id),
+        )
+
+
+def cancelamento_solicitado(conn: sqlite3.Connection, tarefa_id: int) -> bool:
+    row = conn.execute("SELECT cancelar FROM tarefa_previsao WHERE id = ?", (tarefa_id,)).fetchone()
+    return bool(row and row[0])
+
+
+def solicitar_cancelamento(conn: sqlite3.Connection, tarefa_id: int) -> Optional[str]:
+    """
+    Cancela uma tarefa pendente imediatamente ou sinaliza uma tarefa em execução
+    para parar no próximo SKU. Retorna o status resultante, ou None se não existir.
+    """
+    with conn:
+        conn.execute(
+            """
+            UPDATE tarefa_previsao
+            SET status = 'cancelada', finalizado_em = ?
+            WHERE id = ? AND status = 'pendente'
+            """,
+            (datetime.now().isoformat(), tarefa_id),
+        )
+        conn.execute(
+            "UPDATE tarefa_previsao SET cancelar = 1 WHERE id = ? AND status = 'executando'",
+            (tarefa_id,),
+        )
+    row = conn.execute("SELECT status FROM tarefa_previsao WHERE id = ?", (tarefa_id,)).fetchone()
+    return row[0] if row else None
+
+
+def finalizar(conn: sqlite3.Connection, tarefa_id: int, status: str, erro: Optional[str] = None,
+              dono: Optional[str] = None):
+    """Grava o status final. Com dono, só finaliza se a tarefa ainda pertence a ele."""
+    with conn:
+        cursor = conn.execute(
+            """
+            UPDATE tarefa_previsao
+            SET status = ?, erro = ?, finalizado_em = ?, lease_ate = NULL
+            WHERE id = ? AND (? IS NULL OR dono = ?)
+            """,
+            (status, erro, datetime.now().isoformat(), tarefa_id, dono, dono),
+        )
+    if cursor.rowcount == 0:
+        logging.warning(f"Tarefa de previsão {tarefa_id} não pertence mais a {dono}; status '{status}' descartado")
+        return
+    logging.info(f"Tarefa de previsão {tarefa_id} finalizada com status '{status}'")
+
+
+def reenfileirar_interrompidas(conn: sqlite3.Connection) -> int:
+    """
+    Volta para 'pendente' as tarefas em execução cujo lease venceu, isto é,
+    cujo processo dono parou sem renová-lo (as que já tinham cancelamento
+    solicitado são dadas como canceladas). Tarefas com lease válido continuam
+    com o dono, mesmo que ele seja outro processo.
+    """
+    agora = datetime.now().isoformat()
+    with conn:
+        conn.execute(
+            """
+            UPDATE tarefa_previsao
+            SET status = 'cancelada', finalizado_em = ?, lease_ate = NULL
+            WHERE status = 'executando' AND cancelar = 1 AND (lease_ate IS NULL OR lease_ate < ?)
+            """,
+            (agora, agora),
+        )
+        cursor = conn.execute(
+            """
+            UPDATE tarefa_previsao
+            SET status = 'pendente', iniciado_em = NULL, cancelar = 0, dono = NULL, lease_ate = NULL
+            WHERE status = 'executando' AND (lease_ate IS NULL OR lease_ate < ?)
+            """,
+            (agora,),
+        )
+    return cursor.rowcount
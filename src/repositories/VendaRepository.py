@@ -1,6 +1,7 @@
 import sqlite3
 import logging
-from datetime import date
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Tuple
 
 
 def salvar_venda_no_banco(
@@ -38,3 +39,70 @@ def obter_demanda_media(conn: sqlite3.Connection, produto_sku):
     )
     row = cursor.fetchone()
     return row[0] if row[0] else 0.0
+
+
+def criar_tabela_rejeitadas(conn: sqlite3.Connection):
+    """Cria a tabela das vendas importadas que não puderam ser gravadas, se ainda não existir (sem commit)."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS venda_rejeitada (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data DATE,
+            quantidade FLOAT,
+            produto_sku TEXT,
+            motivo TEXT NOT NULL,
+            rejeitado_em TEXT NOT NULL
+        )
+        """
+    )
+
+
+def gravar_vendas_em_lote(conn: sqlite3.Connection, vendas: Iterable[Tuple[str, float, str]]) -> Tuple[int, int]:
+    """
+    Grava (data, quantidade, produto_sku) numa única transação: as linhas vão
+    para uma tabela temporária de staging e são mescladas em venda com um
+    único INSERT ... SELECT juntando produto (insere ou atualiza a quantidade).
+    Linhas de SKUs sem cadastro vão para venda_rejeitada (criada na migração 5).
+
+    Returns:
+        (vendas gravadas, vendas rejeitadas)
+    """
+    conn.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS venda_staging (
+            data DATE NOT NULL,
+            quantidade FLOAT NOT NULL,
+            produto_sku TEXT NOT NULL
+        )
+        """
+    )
+    with conn:
+        conn.execute("DELETE FROM venda_staging")
+        conn.executemany("INSERT INTO venda_staging (data, quantidade, produto_sku) VALUES (?, ?, ?)", vendas)
+        gravadas = conn.execute(
+            """
+            INSERT INTO venda (data, quantidade, produto_sku)
+            SELECT s.data, s.quantidade, s.produto_sku
+            FROM venda_staging s
+            JOIN produto p ON p.sku = s.produto_sku
+            WHERE true
+            ON CONFLICT(data, produto_sku) DO UPDATE SET quantidade = excluded.quantidade
+            """
+        ).rowcount
+        rejeitadas = conn.execute(
+            """
+            INSERT INTO venda_rejeitada (data, quantidade, produto_sku, motivo, rejeitado_em)
+            SELECT s.data, s.quantidade, s.produto_sku, 'produto_inexistente', ?
+            FROM venda_staging s
+            WHERE NOT EXISTS (SELECT 1 FROM produto p WHERE p.sku = s.produto_sku)
+            """,
+            (datetime.now().isoformat(),),
+        ).rowcount
+        conn.execute("DELETE FROM venda_staging")
+    return gravadas, rejeitadas
+
+
+def buscar_vendas_rejeitadas(conn: sqlite3.Connection, limite: int = 100) -> List[Dict]:
+    cursor = conn.execute("SELECT * FROM venda_rejeitada ORDER BY id DESC LIMIT ?", (limite,))
+    cursor.row_factory = sqlite3.Row
+    return [dict(zip(row.keys(), row)) for row in cursor]
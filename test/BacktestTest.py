@@ -0,0 +1,84 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src import backtest
+from src.database import criar_banco_e_tabelas
+from src.repositories import VendaRepository
+
+
+class BacktestCliTest(unittest.TestCase):
+    """Dois SKUs com 90 dias de vendas (2025-01-01 a 2025-03-31)."""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.caminho = os.path.join(self.diretorio.name, "data.db")
+        criar_banco_e_tabelas(sqlite3.connect(self.caminho))
+        self.conn = sqlite3.connect(self.caminho)
+        quantidades = np.random.default_rng(1).gamma(5, 2, (2, 90))
+        VendaRepository.gravar_vendas_em_lote(self.conn, [
+            (data.strftime("%Y-%m-%d"), float(quantidades[i, j]), sku)
+            for i, sku in enumerate(("237478", "237479"))
+            for j, data in enumerate(pd.date_range("2025-01-01", periods=90, freq="D"))
+        ])
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _main(self, *argv) -> int:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return backtest.main(["--banco", self.caminho, *argv])
+
+    def _executar(self, execucao_id: str, *argv):
+        self.assertEqual(self._main("executar", "--execucao", execucao_id, "--no-processo-por-fold", *argv), 0)
+
+    def test_executar_grava_um_resultado_por_motor_sku_e_fold(self):
+        self._executar("base", "--motores", "vetorizado", "prophet", "--folds", "2", "--skus", "237478")
+
+        linhas = self.conn.execute(
+            "SELECT motor, produto_sku, fold, corte, dias_avaliados FROM backtest_resultado "
+            "WHERE execucao_id = 'base' ORDER BY motor, fold"
+        ).fetchall()
+        self.assertEqual(linhas, [
+            ("prophet", "237478", 0, "2025-03-24", 7), ("prophet", "237478", 1, "2025-03-17", 7),
+            ("vetorizado", "237478", 0, "2025-03-24", 7), ("vetorizado", "237478", 1, "2025-03-17", 7),
+        ])
+        self.assertFalse(self.conn.execute(
+            "SELECT COUNT(*) FROM backtest_resultado WHERE mape IS NULL OR rmse IS NULL"
+        ).fetchone()[0])
+
+        resumo = backtest.resumir_execucao(self.conn, "base")
+        self.assertEqual(list(resumo.index), ["prophet", "vetorizado"])
+        self.assertEqual(list(resumo["folds"]), [2, 2])
+
+    def test_comparar_aponta_regressao_de_velocidade(self):
+        self._executar("base", "--motores", "vetorizado")
+        self._executar("nova", "--motores", "vetorizado")
+        self.assertEqual(
+            self.conn.execute("SELECT COUNT(*) FROM backtest_resultado WHERE execucao_id = 'nova'").fetchone()[0],
+            2 * backtest.CONFIG["folds"],
+        )
+        self.assertEqual(self._main("listar"), 0)
+
+        # Tempos fixos: a comparação não depende da velocidade da máquina
+        with self.conn:
+            self.conn.execute("UPDATE backtest_resultado SET tempo_ajuste = 0.001, tempo_previsao = 0.001")
+        self.assertEqual(self._main("comparar", "base", "nova"), 0)
+
+        with self.conn:
+            self.conn.execute("UPDATE backtest_resultado SET tempo_ajuste = 0.01 WHERE execucao_id = 'nova'")
+        self.assertEqual(self._main("comparar", "base", "nova"), 1)
+        _, regressoes = backtest.comparar_execucoes(self.conn, "base", "nova")
+        self.assertEqual(len(regressoes), 1)
+        self.assertIn("ajuste_medio_s", regressoes[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
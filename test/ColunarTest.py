@@ -0,0 +1,105 @@
+import importlib.util
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from src import colunar
+from src.database import criar_banco_e_tabelas
+from src.repositories import VendaRepository
+
+SKUS = ("237478", "237479")
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow não instalado")
+class ColunarIdaEVoltaTest(unittest.TestCase):
+    """Vendas exportadas de um banco e importadas em outro, em lotes de 7 linhas."""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.origem = self._banco("origem.db")
+        quantidades = np.random.default_rng(1).gamma(5, 2, (2, 30))
+        VendaRepository.gravar_vendas_em_lote(self.origem, [
+            (data.strftime("%Y-%m-%d"), float(quantidades[i, j]), sku)
+            for i, sku in enumerate(SKUS)
+            for j, data in enumerate(pd.date_range("2025-01-01", periods=30, freq="D"))
+        ])
+        self.destino = self._banco("destino.db")
+
+    def tearDown(self):
+        self.origem.close()
+        self.destino.close()
+        self.diretorio.cleanup()
+
+    def _banco(self, nome: str) -> sqlite3.Connection:
+        caminho = os.path.join(self.diretorio.name, nome)
+        criar_banco_e_tabelas(sqlite3.connect(caminho))
+        return sqlite3.connect(caminho)
+
+    def _arquivo(self, nome: str) -> str:
+        return os.path.join(self.diretorio.name, nome)
+
+    @staticmethod
+    def _vendas(conn: sqlite3.Connection):
+        return conn.execute("SELECT data, quantidade, produto_sku FROM venda ORDER BY produto_sku, data").fetchall()
+
+    def test_exporta_e_importa_sem_perder_vendas(self):
+        pa = colunar._pyarrow()
+        for nome in ("vendas.parquet", "vendas.arrow"):
+            with self.subTest(arquivo=nome):
+                self.assertEqual(colunar.exportar_tabela(self.origem, "venda", self._arquivo(nome), 7), 60)
+                if nome.endswith(".arrow"):
+                    esquema = pa.ipc.open_file(self._arquivo(nome)).schema
+                else:
+                    esquema = pa.parquet.read_schema(self._arquivo(nome))
+                self.assertEqual(esquema.field("data").type, pa.date32())
+
+                with self.destino:
+                    self.destino.execute("DELETE FROM venda")
+                resumo = colunar.importar_vendas(self.destino, self._arquivo(nome), 7)
+                self.assertEqual((resumo["linhas_lidas"], resumo["vendas_inseridas"]), (60, 60))
+                self.assertEqual(self._vendas(self.destino), self._vendas(self.origem))
+
+    def test_le_so_as_colunas_de_venda(self):
+        pa = colunar._pyarrow()
+        tabela = pa.table({
+            "data_dia": pa.array(["2025-01-01", "2025-01-02"]).cast(pa.timestamp("s")),
+            "id_produto": ["237478", "237478"],
+            "total_venda_dia_kg": [1.5, 2.5],
+            "observacao": ["x" * 100, "y" * 100],
+        })
+        for nome in ("extra.parquet", "extra.arrow"):
+            with self.subTest(arquivo=nome):
+                if nome.endswith(".arrow"):
+                    with pa.ipc.new_file(self._arquivo(nome), tabela.schema) as escritor:
+                        escritor.write_table(tabela)
+                else:
+                    pa.parquet.write_table(tabela, self._arquivo(nome))
+
+                with mock.patch.object(colunar, "_normalizar_vendas", wraps=colunar._normalizar_vendas) as normalizar:
+                    lotes = list(colunar.ler_lotes_vendas(self._arquivo(nome), colunar.formato_do_arquivo(nome)))
+                self.assertEqual(normalizar.call_args.args[1].schema.names,
+                                 ["data_dia", "id_produto", "total_venda_dia_kg"])
+                self.assertEqual(lotes[0][["data", "quantidade", "produto_sku"]].values.tolist(),
+                                 [["2025-01-01", 1.5, "237478"], ["2025-01-02", 2.5, "237478"]])
+
+    def test_cli_registra_os_resultados_no_log(self):
+        caminho_origem = os.path.join(self.diretorio.name, "origem.db")
+        caminho_destino = os.path.join(self.diretorio.name, "destino.db")
+        with self.assertLogs(level="INFO") as logs:
+            self.assertEqual(
+                colunar.main(["--banco", caminho_origem, "exportar", "venda", self._arquivo("cli.parquet")]), 0
+            )
+            self.assertEqual(colunar.main(["--banco", caminho_destino, "importar", self._arquivo("cli.parquet")]), 0)
+
+        self.assertTrue(any("60 linhas de venda exportadas" in linha for linha in logs.output), logs.output)
+        self.assertTrue(any("'vendas_inseridas': 60" in linha for linha in logs.output), logs.output)
+        self.assertEqual(self._vendas(self.destino), self._vendas(self.origem))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import src.conexoes as Conexoes
+from src.database import criar_banco_e_tabelas
+
+
+class PoolConexoesTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.caminho = os.path.join(self.diretorio.name, "data.db")
+        criar_banco_e_tabelas(sqlite3.connect(self.caminho))
+        config = mock.patch.dict(Conexoes.CONFIG, {"max_conexoes": 2, "max_conexoes_leitura": 2})
+        config.start()
+        self.addCleanup(config.stop)
+
+    def tearDown(self):
+        Conexoes.fechar_todas()
+        self.diretorio.cleanup()
+
+    @staticmethod
+    def _aberta(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1")
+            return True
+        except sqlite3.ProgrammingError:
+            return False
+
+    def test_reaproveita_a_conexao_devolvida(self):
+        conn = Conexoes.obter(self.caminho)
+        Conexoes.devolver(conn, self.caminho)
+        self.assertIs(Conexoes.obter(self.caminho), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+        # Leitura e escrita têm pools separados
+        leitura = Conexoes.obter(self.caminho, somente_leitura=True)
+        self.assertIsNot(leitura, conn)
+        Conexoes.devolver(leitura, self.caminho, somente_leitura=True)
+        self.assertIs(Conexoes.obter(self.caminho, somente_leitura=True), leitura)
+
+    def test_transacao_aberta_e_desfeita_na_devolucao(self):
+        conn = Conexoes.obter(self.caminho)
+        conn.execute("INSERT INTO venda (data, quantidade, produto_sku) VALUES ('2025-03-01', 1.0, '237478')")
+        Conexoes.devolver(conn, self.caminho)
+
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM venda").fetchone()[0], 0)
+
+    def test_excedentes_e_fechadas_nao_voltam_ao_pool(self):
+        conexoes = [Conexoes.obter(self.caminho) for _ in range(3)]
+        for conn in conexoes:
+            Conexoes.devolver(conn, self.caminho)
+        self.assertEqual([self._aberta(conn) for conn in conexoes], [True, True, False])
+
+        fechada = Conexoes.obter(self.caminho)
+        fechada.close()
+        Conexoes.devolver(fechada, self.caminho)
+        self.assertTrue(self._aberta(Conexoes.obter(self.caminho)))
+
+    def test_somente_leitura_nao_escreve_e_nao_bloqueia_o_escritor(self):
+        # A conexão de escrita liga o WAL (no app, a migração abre a primeira antes de qualquer leitura)
+        escrita = Conexoes.obter(self.caminho)
+        leitura = Conexoes.obter(self.caminho, somente_leitura=True)
+        # Com WAL, uma leitura em andamento não impede a escrita e segue vendo o seu instantâneo
+        leitura.execute("BEGIN")
+        self.assertEqual(leitura.execute("SELECT COUNT(*) FROM venda").fetchone()[0], 0)
+        with escrita:
+            escrita.execute("INSERT INTO venda (data, quantidade, produto_sku) VALUES ('2025-03-01', 1.0, '237478')")
+        self.assertEqual(leitura.execute("SELECT COUNT(*) FROM venda").fetchone()[0], 0)
+        Conexoes.devolver(leitura, self.caminho, somente_leitura=True)
+        self.assertEqual(leitura.execute("SELECT COUNT(*) FROM venda").fetchone()[0], 1)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            leitura.execute("DELETE FROM venda")
+
+    def test_requisicoes_concorrentes_nao_passam_do_limite_do_pool(self):
+        criadas = []
+        conectar = Conexoes.conectar
+
+        def contar(*args, **kwargs):
+            conn = conectar(*args, **kwargs)
+            criadas.append(conn)
+            return conn
+
+        barreira = threading.Barrier(4)
+
+        def requisicao():
+            conn = Conexoes.obter(self.caminho)
+            try:
+                barreira.wait(timeout=5)
+                conn.execute("SELECT COUNT(*) FROM produto").fetchone()
+            finally:
+                Conexoes.devolver(conn, self.caminho)
+
+        with mock.patch.object(Conexoes, "conectar", side_effect=contar):
+            threads = [threading.Thread(target=requisicao) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # Quatro requisições simultâneas abrem quatro conexões; só duas ficam no pool
+        self.assertEqual(len(criadas), 4)
+        self.assertEqual(sum(self._aberta(conn) for conn in criadas), 2)
+        with self.assertLogs(level="INFO") as logs:
+            Conexoes.fechar_todas()
+        self.assertIn("2 conexões do pool fechadas", logs.output[-1])
+        self.assertEqual(sum(self._aberta(conn) for conn in criadas), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
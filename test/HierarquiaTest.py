@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from src import hierarquia
+import src.previsao as previsao
+from src.database import criar_banco_e_tabelas
+from src.repositories import PrevisaoRepository
+
+CATEGORIAS = ["FRANGO", "BOVINO", "FRANGO"]
+
+
+def mint_gls(base: np.ndarray, agregacao: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """MinT na forma clássica: (Sᵀ W⁻¹ S)⁻¹ Sᵀ W⁻¹ ŷ, com S = [A; I]."""
+    soma = np.vstack([agregacao, np.eye(agregacao.shape[1])])
+    w_inv = np.linalg.inv(w)
+    return np.linalg.solve(soma.T @ w_inv @ soma, soma.T @ w_inv @ base)
+
+
+class ReconciliacaoTest(unittest.TestCase):
+    def setUp(self):
+        self.categorias, self.agregacao = hierarquia.matriz_agregacao(CATEGORIAS)
+        rng = np.random.default_rng(1)
+        self.historico_skus = rng.gamma(5, 2, (3, 56))
+        self.historico_agregados = self.agregacao @ self.historico_skus
+        # Previsões base incoerentes: cada nível errado de um jeito
+        self.base_skus = rng.gamma(5, 2, (3, 7))
+        self.base_agregados = self.agregacao @ self.base_skus * np.array([[1.2], [0.9], [1.1]])
+
+    def _reconciliar(self, metodo: str) -> np.ndarray:
+        return hierarquia.reconciliar(
+            metodo, self.base_agregados, self.base_skus, self.agregacao,
+            self.historico_agregados, self.historico_skus,
+        )
+
+    def test_matriz_de_agregacao(self):
+        self.assertEqual(self.categorias, ["BOVINO", "FRANGO"])
+        np.testing.assert_array_equal(self.agregacao, [[1, 1, 1], [0, 1, 0], [1, 0, 1]])
+
+    def test_mint_igual_a_forma_classica(self):
+        historico = np.vstack([self.historico_agregados, self.historico_skus])
+        residuos = historico[:, 7:] - historico[:, :-7]
+        base = np.vstack([self.base_agregados, self.base_skus])
+
+        w = hierarquia.covariancia_encolhida(residuos)
+        np.testing.assert_allclose(self._reconciliar("mint"), np.clip(mint_gls(base, self.agregacao, w), 0, None))
+
+        # Catálogo grande: só as variâncias
+        with mock.patch.dict(hierarquia.CONFIG, {"max_nos_covariancia": 0}):
+            diagonal = self._reconciliar("mint")
+        w = np.diag(np.var(residuos, axis=1))
+        np.testing.assert_allclose(diagonal, np.clip(mint_gls(base, self.agregacao, w), 0, None))
+
+    def test_previsoes_coerentes_nao_mudam(self):
+        self.base_agregados = self.agregacao @ self.base_skus
+        for metodo in ("bottom_up", "mint"):
+            np.testing.assert_allclose(self._reconciliar(metodo), self.base_skus)
+
+    def test_top_down_e_categoria_distribuem_pela_participacao(self):
+        janela = hierarquia.CONFIG["janela_proporcoes"]
+        recente = self.historico_skus[:, -janela:].sum(axis=1)
+
+        top_down = self._reconciliar("top_down")
+        np.testing.assert_allclose(top_down.sum(axis=0), self.base_agregados[0])
+        np.testing.assert_allclose(top_down[:, 0] / top_down[:, 0].sum(), recente / recente.sum())
+
+        categoria = self._reconciliar("categoria")
+        np.testing.assert_allclose(self.agregacao[1:] @ categoria, self.base_agregados[1:])
+        np.testing.assert_allclose(categoria[0] / categoria[2], recente[0] / recente[2])
+
+        with self.assertRaises(ValueError):
+            self._reconciliar("media")
+
+
+class PrevisaoHierarquicaTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        caminho = os.path.join(self.diretorio.name, "data.db")
+        criar_banco_e_tabelas(sqlite3.connect(caminho))
+        self.conn = sqlite3.connect(caminho)
+        quantidades = np.random.default_rng(1).gamma(5, 2, (3, 60))
+        datas = pd.date_range("2025-01-01", periods=60, freq="D")
+        previsao.importar_vendas_df(self.conn, pd.DataFrame([
+            {
+                "data_dia": data.strftime(previsao.FORMATO_DATA_CSV),
+                "id_produto": f"90000{i}",
+                "descricao_produto": f"PRODUTO {i}",
+                "total_venda_dia_kg": float(quantidades[i, j]),
+                "Equipe responsável": categoria,
+            }
+            for i, categoria in enumerate(CATEGORIAS)
+            for j, data in enumerate(datas)
+        ]))
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def test_niveis_somam_em_todos_os_metodos(self):
+        for metodo in hierarquia.METODOS:
+            with self.subTest(metodo=metodo):
+                niveis = hierarquia.prever_hierarquico(self.conn, metodo)
+                self.assertEqual(set(niveis["metodo"]), {f"hierarquico_{metodo}"})
+                tabela = niveis.pivot_table(index="ds", columns="chave", values="yhat")
+                skus = tabela[["900000", "900001", "900002"]]
+                np.testing.assert_allclose(tabela["total"], skus.sum(axis=1))
+                np.testing.assert_allclose(tabela["FRANGO"], tabela["900000"] + tabela["900002"])
+                np.testing.assert_allclose(tabela["BOVINO"], tabela["900001"])
+
+    def test_prever_grava_skus_e_niveis_agregados(self):
+        with mock.patch.dict(previsao.CONFIG, {"motor": "hierarquico", "reajuste_seletivo": False}):
+            execucao_id = previsao.prever(self.conn, workers=1)
+
+        skus = pd.read_sql_query("SELECT produto_sku, data, quantidade_prevista FROM previsao", self.conn)
+        self.assertEqual(len(skus), 3 * 14)
+        totais = PrevisaoRepository.buscar_previsoes_agregadas(self.conn, "total")
+        self.assertEqual(len(totais), 14)
+        self.assertEqual({t["metodo"] for t in totais}, {"hierarquico_mint"})
+        soma_skus = skus.groupby("data")["quantidade_prevista"].sum()
+        for total in totais:
+            self.assertAlmostEqual(total["quantidade_prevista"], soma_skus[total["data"]], places=2)
+        self.assertEqual(
+            self.conn.execute("SELECT DISTINCT execucao_id FROM previsao_agregada").fetchall(), [(execucao_id,)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import src.hiperparametros as hiperparametros
+import src.previsao as previsao
+from src.database import criar_banco_e_tabelas
+from src.repositories import HiperparametroRepository, VendaRepository
+
+# Grade pequena: a combinação padrão do Prophet e mais uma
+GRADE = {"changepoint_prior_scale": [0.01, 0.5], "fourier_order": [3]}
+
+
+class BuscaHiperparametrosTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        caminho = os.path.join(self.diretorio.name, "data.db")
+        criar_banco_e_tabelas(sqlite3.connect(caminho))
+        self.conn = sqlite3.connect(caminho)
+        config = mock.patch.dict(hiperparametros.CONFIG, {"grade": GRADE, "folds": 2})
+        config.start()
+        self.addCleanup(config.stop)
+        self._vender(90)
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _vender(self, dias: int):
+        quantidades = np.random.default_rng(1).gamma(5, 2, dias)
+        VendaRepository.gravar_vendas_em_lote(self.conn, [
+            (data.strftime("%Y-%m-%d"), float(quantidade), "237478")
+            for data, quantidade in zip(pd.date_range("2025-01-01", periods=dias, freq="D"), quantidades)
+        ])
+
+    def _ajustar(self, **argumentos):
+        with mock.patch.object(hiperparametros, "avaliar_combinacao",
+                               wraps=hiperparametros.avaliar_combinacao) as avaliar:
+            vencedores = hiperparametros.ajustar_hiperparametros(self.conn, **argumentos)
+        folds_avaliados = sorted(len(chamada.args[2]) for chamada in avaliar.call_args_list)
+        return vencedores, folds_avaliados
+
+    def test_grava_o_vencedor_e_reaproveita_os_folds_ja_avaliados(self):
+        vencedores, folds_avaliados = self._ajustar()
+        self.assertEqual(folds_avaliados, [2, 2])
+        vencedor = vencedores["237478"]
+        self.assertEqual((vencedor["folds"], vencedor["combinacoes"]), (2, 2))
+        self.assertIsNotNone(vencedor["rmse_padrao"])
+        self.assertLessEqual(vencedor["rmse"], vencedor["rmse_padrao"])
+        self.assertEqual(
+            HiperparametroRepository.buscar_vencedores(self.conn)["237478"],
+            {"changepoint_prior_scale": vencedor["changepoint_prior_scale"],
+             "fourier_order": vencedor["fourier_order"]},
+        )
+
+        # Sem vendas novas nada é reavaliado; com uma semana nova, só o fold novo
+        self.assertEqual(self._ajustar()[1], [])
+        self._vender(97)
+        vencedores, folds_avaliados = self._ajustar()
+        self.assertEqual(folds_avaliados, [1, 1])
+        self.assertEqual(vencedores["237478"]["folds"], 2)
+
+    def test_worker_morto_deixa_o_sku_sem_vencedor_sem_interromper_a_busca(self):
+        # Limite de memória que derruba os workers já no initializer: o pool quebra
+        with mock.patch.dict(previsao.CONFIG, {"memoria_max_mb_worker": 1}), \
+                self.assertLogs(level="ERROR") as logs:
+            vencedores = hiperparametros.ajustar_hiperparametros(self.conn, workers=2)
+
+        self.assertEqual(vencedores, {})
+        self.assertTrue(any("BrokenProcessPool" in linha for linha in logs.output), logs.output)
+        self.assertEqual(HiperparametroRepository.buscar_vencedores(self.conn), {})
+        self.assertEqual(HiperparametroRepository.buscar_folds(self.conn, "237478", 7), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
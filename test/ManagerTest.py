@@ -0,0 +1,362 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+import pandas as pd
+
+from src import manager, migracoes
+from src.database import criar_banco_e_tabelas
+from src.repositories import (
+    ImportacaoRepository, LoteRepository, PrevisaoRepository, ResumoRepository, VendaRepository,
+)
+
+# Esquema base anterior às migrações (lote com datas, kg e status em texto)
+ESQUEMA_ANTIGO = [
+    "CREATE TABLE produto (sku TEXT PRIMARY KEY, nome TEXT NOT NULL, categoria TEXT NOT NULL)",
+    """
+    CREATE TABLE lote (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        quantidade_retirada FLOAT NOT NULL,
+        quantidade_atual FLOAT NOT NULL,
+        idade INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        data_retirado DATE NOT NULL,
+        data_venda DATE NOT NULL,
+        data_expiracao DATE NOT NULL,
+        produto_sku TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE venda (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data DATE NOT NULL,
+        quantidade FLOAT NOT NULL,
+        produto_sku TEXT NOT NULL,
+        UNIQUE (data, produto_sku)
+    )
+    """,
+    """
+    CREATE TABLE previsao (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data DATE NOT NULL,
+        quantidade_prevista FLOAT NOT NULL,
+        produto_sku TEXT NOT NULL,
+        UNIQUE (produto_sku, data)
+    )
+    """,
+]
+
+
+def tabelas(conn: sqlite3.Connection) -> set:
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def resumos(conn: sqlite3.Connection) -> dict:
+    """Linhas não vazias das tabelas de resumo, com os totais arredondados."""
+    consultas = {
+        "venda_diaria": "SELECT data, round(total, 6), registros FROM venda_diaria WHERE registros != 0",
+        "venda_resumo_sku": "SELECT produto_sku, round(total, 6), dias FROM venda_resumo_sku WHERE dias != 0",
+        "estoque_sku": "SELECT produto_sku, status, quantidade, lotes FROM estoque_sku WHERE lotes != 0",
+        "perda_diaria_sku": "SELECT data, produto_sku, quantidade, lotes FROM perda_diaria_sku WHERE lotes != 0",
+    }
+    return {tabela: sorted(conn.execute(sql).fetchall()) for tabela, sql in consultas.items()}
+
+
+class MigracoesTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.caminho = os.path.join(self.diretorio.name, "data.db")
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def _banco_na_versao(self, versao: int) -> sqlite3.Connection:
+        """Banco com o esquema base e só as migrações até `versao`, como um banco antigo."""
+        with mock.patch.object(migracoes, "MIGRACOES", [m for m in migracoes.MIGRACOES if m[0] <= versao]):
+            criar_banco_e_tabelas(sqlite3.connect(self.caminho))
+        conn = sqlite3.connect(self.caminho)
+        self.addCleanup(conn.close)
+        self.assertEqual(migracoes.versao_atual(conn), versao)
+        return conn
+
+    def test_falha_na_migracao_de_tabelas_auxiliares_nao_deixa_nada_pela_metade(self):
+        conn = self._banco_na_versao(4)
+
+        with mock.patch.object(ImportacaoRepository, "criar_tabela", side_effect=sqlite3.OperationalError("falha")):
+            with self.assertRaises(sqlite3.OperationalError):
+                migracoes.aplicar_migracoes(conn)
+
+        self.assertEqual(migracoes.versao_atual(conn), 4)
+        self.assertNotIn("tarefa_previsao", tabelas(conn))
+        self.assertNotIn("estado_previsao", tabelas(conn))
+
+        self.assertEqual(migracoes.aplicar_migracoes(conn), migracoes.MIGRACOES[-1][0])
+        self.assertTrue({"tarefa_previsao", "estado_previsao", "importacao_arquivo"} <= tabelas(conn))
+
+    def test_banco_antigo_com_dados_migra_ate_a_ultima_versao(self):
+        conn = sqlite3.connect(self.caminho)
+        self.addCleanup(conn.close)
+        for sql in ESQUEMA_ANTIGO:
+            conn.execute(sql)
+        conn.execute("INSERT INTO produto VALUES ('237478', 'FILE DE PEITO', 'FRANGO')")
+        conn.executemany(
+            "INSERT INTO lote (quantidade_retirada, quantidade_atual, idade, status, data_retirado, "
+            "data_venda, data_expiracao, produto_sku) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (8.5, 2.25, 3, "disponivel", "2025-03-01", "2025-03-03", "2025-03-05", "237478"),
+                (4.0, 1.5, 5, "perda", "2025-02-25", "2025-02-27", "2025-03-01", "237478"),
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO venda (data, quantidade, produto_sku) VALUES (?, ?, '237478')",
+            [("2025-03-01", 3.5), ("2025-03-02", 4.0)],
+        )
+        conn.execute("INSERT INTO previsao (data, quantidade_prevista, produto_sku) VALUES ('2025-03-03', 5.0, '237478')")
+        conn.commit()
+
+        versao_final = migracoes.MIGRACOES[-1][0]
+        self.assertEqual(migracoes.aplicar_migracoes(conn), versao_final)
+        self.assertEqual(migracoes.aplicar_migracoes(conn), versao_final)
+
+        # lote no formato compacto, legível pela visão com os valores originais
+        self.assertEqual(
+            conn.execute("SELECT status, quantidade_atual, data_expiracao FROM lote ORDER BY id").fetchall(),
+            [(LoteRepository.STATUS["disponivel"], 2250, LoteRepository.para_dia(date(2025, 3, 5))),
+             (LoteRepository.STATUS["perda"], 1500, LoteRepository.para_dia(date(2025, 3, 1)))],
+        )
+        self.assertEqual(
+            conn.execute("SELECT status, quantidade_atual, data_expiracao FROM lote_legivel WHERE id = 1").fetchone(),
+            ("disponivel", 2.25, "2025-03-05"),
+        )
+
+        colunas_previsao = {row[1] for row in conn.execute("PRAGMA table_info(previsao)")}
+        self.assertTrue({"metodo", "yhat_lower", "yhat_upper", "execucao_id"} <= colunas_previsao)
+        self.assertEqual(conn.execute("SELECT quantidade_prevista FROM previsao").fetchone()[0], 5.0)
+
+        # Resumos preenchidos com o histórico que já existia
+        self.assertEqual(resumos(conn), {
+            "venda_diaria": [("2025-03-01", 3.5, 1), ("2025-03-02", 4.0, 1)],
+            "venda_resumo_sku": [("237478", 7.5, 2)],
+            "estoque_sku": [("237478", LoteRepository.STATUS["disponivel"], 2250, 1),
+                            ("237478", LoteRepository.STATUS["perda"], 1500, 1)],
+            "perda_diaria_sku": [(LoteRepository.para_dia(date(2025, 3, 1)), "237478", 1500, 1)],
+        })
+
+    def test_lote_vencido_do_esquema_antigo_vira_perda(self):
+        conn = sqlite3.connect(self.caminho)
+        self.addCleanup(conn.close)
+        for sql in ESQUEMA_ANTIGO:
+            conn.execute(sql)
+        conn.execute("INSERT INTO produto VALUES ('237478', 'FILE DE PEITO', 'FRANGO')")
+        conn.executemany(
+            "INSERT INTO lote (quantidade_retirada, quantidade_atual, idade, status, data_retirado, "
+            "data_venda, data_expiracao, produto_sku) VALUES (?, ?, ?, ?, ?, ?, ?, '237478')",
+            [
+                (5.0, 3.0, 2, "disponivel", "2025-02-28", "2025-03-02", "2025-03-04"),
+                (4.0, 1.5, 5, "vencido", "2025-03-01", "2025-03-03", "2025-03-05"),
+            ],
+        )
+        conn.commit()
+
+        migracoes.aplicar_migracoes(conn)
+
+        self.assertEqual(
+            conn.execute("SELECT status FROM lote_legivel ORDER BY id").fetchall(), [("disponivel",), ("perda",)]
+        )
+        # O lote vencido entra em P(t-1): D(t) = 0.85 * R(t-2) + D(t-1) - V(t-1) - P(t-1)
+        self.assertAlmostEqual(
+            manager.calcular_qtd_disponivel(conn, "237478", date(2025, 3, 2)), 0.85 * 5.0 + 3.0 - 0.0 - 1.5
+        )
+
+
+class ResumosTest(unittest.TestCase):
+    """Os gatilhos mantêm os resumos iguais a um recálculo completo após cada alteração."""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        caminho = os.path.join(self.diretorio.name, "data.db")
+        criar_banco_e_tabelas(sqlite3.connect(caminho))
+        self.conn = sqlite3.connect(caminho)
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _executar_e_conferir(self, sql: str, parametros=()):
+        with self.conn:
+            self.conn.execute(sql, parametros)
+        pelos_gatilhos = resumos(self.conn)
+        ResumoRepository.recalcular(self.conn)
+        recalculados = resumos(self.conn)
+        self.conn.rollback()
+        self.assertEqual(pelos_gatilhos, recalculados, sql)
+
+    def test_vendas(self):
+        for data, quantidade, sku in [("2025-03-01", 3.5, "237478"), ("2025-03-01", 2.0, "237479"),
+                                      ("2025-03-02", 4.0, "237478")]:
+            self._executar_e_conferir(
+                "INSERT INTO venda (data, quantidade, produto_sku) VALUES (?, ?, ?)", (data, quantidade, sku)
+            )
+        self._executar_e_conferir(
+            "INSERT INTO venda (data, quantidade, produto_sku) VALUES ('2025-03-01', 9.0, '237478') "
+            "ON CONFLICT(data, produto_sku) DO UPDATE SET quantidade = excluded.quantidade"
+        )
+        self._executar_e_conferir("UPDATE venda SET data = '2025-03-03' WHERE produto_sku = '237479'")
+        self._executar_e_conferir("UPDATE venda SET produto_sku = '237496' WHERE data = '2025-03-02'")
+        self._executar_e_conferir("DELETE FROM venda WHERE produto_sku = '237478'")
+        self.assertEqual(
+            resumos(self.conn)["venda_resumo_sku"], [("237479", 2.0, 1), ("237496", 4.0, 1)]
+        )
+
+    def test_lotes(self):
+        dia = LoteRepository.para_dia(date(2025, 3, 1))
+        for quantidade, status, sku in [(2250, "disponivel", "237478"), (1500, "descongelando", "237478"),
+                                        (800, "disponivel", "237479")]:
+            self._executar_e_conferir(
+                "INSERT INTO lote (quantidade_retirada, quantidade_atual, idade, status, data_retirado, "
+                "data_venda, data_expiracao, produto_sku) VALUES (?, ?, 0, ?, ?, ?, ?, ?)",
+                (quantidade, quantidade, LoteRepository.STATUS[status], dia, dia + 2, dia + 4, sku),
+            )
+        self._executar_e_conferir("UPDATE lote SET quantidade_atual = 1000 WHERE id = 1")
+        self._executar_e_conferir("UPDATE lote SET status = ? WHERE id = 1", (LoteRepository.STATUS["perda"],))
+        self._executar_e_conferir("UPDATE lote SET data_expiracao = data_expiracao + 1 WHERE id = 1")
+        self._executar_e_conferir("UPDATE lote SET status = ? WHERE id = 1", (LoteRepository.STATUS["vendido"],))
+        self._executar_e_conferir("UPDATE lote SET produto_sku = '237496' WHERE id = 3")
+        self._executar_e_conferir("DELETE FROM lote WHERE id = 2")
+
+
+    def test_mais_vendidos_agrega_o_periodo_numa_passada(self):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO venda (data, quantidade, produto_sku) VALUES (?, ?, ?)",
+                [(f"2025-03-{dia:02d}", float(dia * (i + 1)), sku)
+                 for i, sku in enumerate(("237478", "237479", "237496", "999999"))
+                 for dia in range(1, 11)],
+            )
+        # Consulta antiga do dashboard: junta venda e produto e agrupa por SKU
+        esperado = self.conn.execute(
+            """
+            SELECT p.sku, p.nome, SUM(v.quantidade) FROM venda v JOIN produto p ON v.produto_sku = p.sku
+            WHERE v.data >= '2025-03-04' GROUP BY p.sku ORDER BY 3 DESC LIMIT 2
+            """
+        ).fetchall()
+
+        comandos = []
+        self.conn.set_trace_callback(comandos.append)
+        mais_vendidos = ResumoRepository.mais_vendidos(self.conn, "2025-03-04", 2)
+        self.conn.set_trace_callback(None)
+        self.assertEqual([(m["sku"], m["nome"], m["total_vendido"]) for m in mais_vendidos], esperado)
+        self.assertEqual([m["sku"] for m in mais_vendidos], ["237496", "237479"])
+
+        # venda é lida uma única vez pelo índice de cobertura, não uma vez por produto
+        plano = [linha[3] for linha in self.conn.execute("EXPLAIN QUERY PLAN " + comandos[0])]
+        self.assertEqual([linha for linha in plano if "venda" in linha],
+                         ["SEARCH venda USING COVERING INDEX idx_venda_data (data>?)"])
+        self.assertFalse([linha for linha in plano if linha.startswith("SCAN p")], plano)
+
+
+class GravacaoVendasEmLoteTest(unittest.TestCase):
+    """Lotes passam pela tabela de staging; SKUs sem cadastro vão para venda_rejeitada."""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        caminho = os.path.join(self.diretorio.name, "data.db")
+        criar_banco_e_tabelas(sqlite3.connect(caminho))
+        self.conn = sqlite3.connect(caminho)
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _vendas(self):
+        return self.conn.execute("SELECT data, quantidade, produto_sku FROM venda ORDER BY data").fetchall()
+
+    def test_grava_atualiza_e_rejeita(self):
+        comandos = []
+        self.conn.set_trace_callback(comandos.append)
+        gravadas, rejeitadas = VendaRepository.gravar_vendas_em_lote(self.conn, [
+            ("2025-03-01", 3.5, "237478"), ("2025-03-02", 4.0, "237478"), ("2025-03-01", 2.0, "999999"),
+        ])
+        self.conn.set_trace_callback(None)
+
+        self.assertEqual((gravadas, rejeitadas), (2, 1))
+        self.assertEqual(self._vendas(), [("2025-03-01", 3.5, "237478"), ("2025-03-02", 4.0, "237478")])
+        rejeitada = VendaRepository.buscar_vendas_rejeitadas(self.conn)[0]
+        self.assertEqual(
+            (rejeitada["data"], rejeitada["produto_sku"], rejeitada["motivo"]),
+            ("2025-03-01", "999999", "produto_inexistente"),
+        )
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM venda_staging").fetchone()[0], 0)
+        # venda_rejeitada vem da migração: nenhum DDL dela a cada lote
+        self.assertFalse([c for c in comandos if "CREATE TABLE" in c and "venda_rejeitada" in c], comandos)
+
+        # Reenviar o mesmo dia atualiza a quantidade em vez de duplicar
+        self.assertEqual(VendaRepository.gravar_vendas_em_lote(self.conn, [("2025-03-01", 5.0, "237478")]), (1, 0))
+        self.assertEqual(self._vendas()[0], ("2025-03-01", 5.0, "237478"))
+
+    def test_lote_com_erro_nao_grava_nada(self):
+        with self.assertRaises(sqlite3.IntegrityError):
+            VendaRepository.gravar_vendas_em_lote(self.conn, [
+                ("2025-03-01", 3.5, "237478"), ("2025-03-02", None, "237478"), ("2025-03-03", 1.0, "999999"),
+            ])
+
+        self.assertEqual(self._vendas(), [])
+        self.assertEqual(VendaRepository.buscar_vendas_rejeitadas(self.conn), [])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM venda_staging").fetchone()[0], 0)
+
+
+class DesvioPelaPrevisaoTest(unittest.TestCase):
+    """Retirada de 2025-03-01 para a venda de 2025-03-03, com demanda média de 10 kg."""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        caminho = os.path.join(self.diretorio.name, "data.db")
+        criar_banco_e_tabelas(sqlite3.connect(caminho))
+        self.conn = sqlite3.connect(caminho)
+        self.conn.row_factory = sqlite3.Row
+        VendaRepository.gravar_vendas_em_lote(self.conn, [
+            ("2025-02-25", 8.0, "237478"), ("2025-02-26", 10.0, "237478"), ("2025-02-27", 12.0, "237478"),
+        ])
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _prever(self, **colunas):
+        PrevisaoRepository.salvar_previsoes_em_lote(self.conn, pd.DataFrame({
+            "produto_sku": ["237478"], "ds": [pd.Timestamp("2025-03-03")], "yhat": [12.0], **colunas,
+        }))
+
+    def test_desvio_vem_do_intervalo_gravado(self):
+        margem = PrevisaoRepository.Z_INTERVALO * 2.0
+        self._prever(yhat_lower=[12.0 - margem], yhat_upper=[12.0 + margem])
+
+        previsto, desvio = PrevisaoRepository.obter_previsao_e_desvio(self.conn, "237478", date(2025, 3, 3))
+        self.assertEqual(previsto, 12.0)
+        self.assertAlmostEqual(desvio, 2.0, places=3)
+
+        with mock.patch.object(manager, "calcular_desvio_padrao") as historico:
+            retirada = manager.calcular_retirada(self.conn, "237478", date(2025, 3, 1))
+        historico.assert_not_called()
+        self.assertAlmostEqual(retirada, (12.0 + manager.k_seg * 2.0) / manager.alpha, places=2)
+
+    def test_previsao_sem_intervalo_usa_o_historico_de_erros(self):
+        self._prever()
+        self.assertEqual(
+            PrevisaoRepository.obter_previsao_e_desvio(self.conn, "237478", date(2025, 3, 3)), (12.0, None)
+        )
+        self.assertEqual(
+            PrevisaoRepository.obter_previsao_e_desvio(self.conn, "237478", date(2025, 3, 4)), (None, None)
+        )
+
+        with mock.patch.object(manager, "calcular_desvio_padrao", return_value=1.0) as historico:
+            retirada = manager.calcular_retirada(self.conn, "237478", date(2025, 3, 1))
+        historico.assert_called_once()
+        self.assertAlmostEqual(retirada, (12.0 + manager.k_seg * 1.0) / manager.alpha)
+
+
+if __name__ == "__main__":
+    unittest.main()
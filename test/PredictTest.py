@@ -0,0 +1,549 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import src.previsao as previsao
+from src import calendario
+from src.database import criar_banco_e_tabelas
+from src.repositories import (
+    EstadoPrevisaoRepository, ExecucaoRepository, ModeloRepository, PrevisaoRepository, VendaRepository,
+)
+
+
+def criar_banco_temporario(diretorio: str) -> sqlite3.Connection:
+    """Banco novo com o esquema base e todas as migrações (inclusive os gatilhos de resumo)."""
+    caminho = os.path.join(diretorio, "data.db")
+    criar_banco_e_tabelas(sqlite3.connect(caminho))
+    return sqlite3.connect(caminho)
+
+
+def csv_de_vendas(dias: int, skus=("237478",), inicio: str = "2025-01-01") -> pd.DataFrame:
+    datas = pd.date_range(inicio, periods=dias, freq="D")
+    return pd.DataFrame([
+        {
+            "data_dia": data.strftime(previsao.FORMATO_DATA_CSV),
+            "id_produto": sku,
+            "descricao_produto": f"PRODUTO {sku}",
+            "total_venda_dia_kg": 10.0 + i,
+            "Equipe responsável": "FRANGO",
+        }
+        for sku in skus
+        for i, data in enumerate(datas)
+    ])
+
+
+def serie_ruidosa(dias: int, inicio: str = "2025-01-01") -> pd.DataFrame:
+    """Série no formato de carregar_dados_do_banco, com ruído para o Prophet convergir."""
+    return pd.DataFrame({
+        "data_dia": pd.date_range(inicio, periods=dias, freq="D"),
+        "total_venda_dia_kg": np.random.default_rng(1).gamma(5, 2, dias),
+    })
+
+
+class ImportacaoVendasTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.conn = criar_banco_temporario(self.diretorio.name)
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def test_resumo_nao_conta_alteracoes_dos_gatilhos(self):
+        gatilhos = self.conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'venda'"
+        ).fetchone()[0]
+        self.assertGreater(gatilhos, 0)
+
+        resumo = previsao.importar_vendas_df(self.conn, csv_de_vendas(90))
+        self.assertEqual(resumo["linhas_lidas"], 90)
+        self.assertEqual(resumo["vendas_inseridas"], 90)
+        self.assertEqual(resumo["vendas_ignoradas"], 0)
+        self.assertEqual(resumo["produtos_criados"], 0)
+
+        resumo = previsao.importar_vendas_df(self.conn, csv_de_vendas(91, skus=("237478", "999001")))
+        self.assertEqual(resumo["vendas_inseridas"], 92)
+        self.assertEqual(resumo["vendas_ignoradas"], 90)
+        self.assertEqual(resumo["produtos_criados"], 1)
+
+    def test_salvar_previsoes_conta_so_linhas_alteradas(self):
+        previsoes = pd.DataFrame({
+            "produto_sku": "237478",
+            "ds": pd.date_range("2025-04-01", periods=7, freq="D"),
+            "yhat": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0],
+        })
+        self.assertEqual(PrevisaoRepository.salvar_previsoes_em_lote(self.conn, previsoes), 7)
+        self.assertEqual(PrevisaoRepository.salvar_previsoes_em_lote(self.conn, previsoes), 0)
+        previsoes.loc[0, "yhat"] = 10.0
+        self.assertEqual(PrevisaoRepository.salvar_previsoes_em_lote(self.conn, previsoes), 1)
+
+
+class ImportacaoIncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.conn = criar_banco_temporario(self.diretorio.name)
+        self.caminho = os.path.join(self.diretorio.name, "vendas.csv")
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _escrever(self, conteudo: str, modo: str = "w"):
+        with open(self.caminho, modo, newline="") as arquivo:
+            arquivo.write(conteudo)
+
+    def _vendas(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM venda").fetchone()[0]
+
+    def test_retoma_do_ultimo_offset(self):
+        linhas = csv_de_vendas(20).to_csv(index=False).splitlines(keepends=True)
+        self._escrever("".join(linhas[:11]))
+
+        self.assertEqual(previsao.importar_vendas_csv_incremental(self.conn, self.caminho)["modo"], "completo")
+        self.assertEqual(self._vendas(), 10)
+        self.assertEqual(previsao.importar_vendas_csv_incremental(self.conn, self.caminho)["modo"], "inalterado")
+
+        self._escrever("".join(linhas[11:]), "a")
+        resumo = previsao.importar_vendas_csv_incremental(self.conn, self.caminho)
+        self.assertEqual(resumo["modo"], "incremental")
+        self.assertEqual(resumo["linhas_lidas"], 10)
+        self.assertEqual(self._vendas(), 20)
+
+    def test_ultima_linha_sem_quebra_de_linha(self):
+        conteudo = csv_de_vendas(5).to_csv(index=False)
+        self._escrever(conteudo.rstrip("\n"))
+
+        # A última linha pode estar sendo escrita: fica para a próxima chamada
+        self.assertEqual(previsao.importar_vendas_csv_incremental(self.conn, self.caminho)["linhas_lidas"], 4)
+        self.assertEqual(self._vendas(), 4)
+
+        # Arquivo sem mudanças desde a chamada anterior: o fim do arquivo encerra a linha
+        resumo = previsao.importar_vendas_csv_incremental(self.conn, self.caminho)
+        self.assertEqual(resumo["modo"], "incremental")
+        self.assertEqual(resumo["linhas_lidas"], 1)
+        self.assertEqual(self._vendas(), 5)
+        self.assertEqual(previsao.importar_vendas_csv_incremental(self.conn, self.caminho)["modo"], "inalterado")
+
+        # Linhas acrescentadas depois continuam incrementais, sem repetir a última
+        seguintes = csv_de_vendas(2, inicio="2025-01-06").to_csv(index=False).splitlines(keepends=True)[1:]
+        self._escrever("\n" + "".join(seguintes), "a")
+        resumo = previsao.importar_vendas_csv_incremental(self.conn, self.caminho)
+        self.assertEqual(resumo["modo"], "incremental")
+        self.assertEqual(resumo["vendas_inseridas"], 2)
+        self.assertEqual(self._vendas(), 7)
+
+    def test_linha_parcial_completada_entre_chamadas(self):
+        linhas = csv_de_vendas(3).to_csv(index=False).splitlines(keepends=True)
+        self._escrever("".join(linhas[:3]) + linhas[3][:-4])
+        self.assertEqual(previsao.importar_vendas_csv_incremental(self.conn, self.caminho)["linhas_lidas"], 2)
+
+        self._escrever(linhas[3][-4:], "a")
+        self.assertEqual(previsao.importar_vendas_csv_incremental(self.conn, self.caminho)["linhas_lidas"], 1)
+        self.assertEqual(
+            self.conn.execute("SELECT quantidade FROM venda ORDER BY data DESC LIMIT 1").fetchone()[0], 12.0
+        )
+
+
+class DecisaoReajusteTest(unittest.TestCase):
+    """SKU 237478 com 60 dias de venda (10 a 69 kg), ajustado até 2025-03-01 e previsto por 7 dias."""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.conn = criar_banco_temporario(self.diretorio.name)
+        previsao.importar_vendas_df(self.conn, csv_de_vendas(60))
+        # Validação do ajuste (datas já conhecidas) muito errada e futuro certeiro
+        PrevisaoRepository.salvar_previsoes_em_lote(self.conn, pd.DataFrame({
+            "produto_sku": "237478",
+            "ds": pd.date_range("2025-02-23", periods=14, freq="D"),
+            "yhat": [0.0] * 7 + [70.0 + i for i in range(7)],
+        }))
+        EstadoPrevisaoRepository.registrar_ajustes(self.conn, {"237478": "2025-03-08"})
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _motivo(self) -> str:
+        return previsao.decidir_reajustes(self.conn)[0]["motivo"]
+
+    def _vendas_novas(self, quantidades):
+        VendaRepository.gravar_vendas_em_lote(self.conn, [
+            (data.strftime("%Y-%m-%d"), quantidade, "237478")
+            for data, quantidade in zip(pd.date_range("2025-03-02", periods=len(quantidades), freq="D"), quantidades)
+        ])
+
+    def test_erro_compara_vendas_novas_com_previsoes_futuras(self):
+        self.assertEqual(self._motivo(), "em_dia")
+
+        self._vendas_novas([70.0, 71.0, 72.0])
+        decisao = previsao.decidir_reajustes(self.conn)[0]
+        self.assertEqual(decisao["motivo"], "em_dia")
+        self.assertEqual(decisao["dias_avaliados"], 3)
+        self.assertEqual(decisao["erro"], 0.0)
+
+        self._vendas_novas([70.0, 71.0, 72.0, 10.0])
+        decisao = previsao.decidir_reajustes(self.conn)[0]
+        self.assertEqual(decisao["motivo"], "erro")
+        self.assertEqual(decisao["dias_avaliados"], 4)
+
+    def test_reenvio_de_vendas_conhecidas_marca_historico_alterado(self):
+        # Reenvio com os mesmos valores não muda o histórico
+        VendaRepository.gravar_vendas_em_lote(self.conn, [("2025-02-10", 50.0, "237478")])
+        self.assertEqual(self._motivo(), "em_dia")
+
+        VendaRepository.gravar_vendas_em_lote(self.conn, [("2025-02-10", 5.0, "237478")])
+        self.assertEqual(self._motivo(), "historico_alterado")
+
+        EstadoPrevisaoRepository.registrar_ajustes(self.conn, {"237478": "2025-03-08"})
+        self.assertEqual(self._motivo(), "em_dia")
+
+        self.conn.execute("DELETE FROM venda WHERE data = '2025-01-15'")
+        self.conn.commit()
+        self.assertEqual(self._motivo(), "historico_alterado")
+
+
+class ReajusteAposPrevisaoTest(unittest.TestCase):
+    """Rodada real de prever() com 60 dias de venda (até 2025-03-01) seguida de vendas novas."""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.conn = criar_banco_temporario(self.diretorio.name)
+        serie = serie_ruidosa(60)
+        VendaRepository.gravar_vendas_em_lote(self.conn, [
+            (data.strftime("%Y-%m-%d"), float(quantidade), "237478")
+            for data, quantidade in zip(serie["data_dia"], serie["total_venda_dia_kg"])
+        ])
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _decisao(self) -> dict:
+        return next(d for d in previsao.decidir_reajustes(self.conn) if d["sku"] == "237478")
+
+    def _vender(self, inicio: str, dias: int, fator: float):
+        """Vendas de `dias` dias a partir de inicio, iguais a fator × a previsão gravada."""
+        previstas = self.conn.execute(
+            "SELECT data, quantidade_prevista FROM previsao WHERE produto_sku = '237478' AND data >= ? "
+            "ORDER BY data LIMIT ?", (inicio, dias),
+        ).fetchall()
+        self.assertEqual(len(previstas), dias)
+        VendaRepository.gravar_vendas_em_lote(
+            self.conn, [(data, fator * quantidade, "237478") for data, quantidade in previstas]
+        )
+
+    def test_vendas_muito_abaixo_da_previsao_disparam_o_reajuste(self):
+        for motor in ("prophet", "vetorizado"):
+            with self.subTest(motor=motor), mock.patch.dict(previsao.CONFIG, {
+                "motor": motor, "reajuste_seletivo": True, "cache_modelos": False, "dias_max_sem_ajuste": 30,
+            }):
+                self.conn.execute("DELETE FROM venda WHERE data > '2025-03-01'")
+                self.conn.execute("DELETE FROM estado_previsao")
+                self.conn.commit()
+                previsao.prever(self.conn, workers=1)
+
+                estado = EstadoPrevisaoRepository.buscar_estados(self.conn)["237478"]
+                self.assertEqual((estado["data_historico"], estado["horizonte_fim"]), ("2025-03-01", "2025-03-08"))
+                self.assertEqual(self._decisao()["motivo"], "em_dia")
+
+                self._vender("2025-03-02", 4, 0.01)
+                decisao = self._decisao()
+                self.assertEqual((decisao["motivo"], decisao["dias_avaliados"]), ("erro", 4))
+                self.assertGreater(decisao["erro"], 0.9)
+
+    def test_vendas_ate_o_fim_do_horizonte_disparam_o_reajuste(self):
+        with mock.patch.dict(previsao.CONFIG, {"motor": "vetorizado", "reajuste_seletivo": True,
+                                               "dias_max_sem_ajuste": 30}):
+            previsao.prever(self.conn, workers=1)
+
+            self._vender("2025-03-02", 6, 1.0)
+            self.assertEqual(self._decisao()["motivo"], "em_dia")
+            self._vender("2025-03-08", 1, 1.0)
+            self.assertEqual(self._decisao()["motivo"], "horizonte")
+
+            previsao.prever(self.conn, workers=1)
+            estado = EstadoPrevisaoRepository.buscar_estados(self.conn)["237478"]
+            self.assertEqual((estado["data_historico"], estado["horizonte_fim"]), ("2025-03-08", "2025-03-15"))
+            self.assertEqual(self._decisao()["motivo"], "em_dia")
+
+
+class CacheModelosTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def test_skus_com_o_mesmo_nome_sanitizado_nao_se_sobrescrevem(self):
+        ModeloRepository.salvar_modelo("a/b", {"linhas": 1}, "{}", self.diretorio.name)
+        ModeloRepository.salvar_modelo("a_b", {"linhas": 2}, "{}", self.diretorio.name)
+
+        self.assertEqual(ModeloRepository.buscar_modelo("a/b", self.diretorio.name)["fingerprint"], {"linhas": 1})
+        self.assertEqual(ModeloRepository.buscar_modelo("a_b", self.diretorio.name)["fingerprint"], {"linhas": 2})
+        self.assertIsNone(ModeloRepository.buscar_modelo("a:b", self.diretorio.name))
+
+    def test_remover_excedentes_descarta_os_menos_usados(self):
+        for sku in ("1", "2", "3"):
+            ModeloRepository.salvar_modelo(sku, {}, "x" * 400_000, self.diretorio.name)
+            os.utime(os.path.join(self.diretorio.name, f"{sku}.json"), (int(sku), int(sku)))
+
+        ModeloRepository.remover_excedentes(self.diretorio.name, tamanho_max_mb=1)
+        self.assertIsNone(ModeloRepository.buscar_modelo("1", self.diretorio.name))
+        self.assertIsNotNone(ModeloRepository.buscar_modelo("3", self.diretorio.name))
+
+    def test_feriados_da_regiao_mudam_a_assinatura(self):
+        self.assertNotEqual(calendario.assinatura_feriados([2025]), calendario.assinatura_feriados([2025], "MA"))
+        self.assertEqual(calendario.assinatura_feriados([2025, 2025]), calendario.assinatura_feriados({2025}))
+
+
+class AjusteIncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        config = mock.patch.dict(previsao.CONFIG, {"cache_modelos": True, "ajuste_incremental": True,
+                                                   "modelos_dir": self.diretorio.name})
+        config.start()
+        self.addCleanup(config.stop)
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def _ajustar(self, df: pd.DataFrame):
+        """Roda treinar_e_prever e retorna o argumento inicial do ajuste (ou 'reaproveitado')."""
+        with mock.patch.object(previsao, "_ajustar_modelo", wraps=previsao._ajustar_modelo) as ajustar:
+            previsoes = previsao.treinar_e_prever(df, "237478")
+        self.assertEqual(set(previsoes["metodo"]), {"prophet"})
+        if not ajustar.called:
+            return "reaproveitado"
+        return ajustar.call_args.args[2]
+
+    def test_dias_novos_partem_dos_parametros_anteriores(self):
+        df = serie_ruidosa(100)
+        self.assertIsNone(self._ajustar(df.iloc[:90]))
+        self.assertEqual(self._ajustar(df.iloc[:90]), "reaproveitado")
+
+        inicial = self._ajustar(df)
+        self.assertIsNotNone(inicial)
+        self.assertEqual(set(inicial), {"k", "m", "sigma_obs", "delta", "beta"})
+
+    def test_historico_reescrito_ajusta_do_zero(self):
+        df = serie_ruidosa(100)
+        self.assertIsNone(self._ajustar(df.iloc[:90]))
+
+        df.loc[0, "total_venda_dia_kg"] += 1.0
+        self.assertIsNone(self._ajustar(df))
+
+
+class OrcamentoAjusteTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def _prever(self, **config) -> pd.DataFrame:
+        with mock.patch.dict(previsao.CONFIG, {**config, "cache_modelos": True, "modelos_dir": self.diretorio.name}), \
+                self.assertLogs(level="WARNING") as logs:
+            previsoes = previsao.treinar_e_prever(serie_ruidosa(200), "237478")
+        self.assertTrue(any("usando previsão de reserva" in linha for linha in logs.output), logs.output)
+        return previsoes
+
+    def test_ajuste_acima_do_tempo_usa_a_reserva_sem_salvar_o_modelo(self):
+        previsoes = self._prever(tempo_max_ajuste_s=0.01)
+        self.assertEqual(set(previsoes["metodo"]), {"sazonal_ingenuo"})
+        # Os 7 dias de validação e os 7 seguintes à última venda
+        self.assertEqual(list(previsoes["ds"]), list(pd.date_range("2025-07-13", periods=14, freq="D")))
+        self.assertIsNone(ModeloRepository.buscar_modelo("237478", self.diretorio.name))
+
+    def test_ajuste_no_teto_de_iteracoes_usa_a_reserva(self):
+        previsoes = self._prever(iteracoes_max_ajuste=3)
+        self.assertEqual(set(previsoes["metodo"]), {"sazonal_ingenuo"})
+        self.assertIsNone(ModeloRepository.buscar_modelo("237478", self.diretorio.name))
+
+    def test_reserva_repete_a_semana_e_completa_com_a_media(self):
+        padrao = [5.0, 8.0, 8.0, 9.0, 12.0, 20.0, 14.0]
+        df_prophet = pd.DataFrame({"ds": pd.date_range("2025-03-03", periods=28, freq="D"), "y": padrao * 4})
+        previsoes = previsao.previsao_reserva(df_prophet, 7)
+        self.assertEqual(list(previsoes["yhat"]), padrao)
+        self.assertEqual(set(previsoes["metodo"]), {"sazonal_ingenuo"})
+
+        # Só segunda a quarta no histórico: quinta a domingo usam a média do SKU
+        previsoes = previsao.previsao_reserva(df_prophet.iloc[:3], 7)
+        self.assertEqual(list(previsoes["yhat"]), [7.0] * 4 + [5.0, 8.0, 8.0])
+        self.assertEqual(list(previsoes["metodo"]), ["media"] * 4 + ["sazonal_ingenuo"] * 3)
+
+
+class PrevisaoRapidaTest(unittest.TestCase):
+    def test_mesma_previsao_do_predict_completo_so_nos_dias_futuros(self):
+        df_prophet = serie_ruidosa(90).rename(columns={"data_dia": "ds", "total_venda_dia_kg": "y"})
+        model = previsao._criar_modelo(calendario.feriados_dos_anos([2025]))
+        model.fit(df_prophet)
+
+        with mock.patch.dict(previsao.CONFIG, {"previsao_rapida": False}):
+            completa = previsao.prever_com_modelo(model, df_prophet, 7)
+        rapida = previsao.prever_com_modelo(model, df_prophet, 7)
+
+        self.assertEqual(list(rapida["ds"]), list(pd.date_range("2025-04-01", periods=7, freq="D")))
+        self.assertEqual(list(rapida["ds"]), list(completa["ds"]))
+        np.testing.assert_allclose(rapida["yhat"], completa["yhat"])
+        self.assertEqual(set(rapida["metodo"]), {"prophet"})
+
+        # Intervalo analítico: simétrico, com a largura do ruído ajustado
+        sigma = float(model.params["sigma_obs"][0][0]) * model.y_scale
+        largura = (rapida["yhat_upper"] - rapida["yhat_lower"]).to_numpy()
+        np.testing.assert_allclose(largura, 2 * 1.2815515655446004 * sigma)
+        np.testing.assert_allclose(rapida["yhat_upper"] - rapida["yhat"], rapida["yhat"] - rapida["yhat_lower"])
+
+
+class MotorVetorizadoTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.conn = criar_banco_temporario(self.diretorio.name)
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def test_cada_linha_da_matriz_e_prevista_como_se_estivesse_sozinha(self):
+        datas = pd.date_range("2025-01-01", periods=70, freq="D")
+        matriz = np.random.default_rng(1).gamma(5, 2, (3, 70))
+        matriz[1, 10:20] = np.nan
+        matriz[2, :40] = np.nan
+
+        _, juntas = previsao.previsao_vetorizada(matriz, datas, 7)
+        for i in range(3):
+            _, sozinha = previsao.previsao_vetorizada(matriz[i:i + 1], datas, 7)
+            np.testing.assert_allclose(juntas[i], sozinha[0])
+
+    def test_padrao_semanal_estavel_e_repetido(self):
+        padrao = np.array([5.0, 8.0, 8.0, 9.0, 12.0, 20.0, 14.0])
+        datas = pd.date_range("2025-03-03", periods=70, freq="D")  # segunda-feira; feriados viram dias sem dado
+        matriz = np.tile(padrao, 10)[None, :]
+
+        datas_futuras, yhat = previsao.previsao_vetorizada(matriz, datas, 7)
+        self.assertEqual(datas_futuras[0], pd.Timestamp("2025-05-12"))
+        np.testing.assert_allclose(yhat[0], padrao)
+
+    def test_prever_grava_os_skus_vetorizados_sem_prophet(self):
+        previsao.importar_vendas_df(self.conn, csv_de_vendas(60, skus=("237478", "237479")))
+
+        with mock.patch.dict(previsao.CONFIG, {"motor": "vetorizado", "reajuste_seletivo": False}), \
+                mock.patch.object(previsao, "treinar_e_prever") as treinar:
+            previsao.prever(self.conn, workers=1)
+
+        treinar.assert_not_called()
+        self.assertEqual(
+            self.conn.execute(
+                "SELECT produto_sku, metodo, MIN(data), MAX(data), COUNT(*) FROM previsao GROUP BY produto_sku"
+            ).fetchall(),
+            [("237478", "vetorizado", "2025-02-23", "2025-03-08", 14),
+             ("237479", "vetorizado", "2025-02-23", "2025-03-08", 14)],
+        )
+
+
+class ExecucoesPrevisaoTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.conn = criar_banco_temporario(self.diretorio.name)
+        previsao.importar_vendas_df(self.conn, csv_de_vendas(60, skus=("237478", "237479")))
+        config = mock.patch.dict(previsao.CONFIG, {"motor": "vetorizado", "reajuste_seletivo": False})
+        config.start()
+        self.addCleanup(config.stop)
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _execucoes_das_linhas(self, tabela: str) -> list:
+        return self.conn.execute(
+            f"SELECT execucao_id, COUNT(*) FROM {tabela} GROUP BY execucao_id ORDER BY execucao_id"
+        ).fetchall()
+
+    def test_cada_rodada_fica_registrada_e_marca_as_linhas_que_gravou(self):
+        primeira = previsao.prever(self.conn, workers=1)
+        segunda = previsao.prever(self.conn, workers=1)
+
+        execucoes = {e["id"]: e for e in ExecucaoRepository.listar_execucoes(self.conn)}
+        self.assertEqual(list(execucoes), [segunda, primeira])
+        for execucao in execucoes.values():
+            self.assertEqual(execucao["status"], "concluida")
+            self.assertEqual(execucao["motor"], "vetorizado")
+            self.assertEqual((execucao["skus_previstos"], execucao["skus_falha"]), (2, 0))
+            self.assertEqual(set(execucao["etapas"]), {"selecao", "vetorizado", "prophet", "gravacao"})
+        # A segunda rodada prevê os mesmos valores: nada muda, mas as linhas passam a ser dela
+        self.assertEqual(execucoes[primeira]["linhas_alteradas"], 28)
+        self.assertEqual(execucoes[segunda]["linhas_alteradas"], 0)
+        self.assertEqual(self._execucoes_das_linhas("previsao"), [(segunda, 28)])
+        self.assertEqual(self._execucoes_das_linhas("previsao_historico"), [(primeira, 28), (segunda, 28)])
+
+    def test_rodada_nao_altera_o_esquema(self):
+        # As tabelas de execução e estado vêm das migrações, não de cada rodada
+        for seletivo in (False, True):
+            with self.subTest(reajuste_seletivo=seletivo), \
+                    mock.patch.dict(previsao.CONFIG, {"reajuste_seletivo": seletivo}):
+                comandos = []
+                self.conn.set_trace_callback(comandos.append)
+                previsao.prever(self.conn, workers=1)
+                self.conn.set_trace_callback(None)
+                self.assertFalse(
+                    [c for c in comandos if c.lstrip().upper().startswith(("CREATE", "ALTER", "DROP"))], comandos
+                )
+
+    def test_leituras_usam_so_a_ultima_rodada_de_cada_sku(self):
+        primeira = previsao.prever(self.conn, workers=1)
+        VendaRepository.gravar_vendas_em_lote(
+            self.conn, [("2025-03-02", 70.0, "237478"), ("2025-03-03", 71.0, "237478")]
+        )
+        segunda = previsao.prever(self.conn, workers=1)
+
+        # 2025-02-23 e 2025-02-24 continuam na tabela com a primeira rodada, fora da visão
+        self.assertEqual(
+            self.conn.execute(
+                "SELECT data FROM previsao WHERE produto_sku = '237478' AND execucao_id = ?", (primeira,)
+            ).fetchall(),
+            [("2025-02-23",), ("2025-02-24",)],
+        )
+        previsoes = PrevisaoRepository.buscar_previsoes(self.conn, "237478")
+        self.assertEqual({p["execucao_id"] for p in previsoes}, {segunda})
+        self.assertEqual(sorted(p["data"] for p in previsoes),
+                         [d.strftime("%Y-%m-%d") for d in pd.date_range("2025-02-25", "2025-03-10")])
+        self.assertEqual(
+            PrevisaoRepository.obter_previsao_e_desvio(self.conn, "237478", pd.Timestamp("2025-02-23")), (None, None)
+        )
+        self.assertIsNotNone(
+            PrevisaoRepository.obter_previsao_e_desvio(self.conn, "237478", pd.Timestamp("2025-03-10"))[0]
+        )
+
+
+class WorkerPerdidoTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.conn = criar_banco_temporario(self.diretorio.name)
+        previsao.importar_vendas_df(self.conn, csv_de_vendas(60, skus=("237478", "237479")))
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def test_skus_do_worker_morto_contam_como_falha(self):
+        # Limite de memória que derruba os workers já no initializer: o pool quebra
+        with mock.patch.dict(previsao.CONFIG, {"memoria_max_mb_worker": 1, "motor": "prophet",
+                                               "reajuste_seletivo": False, "cache_modelos": False}):
+            execucao_id = previsao.prever(self.conn, workers=2)
+
+        execucao = ExecucaoRepository.buscar_execucao(self.conn, execucao_id)
+        self.assertEqual(execucao["status"], "degradada")
+        self.assertEqual(execucao["skus_falha"], 2)
+        self.assertEqual(execucao["parametros"]["workers"], 2)
+        self.assertEqual(
+            self.conn.execute("SELECT DISTINCT metodo FROM previsao").fetchall(),
+            [(previsao.METODO_RESERVA_WORKER,)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import src.fila as Fila
+from src.database import criar_banco_e_tabelas
+from src.repositories import TarefaRepository
+
+
+class RecuperacaoFilaTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.caminho = os.path.join(self.diretorio.name, "data.db")
+        criar_banco_e_tabelas(sqlite3.connect(self.caminho))
+        self.conn = Fila.conectar(self.caminho)
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _vencer_lease(self, tarefa_id):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE tarefa_previsao SET lease_ate = ? WHERE id = ?",
+                ((datetime.now() - timedelta(seconds=1)).isoformat(), tarefa_id),
+            )
+
+    def test_tarefa_com_lease_valido_nao_volta_para_a_fila(self):
+        tarefa_id, criada = Fila.enfileirar_previsao(self.conn)
+        self.assertTrue(criada)
+        tarefa = TarefaRepository.reservar_proxima(self.conn, "host:1", 60)
+        self.assertEqual(tarefa["id"], tarefa_id)
+        self.assertEqual(tarefa["dono"], "host:1")
+
+        # Outro processo iniciando não rouba a tarefa em execução
+        self.assertEqual(TarefaRepository.reenfileirar_interrompidas(self.conn), 0)
+        self.assertIsNone(TarefaRepository.reservar_proxima(self.conn, "host:2", 60))
+        self.assertEqual(TarefaRepository.buscar_tarefa(self.conn, tarefa_id)["status"], "executando")
+
+    def test_tarefa_com_lease_vencido_volta_para_a_fila(self):
+        tarefa_id, _ = Fila.enfileirar_previsao(self.conn)
+        TarefaRepository.reservar_proxima(self.conn, "host:1", 60)
+        self._vencer_lease(tarefa_id)
+
+        tarefa = TarefaRepository.reservar_proxima(self.conn, "host:2", 60)
+        self.assertEqual(tarefa["id"], tarefa_id)
+        self.assertEqual(tarefa["dono"], "host:2")
+
+        # O dono antigo perde o lease e não sobrescreve o status
+        self.assertFalse(TarefaRepository.renovar_lease(self.conn, tarefa_id, "host:1", 60))
+        TarefaRepository.finalizar(self.conn, tarefa_id, "falhou", "interrompida", dono="host:1")
+        self.assertEqual(TarefaRepository.buscar_tarefa(self.conn, tarefa_id)["status"], "executando")
+
+        self.assertTrue(TarefaRepository.renovar_lease(self.conn, tarefa_id, "host:2", 60))
+        TarefaRepository.finalizar(self.conn, tarefa_id, "concluida", dono="host:2")
+        self.assertEqual(TarefaRepository.buscar_tarefa(self.conn, tarefa_id)["status"], "concluida")
+
+    def test_cancelamento_pendente_de_tarefa_abandonada(self):
+        tarefa_id, _ = Fila.enfileirar_previsao(self.conn)
+        TarefaRepository.reservar_proxima(self.conn, "host:1", 60)
+        self.assertEqual(TarefaRepository.solicitar_cancelamento(self.conn, tarefa_id), "executando")
+        self._vencer_lease(tarefa_id)
+
+        self.assertEqual(TarefaRepository.reenfileirar_interrompidas(self.conn), 0)
+        self.assertEqual(TarefaRepository.buscar_tarefa(self.conn, tarefa_id)["status"], "cancelada")
+
+    def test_tarefas_sem_lease_de_versoes_anteriores_voltam_para_a_fila(self):
+        tarefa_id, _ = Fila.enfileirar_previsao(self.conn)
+        with self.conn:
+            self.conn.execute("UPDATE tarefa_previsao SET status = 'executando' WHERE id = ?", (tarefa_id,))
+
+        self.assertEqual(TarefaRepository.reenfileirar_interrompidas(self.conn), 1)
+        self.assertEqual(TarefaRepository.buscar_tarefa(self.conn, tarefa_id)["status"], "pendente")
+
+    def test_erro_inesperado_numa_tarefa_nao_derruba_a_thread(self):
+        primeira, _ = TarefaRepository.enfileirar(self.conn, "a")
+        segunda, _ = TarefaRepository.enfileirar(self.conn, "b")
+
+        class Parar(BaseException):
+            """Encerra o laço na segunda tarefa (não é pega pelo except Exception)."""
+
+        def consumir():
+            try:
+                Fila._loop(self.caminho)
+            except Parar:
+                pass
+
+        with mock.patch.object(Fila, "executar_tarefa",
+                               side_effect=[sqlite3.OperationalError("disk I/O error"), Parar]) as executar, \
+                self.assertLogs(level="ERROR"):
+            thread = threading.Thread(target=consumir, daemon=True)
+            thread.start()
+            thread.join(10)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([chamada.args[2] for chamada in executar.call_args_list], [primeira, segunda])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import main
+import src.conexoes as Conexoes
+import src.fila as Fila
+from src import manager
+from src.database import criar_banco_e_tabelas
+
+CABECALHO = "data_dia,id_produto,descricao_produto,total_venda_dia_kg\n"
+
+
+class UploadHistoricoVendasTest(unittest.TestCase):
+    """Upload em lotes de 2 linhas pela rota, num banco temporário."""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.caminho = os.path.join(self.diretorio.name, "data.db")
+        criar_banco_e_tabelas(sqlite3.connect(self.caminho))
+        for alvo in (
+            mock.patch.object(main, "DATABASE", self.caminho),
+            mock.patch.object(Fila, "iniciar_worker"),
+            mock.patch.object(manager, "linhas_por_lote_upload", 2),
+        ):
+            alvo.start()
+            self.addCleanup(alvo.stop)
+        self.cliente = main.app.test_client()
+
+    def tearDown(self):
+        Conexoes.fechar_todas()
+        self.diretorio.cleanup()
+
+    def _enviar(self, linhas, stream: bool = True):
+        conteudo = (CABECALHO + "".join(linhas)).encode("latin1")
+        return self.cliente.post(
+            "/api/vendas/historico/upload" + ("?stream=true" if stream else ""),
+            data={"file": (io.BytesIO(conteudo), "vendas.csv")},
+            content_type="multipart/form-data",
+        )
+
+    def _vendas(self):
+        conn = sqlite3.connect(self.caminho)
+        try:
+            return conn.execute("SELECT data, produto_sku, quantidade FROM venda ORDER BY data").fetchall()
+        finally:
+            conn.close()
+
+    def test_stream_devolve_o_progresso_de_cada_lote(self):
+        resposta = self._enviar([
+            "01/01/2025,237478,FRANGO,10.5\n",
+            "02/01/2025,237478,FRANGO,11\n",
+            "03/01/2025,237478,FRANGO,12\n",
+            "04/01/2025,999999,INEXISTENTE,13\n",
+            "05/01/2025,237478,FRANGO,14\n",
+        ])
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.mimetype, "application/x-ndjson")
+        progresso = [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+        self.assertEqual([p["lote"] for p in progresso], [1, 2, 3])
+        self.assertEqual([p["linhas_lidas"] for p in progresso], [2, 4, 5])
+        self.assertEqual((progresso[-1]["vendas_gravadas"], progresso[-1]["vendas_rejeitadas"]), (4, 1))
+        self.assertEqual(len(self._vendas()), 4)
+        self.assertEqual(self._vendas()[0], ("2025-01-01", "237478", 10.5))
+
+    def test_sem_stream_devolve_so_o_progresso_final(self):
+        resposta = self._enviar(["01/01/2025,237478,FRANGO,10\n"] * 3, stream=False)
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.get_json()["lote"], 2)
+        self.assertEqual(resposta.get_json()["vendas_gravadas"], 3)
+        self.assertEqual(self._vendas(), [("2025-01-01", "237478", 10.0)])
+
+    def test_coluna_faltando_vira_400_sem_gravar(self):
+        conteudo = b"data_dia,id_produto\n01/01/2025,237478\n"
+        resposta = self.cliente.post(
+            "/api/vendas/historico/upload?stream=true",
+            data={"file": (io.BytesIO(conteudo), "vendas.csv")},
+            content_type="multipart/form-data",
+        )
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn("total_venda_dia_kg", resposta.get_json()["error"])
+        self.assertEqual(self._vendas(), [])
+
+    def test_erro_no_meio_do_stream_e_registrado_no_log(self):
+        with self.assertLogs(level="ERROR") as logs:
+            resposta = self._enviar([
+                "01/01/2025,237478,FRANGO,10\n",
+                "02/01/2025,237478,FRANGO,11\n",
+                "31/02/2025,237478,FRANGO,12\n",
+            ])
+            linhas = [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(linhas[0]["vendas_gravadas"], 2)
+        self.assertEqual(linhas[-1]["error"], "Falha ao importar dados históricos de vendas")
+        self.assertTrue(any("Traceback" in linha for linha in logs.output), logs.output)
+        # O lote que já tinha sido confirmado continua gravado
+        self.assertEqual(len(self._vendas()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()